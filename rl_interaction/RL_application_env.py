@@ -9,19 +9,33 @@ import subprocess
 from loguru import logger
 import xml.etree.ElementTree as ET
 from gym import spaces
-from hashlib import md5
 from selenium.common.exceptions import InvalidElementStateException, WebDriverException, \
-    StaleElementReferenceException, InvalidSessionIdException, NoSuchElementException, ElementNotVisibleException
+    StaleElementReferenceException, InvalidSessionIdException, NoSuchElementException, ElementNotVisibleException, \
+    InvalidSelectorException
 from appium.webdriver.common.touch_action import TouchAction
 from us_coverage.coverage_processor import CoverageProcessor
 from us_logs.logReader import LogReader
+from us_logs.binaryLogcat import BinaryLogReader
+from us_logs.logIngestion import LogIngestionService, FaultDetector, CoverageAccumulator, RawArchive, FaultContext
+from us_logs.faultIndex import FaultIndex, FaultReport, faultHeader, faultSignature
 from utils.utils import Utils
+from utils.widgets import extract_widgets
+from utils.observation import ObservationEncoder
+from utils.session_recorder import SessionRecorder
+from utils.profiling import StepProfiler, trace_commands
+from utils.settle import AdaptiveSettle
+from utils.app_reset import AppReset
+from utils.adb import adb_client
+from utils.screen_cache import ScreenCache, ScreenState, canonical_hash
 from multiprocessing import Process, Queue
 from appium import webdriver
 from collections import deque
 import functools
+import contextlib
 
 adb_path: str = Utils.get_adb_executable_path()
+# stands in for the phase timers when profiling is off
+NO_PROFILING = contextlib.nullcontext()
 
 
 def search_package_and_setprop(folder):
@@ -31,33 +45,43 @@ def search_package_and_setprop(folder):
         capture_output=True)
     folder = result.stdout.decode('utf-8').strip('\n')
     '''
-    command = f'{adb_path} shell "su 0 setprop jacoco.destfile /data/data/{folder}/jacoco.exec"'
-    os.popen(command).read()
+    adb_client().check_shell(f'su 0 setprop jacoco.destfile /data/data/{folder}/jacoco.exec')
+
+
+def pull_coverage(udid, remote, coverage_dir, coverage_count):
+    try:
+        adb_client(udid).pull(remote, f'{os.path.join(".", coverage_dir, str(coverage_count))}.ec')
+    except Exception as e:
+        logger.error(f'coverage not collected: {e}')
 
 
 def collect_coverage_emma(udid, package, coverage_dir, coverage_count):
-    os.system(f'{adb_path} -s {udid} shell am broadcast -p {package} -a edu.gatech.m3.emma.COLLECT_COVERAGE')
-    os.system(
-        f'{adb_path} -s {udid} pull /mnt/sdcard/coverage.ec {os.path.join(".", coverage_dir, str(coverage_count))}.ec')
+    adb_client(udid).check_shell(f'am broadcast -p {package} -a edu.gatech.m3.emma.COLLECT_COVERAGE')
+    pull_coverage(udid, '/mnt/sdcard/coverage.ec', coverage_dir, coverage_count)
 
 
 def collect_coverage_jacoco(udid, package, coverage_dir, coverage_count):
-    os.system(f'{adb_path} -s {udid} shell am broadcast -p {package} -a intent.END_COVERAGE')
-    os.system(f'{adb_path} -s {udid} pull /sdcard/Android/data/{package}/files/coverage.ec '
-              f'{os.path.join(".", coverage_dir, str(coverage_count))}.ec')
+    adb_client(udid).check_shell(f'am broadcast -p {package} -a intent.END_COVERAGE')
+    pull_coverage(udid, f'/sdcard/Android/data/{package}/files/coverage.ec', coverage_dir, coverage_count)
 
 
 # ! This is important
-def collect_coverage_InstruAPK(logReaderObject, coverageProcessorObject, time_start, algorithm, udid, package,
+def collect_coverage_InstruAPK(logIngestion, faultDetector, coverageAccumulator, time_start, algorithm, udid, package,
                                coverage_dir: Path, coverage_count):
-    logReaderObject.readLog()
-    newFaults = logReaderObject.getNewFaults()
-    uniqueFaultsEpisode, uniqueFaultsTotal = logReaderObject.getUniqueFaults()
-    numberOfInstrumentedMethods, numberofCalledMethods, coveragePercentage, cumulativeCoveragePercentage, numberOfCumulativeMethodsCalled, numberOfUncalledMethods, numberOfCumulativeMethodsUncalled = coverageProcessorObject.generate_adb_logcat()
-    calledMethods = coverageProcessorObject.get_methods_id_called()
-    cumulativeCalledMethods = coverageProcessorObject.get_cumulative_methods_id_called()
-    cumulativeUncalledMethods = coverageProcessorObject.get_cumulative_methods_id_uncalled()
-    uncalledMethods = coverageProcessorObject.get_methods_id_uncalled()
+    # faults and coverage come from the lines already read by the ingestion service
+    if not logIngestion.sync():
+        logger.warning(f"log consumers still behind: {logIngestion.stats()}")
+    newFaults = faultDetector.getNewFaults()
+    uniqueFaultsEpisode, uniqueFaultsTotal = faultDetector.getUniqueFaults()
+    coverageProcessorObject = coverageAccumulator.coverageProcessor
+    with coverageAccumulator.lock:
+        numberOfInstrumentedMethods, numberofCalledMethods, coveragePercentage, cumulativeCoveragePercentage, numberOfCumulativeMethodsCalled, numberOfUncalledMethods, numberOfCumulativeMethodsUncalled = coverageProcessorObject.coverage_summary()
+        calledMethods = coverageProcessorObject.get_methods_id_called()
+        cumulativeCalledMethods = coverageProcessorObject.get_cumulative_methods_id_called()
+        cumulativeUncalledMethods = coverageProcessorObject.get_cumulative_methods_id_uncalled()
+        uncalledMethods = coverageProcessorObject.get_methods_id_uncalled()
+        packageCoverage = coverageProcessorObject.get_package_coverage()
+        cumulativePackageCoverage = coverageProcessorObject.get_package_coverage(cumulative=True)
     jsonserializablefaults = [fault.toJSONSerializableObject() for fault in newFaults]
     jsonSerializableUniqueFaultsEpisode = [fault.toJSONSerializableObject() for fault in uniqueFaultsEpisode]
     jsonSerializableUniqueFaultsTotal = [fault.toJSONSerializableObject() for fault in uniqueFaultsTotal]
@@ -85,6 +109,8 @@ def collect_coverage_InstruAPK(logReaderObject, coverageProcessorObject, time_st
         "cumulativeCalledMethods": cumulativeCalledMethods,
         "uncalledMethods": uncalledMethods,
         "cumulativeUncalledMethods": cumulativeUncalledMethods,
+        "packageCoverage": packageCoverage,
+        "cumulativePackageCoverage": cumulativePackageCoverage,
         "newFaults": jsonserializablefaults,
         "uniqueFaultsEpisode": jsonSerializableUniqueFaultsEpisode,
         "uniqueFaultsTotal": jsonSerializableUniqueFaultsTotal
@@ -96,20 +122,8 @@ def collect_coverage_InstruAPK(logReaderObject, coverageProcessorObject, time_st
     return
 
 
-# ! This is important
-def bug_handler_InstruAPK(logReaderObject, bug_queue, udid):
-    while True:
-        logReaderObject.readLog()
-        newFaults = logReaderObject.getNewFaults()
-        if newFaults:
-            logger.debug('New faults identified, adding to bug queue')
-            for fault in newFaults:
-                # print(fault)
-                bug_queue.put(str(fault))
-
-
 def bug_handler(bug_queue, udid):
-    os.system(f'{adb_path} -s {udid} logcat -c')
+    adb_client(udid).check_shell('logcat -c')
     proc = subprocess.Popen([adb_path, '-s', udid, 'logcat'], stdout=subprocess.PIPE)
     while True:
         dump_bug = ''
@@ -126,7 +140,8 @@ def bug_handler(bug_queue, udid):
             while temp.find('E AndroidRuntime:') > 0:
                 dump_bug += temp[temp.find('E AndroidRuntime:'):]
                 temp = proc.stdout.readline().decode('utf-8')
-            bug_queue.put(dump_bug)
+            lines = dump_bug.splitlines()
+            bug_queue.put(FaultReport(faultSignature(lines), faultHeader(lines), dump_bug))
 
 
 class RLApplicationEnv(Env):
@@ -138,7 +153,9 @@ class RLApplicationEnv(Env):
                  device_name, exported_activities, services, receivers,
                  is_headless, appium, emulator, package, pool_strings, visited_activities: list, clicked_buttons: list,
                  number_bugs: list, appium_port, max_episode_len=250, string_activities='',
-                 instr=False, OBSERVATION_SPACE=2000, ACTION_SPACE=30):
+                 instr=False, OBSERVATION_SPACE=2000, ACTION_SPACE=30, observation_overflow='hash',
+                 log_streaming=False, log_format='text', record_session=False, profile_steps=True, settle='fixed',
+                 screen_cache=256, reset_strategy='reinstall', fault_index=None, stable_widget_slots=False):
 
         self.OBSERVATION_SPACE = OBSERVATION_SPACE
         self.ACTION_SPACE = ACTION_SPACE
@@ -146,11 +163,15 @@ class RLApplicationEnv(Env):
         self.emulator = emulator
         self.appium = appium
         self.exported_activities = deque(exported_activities)
+        # How the app is brought back to its initial state at every episode
+        self.app_reset = AppReset(reset_strategy, udid, package, exported_activities)
         self.coverage_dir = coverage_dir
         self.log_dir = log_dir
         self.app_path = app_path
         self.appium_port = appium_port
         self.timer_start = timer_start
+        self.bug_queue = Queue()
+        self.logReaderObject = self.logIngestion = None
         if instr_emma:
             self.instr = True
             self.instr_funct = collect_coverage_emma
@@ -160,10 +181,23 @@ class RLApplicationEnv(Env):
         elif instr_instruapk:
             # ! This is important
             self.instr = True
-            self.logReaderObject = LogReader(package, udid)
+            if log_format == 'binary':
+                self.logReaderObject = BinaryLogReader(package, udid)
+            else:
+                self.logReaderObject = LogReader(package, udid, streaming=log_streaming)
             self.coverageProcessorObject = CoverageProcessor(udid, package, method_locations)
-            self.instr_funct = functools.partial(collect_coverage_InstruAPK, self.logReaderObject,
-                                                 self.coverageProcessorObject, self.timer_start, algo)
+            # the logcat is read once per device, faults, coverage and the raw log are fed from the same lines
+            self.faultDetector = FaultDetector(self.bug_queue)
+            self.coverageAccumulator = CoverageAccumulator(self.coverageProcessorObject)
+            if log_format == 'binary':
+                archive = RawArchive(os.path.join(log_dir, 'logcat.bin'), binary=True)
+            else:
+                archive = RawArchive(os.path.join(log_dir, 'logcat.txt'))
+            self.logIngestion = LogIngestionService(self.logReaderObject, [
+                self.faultDetector, self.coverageAccumulator, archive,
+                FaultContext(os.path.join(log_dir, 'fault_context'))])
+            self.instr_funct = functools.partial(collect_coverage_InstruAPK, self.logIngestion, self.faultDetector,
+                                                 self.coverageAccumulator, self.timer_start, algo)
         self.rotation = rotation
         self.internet = internet
         self.merdoso_button_menu = merdoso_button_menu
@@ -180,12 +214,15 @@ class RLApplicationEnv(Env):
         self.visited_activities = visited_activities
         self.clicked_buttons = clicked_buttons
         self.number_bugs = number_bugs
+        # signatures of the faults of the run
         self.bug_set = bug_set
+        # faults of every run sharing the index, keyed by signature
+        self.fault_index = FaultIndex(fault_index) if fault_index else None
         self.connection = False
-        self.bug_queue = Queue()
         self.strings = []
         self.coverage_count = -1
-        self.observation = numpy.array([0] * self.OBSERVATION_SPACE)
+        self.observation = numpy.zeros(self.OBSERVATION_SPACE, dtype=numpy.int32)
+        self.observation_indices = numpy.empty(0, dtype=numpy.int64)
         self._max_episode_steps = max_episode_len
         self.timesteps = 0
         self.bug = False
@@ -194,9 +231,17 @@ class RLApplicationEnv(Env):
         self.coverage_dict = coverage_dict
         self.widget_list = widget_list
         self.views = {}
+        # Parsed screens, revisiting one skips parsing and widget extraction
+        self.screen_cache = ScreenCache(screen_cache)
+        self.screen = None
 
         self.logger_id = logger.add(os.path.join(self.log_dir, 'action_logger.log'), format="{time} {level} {message}",
                                     level='DEBUG')
+        # 'adaptive' waits for the UI to settle after each action instead of sleeping a fixed time
+        self.settle = AdaptiveSettle() if settle == 'adaptive' else None
+        self.settled_page = None
+        # Phase timings and Appium commands, summarized per episode
+        self.profiler = StepProfiler(os.path.join(self.log_dir, 'step_profile.jsonl')) if profile_steps else None
 
         self.bug_logger_id = logger.add(os.path.join(self.log_dir, 'bug_logger.log'), format="{time} {level} {message}",
                                         filter=lambda record: record["level"].name == "CRITICAL")
@@ -204,6 +249,8 @@ class RLApplicationEnv(Env):
         logger.debug(self.app_path + ' START')
 
         self.list_activities = list_activities
+        self.encoder = ObservationEncoder(self.list_activities, self.widget_list, self.OBSERVATION_SPACE,
+                                          overflow=observation_overflow, stable_slots=stable_widget_slots)
         self.udid = udid
 
         if float(platform_version) >= 5.0:
@@ -228,7 +275,7 @@ class RLApplicationEnv(Env):
                              'newCommandTimeout': 200}
 
         # search_package_and_setprop(self.jacoco_package)
-        self.driver = webdriver.Remote(f'http://127.0.0.1:{self.appium_port}/wd/hub', self.desired_caps)
+        self.driver = self.new_driver()
         # First initialization
         self.package = self.driver.current_package
         self.current_activity = self.rename_activity(self.driver.current_activity)
@@ -253,9 +300,52 @@ class RLApplicationEnv(Env):
         self.observation_space = spaces.Box(low=0, high=1, shape=(self.OBSERVATION_SPACE,), dtype=numpy.int32)
         self.dims = self.driver.get_window_size()
         # self.check_activity()
+        # Transitions saved for SimulatedApplicationEnv
+        self.recorder = None
+        self.step_flags = (False, False)
+        if record_session:
+            self.recorder = SessionRecorder(os.path.join(self.log_dir, 'session.jsonl'))
+            self.recorder.record_session(package=self.package, activities=self.list_activities,
+                                         observation_space=self.OBSERVATION_SPACE, action_space=self.ACTION_SPACE,
+                                         shift=self.shift, intent_action=self.intent_action if self.intent_flag
+                                         else -1, intents=len(self.intents), strings=len(self.strings),
+                                         max_episode_len=self._max_episode_steps)
+
+    def new_driver(self):
+        driver = webdriver.Remote(f'http://127.0.0.1:{self.appium_port}/wd/hub', self.desired_caps)
+        if self.profiler is not None:
+            trace_commands(driver, self.profiler)
+        return driver
+
+    def phase(self, name):
+        return self.profiler.phase(name) if self.profiler is not None else NO_PROFILING
 
     @logger.catch()
     def step(self, action_number):
+        if self.profiler is None:
+            return self.recorded_step(action_number)
+        self.profiler.start_step()
+        try:
+            return self.recorded_step(action_number)
+        finally:
+            self.profiler.end_step()
+
+    def recorded_step(self, action_number):
+        if self.recorder is None:
+            return self.take_action(action_number)
+        state = self.record_state()
+        action = numpy.array(action_number).astype(int).tolist()
+        self.step_flags = (False, False)
+        observation, reward, done, info = self.take_action(action_number)
+        bug, outside = self.step_flags
+        self.recorder.record_transition(state, action, self.record_state(), self.current_activity,
+                                        float(reward[0]), bool(done) and self.timesteps < self._max_episode_steps,
+                                        bug, outside)
+        return observation, reward, done, info
+
+    def take_action(self, action_number):
+        # a page settled during a previous step that returned early is outdated
+        self.settled_page = None
         try:
             action_number = action_number.astype(int)
             if action_number[0] >= self.get_action_space()[0]:
@@ -285,7 +375,7 @@ class RLApplicationEnv(Env):
         elif self.rotation and (action_number[0] == self.do_rotation):
             logger.debug('set orientation, original was ' + self.driver.orientation)
             self.orientation()
-            time.sleep(0.2)
+            self.wait_for_ui(0.2)
             try:
                 self.dims = self.driver.get_window_size()
             except:
@@ -299,8 +389,9 @@ class RLApplicationEnv(Env):
         else:
             action_number[0] = action_number[0] - self.shift
             if len(self.views) == 0:
-                self.perform_touch_action(action_number)
-                time.sleep(0.05)
+                with self.phase('action'):
+                    self.perform_touch_action(action_number)
+                self.wait_for_ui(0.05)
             else:
                 current_view = self.views[action_number[0]]
 
@@ -311,9 +402,12 @@ class RLApplicationEnv(Env):
                 logger.debug(f'action: {identifier} Activity: {self.current_activity}')
 
                 # Do Action
-                self.action(current_view, action_number)
-                time.sleep(0.2)
-        self.bug, self.outside = self.check_activity()
+                with self.phase('action'):
+                    self.action(current_view, action_number)
+                self.wait_for_ui(0.2)
+        with self.phase('check_activity'):
+            self.bug, self.outside = self.check_activity()
+        self.step_flags = (self.bug, self.outside)
         if self.outside:
             self.outside = False
             # We need to reset the application
@@ -327,20 +421,32 @@ class RLApplicationEnv(Env):
                 self.driver.back()
                 self.update_views()
                 return self.observation, numpy.array([-100.0]), numpy.array(False), {}
-        self.get_observation()
-        reward = self.compute_reward()
+        with self.phase('observation'):
+            self.get_observation()
+        with self.phase('reward'):
+            reward = self.compute_reward()
         # self.append_visited_activities_coverage()
         done = self.termination()
         return self.observation, numpy.array([reward]), numpy.array(done), {}
 
+    def wait_for_ui(self, fixed_wait):
+        with self.phase('settle'):
+            if self.settle is None:
+                time.sleep(fixed_wait)
+            else:
+                # the settled page is reused by the next get_all_views instead of being fetched again, the pages are
+                # compared as the screen cache sees them: a clock or a progress value does not keep the wait going
+                self.settled_page, _, _ = self.settle.wait(lambda: self.driver.page_source, key=canonical_hash)
+
     def action(self, current_view, action_number):
         # If element is android.widget.EditText
         if current_view['class_name'] == 'android.widget.EditText':
             try:
-                current_view['view'].clear()
-                current_view['view'].click()
+                view = self.resolve_view(current_view)
+                view.clear()
+                view.click()
                 current_string = self.strings[action_number[1]]
-                current_view['view'].send_keys(current_string)
+                view.send_keys(current_string)
                 logger.debug('put string: ' + current_string)
             except InvalidElementStateException:
                 logger.debug('Impossible to insert string')
@@ -349,26 +455,26 @@ class RLApplicationEnv(Env):
         else:
             # If element is CLICKABLE
             if current_view['clickable'] == 'true' and current_view['long-clickable'] == 'false':
-                current_view['view'].click()
+                self.resolve_view(current_view).click()
 
             # If element is both CLICKABLE and LONG-CLICKABLE
             elif current_view['clickable'] == 'true' and current_view['long-clickable'] == 'true':
                 if action_number[2] == 0:
-                    current_view['view'].click()
+                    self.resolve_view(current_view).click()
                 else:
                     actions = TouchAction(self.driver)
-                    actions.long_press(current_view['view'], duration=1000).release().perform()
+                    actions.long_press(self.resolve_view(current_view), duration=1000).release().perform()
 
             # If element is LONG-CLICKABLE
             elif current_view['clickable'] == 'false' and current_view['long-clickable'] == 'true':
                 actions = TouchAction(self.driver)
-                actions.long_press(current_view['view'], duration=1000).release().perform()
+                actions.long_press(self.resolve_view(current_view), duration=1000).release().perform()
 
             # If element is SCROLLABLE
             elif current_view['scrollable'] == 'true':
-                bounds = re.findall(r'\d+', current_view['view'].get_attribute('bounds'))
-                bounds = [int(i) for i in bounds]
-                if (bounds[2] - bounds[0] > 20) and (bounds[3] - bounds[1] > 40):
+                # Bounds come from the snapshot, no need to touch the device
+                bounds = current_view['bounds']
+                if (len(bounds) == 4) and (bounds[2] - bounds[0] > 20) and (bounds[3] - bounds[1] > 40):
                     self.scroll_action(action_number, bounds)
                 else:
                     pass
@@ -389,6 +495,11 @@ class RLApplicationEnv(Env):
 
     def reset(self):
         logger.debug('<--- EPISODE RESET --->')
+        self.log_profile()
+        with self.phase('reset'):
+            return self.reset_application()
+
+    def reset_application(self):
 
         if self.coverage_count > 0:
             self.instr_funct(udid=self.udid, package=self.package, coverage_dir=self.coverage_dir,
@@ -396,11 +507,12 @@ class RLApplicationEnv(Env):
         if self.coverage_count == 0:
             # Clears the data because first episode is just random interactions
             self.coverageProcessorObject.clear_cumulative_methods()
-            self.logReaderObject.clear_unique_faults()
+            self.faultDetector.clear_unique_faults()
 
         self.coverage_count += 1
 
         self._md5 = ''
+        self.settled_page = None
         self.timesteps = 0
         '''
         if len(self.exported_activities) > 1:
@@ -429,50 +541,78 @@ class RLApplicationEnv(Env):
         else:
         '''
         try:
-            self.driver.reset()
+            with self.phase('app_reset'):
+                self.app_reset(self.driver)
         except Exception as e:
             logger.critical(e)
             self.manager(e)
-        self.coverageProcessorObject.reset()
+        if self.logIngestion is not None:
+            # the lines of the last episode are counted before its coverage is reset
+            self.logIngestion.clearLog()
+            if not self.logIngestion.sync():
+                logger.warning(f"log consumers still behind: {self.logIngestion.stats()}")
+            with self.coverageAccumulator.lock:
+                self.coverageProcessorObject.reset()
         self.current_activity = self.rename_activity(self.driver.current_activity)
         self.old_activity = self.current_activity
         self.set_activities_episode = {self.current_activity}
         self.bug, self.outside = self.check_activity()
         self.get_observation()
+        if self.recorder is not None:
+            self.recorder.record_reset(self.record_state())
         return self.observation
 
+    def record_state(self):
+        # A screen is identified by its activity and the hash of its page source
+        state = f'{self.current_activity}:{self._md5}'
+        self.recorder.record_state(state, self.current_activity, list(self.views.values()))
+        return state
+
+    def log_profile(self):
+        cache = self.screen_cache
+        logger.debug(f'screen cache: {cache.hits} hits, {cache.misses} misses, hit rate {cache.hit_rate:.3f}, '
+                     f'{cache.evictions} evictions, {len(cache)} screens')
+        if self.logIngestion is not None:
+            for stats in self.logIngestion.stats():
+                logger.debug(f"log consumer {stats['consumer']}: {stats['records']} records, lag {stats['lag']}, "
+                             f"{stats['recordsPerSecond']} records/s")
+        summary = self.profiler.end_episode(self.coverage_count) if self.profiler is not None else None
+        if summary is not None and 'step' in summary['phases']:
+            logger.debug(f"episode {summary['episode']}: {summary['steps']} steps, "
+                         f"step p50 {summary['phases']['step']['p50']} ms, "
+                         f"p95 {summary['phases']['step']['p95']} ms, "
+                         f"{summary['commands_per_step']} Appium commands per step")
+        if self.settle is not None:
+            logger.debug(f'settle deadline {self.settle.deadline:.3f} s, {self.settle.timeouts} timeouts, '
+                         f'{self.settle.polls} polls')
+
     def get_observation(self):
-        observation_0 = self.one_hot_encoding_activities()
-        observation_1 = self.one_hot_encoding_widgets()
-        self.observation = numpy.array(observation_0 + observation_1)
-
-    def one_hot_encoding_activities(self):
-        activity_observation = [0] * len(self.list_activities)
-        if self.current_activity in self.list_activities:
-            index = self.list_activities.index(self.current_activity)
-            activity_observation[index] = 1
-        return activity_observation
-
-    def one_hot_encoding_widgets(self):
-        widget_observation = [0] * (self.OBSERVATION_SPACE - len(self.list_activities))
-        for k, item in self.views.items():
-            identifier = item['identifier']
-            if identifier in self.widget_list:
-                index = self.widget_list.index(identifier)
-                widget_observation[index] = 1
-        return widget_observation
+        # Q-learning keeps the previous observation around, so the shared buffer is not handed out
+        if self.screen is not None and self.screen.activity == self.current_activity:
+            self.observation = self.encoder.encode_indices(self.screen.indices).copy()
+        else:
+            identifiers = [item['identifier'] for item in self.views.values()]
+            self.observation = self.encoder.encode(self.current_activity, identifiers).copy()
+        self.observation_indices = self.encoder.active
 
     def check_activity(self):
 
-        temp_activity = self.rename_activity(self.driver.current_activity)
+        with self.phase('current_activity'):
+            temp_activity = self.rename_activity(self.driver.current_activity)
 
         # At first I need to check whether it is a bug
-        if not self.bug_queue.empty():
+        with self.phase('bug_queue'):
+            bug_found = not self.bug_queue.empty()
+        if bug_found:
             # If the bug is new we add it
             new_bug = self.bug_queue.get()
-            self.bug_set.add(new_bug)
+            self.bug_set.add(new_bug.signature)
             logger.error('A bug occurred, relaunching application')
-            logger.critical(new_bug)
+            logger.critical(new_bug.text)
+            if self.fault_index is not None:
+                hits = self.fault_index.record(new_bug, self.package, self.udid, self.log_dir)
+                logger.info(f'fault {new_bug.signature[:12]} ({new_bug.header}): ' +
+                            ('new' if hits == 1 else f'seen {hits} times'))
             return True, False
 
         # If it is not a bug we could be outside the application
@@ -486,7 +626,8 @@ class RLApplicationEnv(Env):
             self.current_activity = temp_activity
 
         # Updating buttons
-        self.update_views()
+        with self.phase('update_views'):
+            self.update_views()
         return False, False
 
     def update_views(self):
@@ -503,38 +644,50 @@ class RLApplicationEnv(Env):
                     self.manager(e)
             except WebDriverException as e:
                 self.manager(e)
+        self.action_space.high[0] = self.screen.action_space
+
+    def views_action_space(self):
         if len(self.views) == 0:
-            self.action_space.high[0] = self.ACTION_SPACE
-        else:
-            self.action_space.high[0] = len(self.views) + self.shift
+            return self.ACTION_SPACE
+        return len(self.views) + self.shift
 
     def get_all_views(self):
         # Searching for clickable elements in XML/HTML source page
-        page = self.driver.page_source
-        tree = ET.fromstring(page)
-        page = page.replace('enabled="true"', '').replace('enabled="false"', '').replace('checked="false"', '') \
-            .replace('checked="true"', '')
-        temp_md5 = md5(page.encode()).hexdigest()
-        if temp_md5 != self._md5:
+        with self.phase('page_source'):
+            page = self.settled_page if self.settled_page is not None else self.driver.page_source
+            self.settled_page = None
+        with self.phase('parse'):
+            temp_md5 = canonical_hash(page)
+            if temp_md5 == self._md5:
+                return
             self._md5 = temp_md5
-            elements = tree.findall(".//*[@clickable='true']") + tree.findall(".//*[@scrollable='true']") + \
-                       tree.findall(".//*[@long-clickable='true']")
-            self.views = {}
-            tags = set([element.tag for element in elements])
-            i = 0
-            for tag in tags:
-                elements = self.driver.find_elements_by_class_name(tag)
-                for e in elements:
-                    clickable = e.get_attribute('clickable')
-                    scrollable = e.get_attribute('scrollable')
-                    long_clickable = e.get_attribute('long-clickable')
-                    if (clickable == 'true') or (scrollable == 'true') or (long_clickable == 'true'):
-                        identifier = self.return_attribute(e)
-                        self.views.update({i: {'view': e, 'identifier': identifier, 'class_name': tag,
-                                               'clickable': clickable, 'scrollable': scrollable,
-                                               'long-clickable': long_clickable}})
-                        i += 1
+            key = (self.current_activity, temp_md5)
+            self.screen = self.screen_cache.get(key)
+            if self.screen is not None:
+                self.views = self.screen.views()
+                return
+            # The widget model comes entirely from the snapshot, WebElements are resolved lazily
+            widgets = extract_widgets(ET.fromstring(page), self.current_activity)
+            self.views = {i: widget for i, widget in enumerate(widgets)}
             self.update_buttons_in_coverage_dict()
+            identifiers = [widget['identifier'] for widget in widgets]
+            self.screen = ScreenState(self.current_activity, widgets,
+                                      self.encoder.indices(self.current_activity, identifiers),
+                                      self.views_action_space())
+            self.screen_cache.put(key, self.screen)
+
+    def resolve_view(self, current_view):
+        # Only the widget touched by the action is looked up on the device
+        if current_view['view'] is None:
+            if current_view['xpath'] is not None:
+                try:
+                    current_view['view'] = self.driver.find_element_by_xpath(current_view['xpath'])
+                    return current_view['view']
+                except (NoSuchElementException, InvalidSelectorException):
+                    pass
+            current_view['view'] = self.driver.find_element_by_xpath(
+                f"//*[@bounds='{current_view['bounds_string']}']")
+        return current_view['view']
 
     def update_button_in_coverage_dict(self, attribute):
         self.coverage_dict[self.current_activity].update({attribute: True})
@@ -552,8 +705,7 @@ class RLApplicationEnv(Env):
             identifier = item['identifier']
             if identifier not in self.coverage_dict[self.current_activity].keys():
                 self.coverage_dict[self.current_activity].update({identifier: False})
-            if identifier not in self.widget_list:
-                self.widget_list.append(identifier)
+            self.encoder.add_widget(identifier)
 
     def get_action_space(self):
         return list(self.action_space.high)
@@ -567,6 +719,31 @@ class RLApplicationEnv(Env):
         self.clicked_buttons.append(pressed_buttons)
         self.number_bugs.append(len(self.bug_set))
 
+    def collect_coverage(self):
+        self.coverage_count += 1
+        if self.instr:
+            self.instr_funct(udid=self.udid, package=self.package, coverage_dir=self.coverage_dir,
+                             coverage_count=self.coverage_count)
+
+    def close(self):
+        self.log_profile()
+        if self.logIngestion is not None:
+            self.logIngestion.stop()
+        if self.fault_index is not None:
+            self.fault_index.close()
+        try:
+            os.kill(self.bug_proc_pid, 9)
+        except Exception:
+            pass
+        try:
+            self.driver.quit()
+        except WebDriverException:
+            pass
+        if self.recorder is not None:
+            self.recorder.close()
+        logger.remove(self.logger_id)
+        logger.remove(self.bug_logger_id)
+
     def termination(self):
         if (self.timesteps >= self._max_episode_steps) or self.outside:
             self.bug = False
@@ -580,36 +757,22 @@ class RLApplicationEnv(Env):
             return self.observation, numpy.array([0.0]), numpy.array(False), {}
         else:
             logger.error(f'E: {e} in app {self.app_path}')
+            start = time.perf_counter()
             try:
                 self.driver.quit()
             except WebDriverException:
                 pass
             self.appium.restart_appium()
             try:
-                self.driver = webdriver.Remote(f'http://127.0.0.1:{self.appium_port}/wd/hub', self.desired_caps)
+                self.driver = self.new_driver()
             except Exception:
                 if self.emulator is not None:
                     self.emulator.restart_emulator()
-                self.driver = webdriver.Remote(f'http://127.0.0.1:{self.appium_port}/wd/hub', self.desired_caps)
-            time.sleep(5)
+                self.driver = self.new_driver()
+            # the new session is only created once the server and the device answer, no need to wait more
+            logger.info(f'recovered from {type(e).__name__} in {time.perf_counter() - start:.1f} s')
             return self.observation, numpy.array([0.0]), numpy.array(True), {}
 
-    def return_attribute(self, my_view):
-        attribute_fields = ['resource-id', 'content-desc']
-        attribute = None
-        for attr in attribute_fields:
-            attribute = my_view.get_attribute(attr)
-            if attribute is not None:
-                break
-        if attribute is None:
-            attribute = self.current_activity + '.' + my_view.get_attribute('class') + '.'
-            sub_node = my_view.find_elements_by_class_name('android.widget.TextView')
-            if len(sub_node) > 0:
-                attribute += sub_node[0].get_attribute('text')
-            else:
-                attribute += my_view.get_attribute('text')
-        return attribute
-
     def connection_action(self):
         # Activate internet connection
         if self.connection:
@@ -634,12 +797,11 @@ class RLApplicationEnv(Env):
 
     def start_bug_handler(self):
         # ! This is important
-        targetFunc = bug_handler
-        targetArgs = (self.bug_queue, self.udid)
-        if self.logReaderObject is not None:
-            targetFunc = bug_handler_InstruAPK
-            targetArgs = (self.logReaderObject, self.bug_queue, self.udid)
-        bug_proc = Process(name='bug_handler', target=targetFunc, args=targetArgs)
+        if self.logIngestion is not None:
+            # faults are detected in-process by the ingestion service
+            self.logIngestion.start()
+            return None
+        bug_proc = Process(name='bug_handler', target=bug_handler, args=(self.bug_queue, self.udid))
         bug_proc.daemon = True
         bug_proc.start()
         return bug_proc.pid
@@ -678,20 +840,18 @@ class RLApplicationEnv(Env):
     def generate_intent(self, num):
         if len(self.intents[num]["action"]) > 0:
             if self.intents[num]['type'] == 'service':
-                command_string = f'{adb_path} -s {self.udid} shell su 0 am startservice -n ' \
+                command_string = f'su 0 am startservice -n ' \
                                  f'"{self.package}/{self.intents[num]["name"]}" -a "{self.intents[num]["action"][0]}"'
             else:
-                command_string = f'{adb_path} -s {self.udid} shell su 0 am broadcast -n ' \
+                command_string = f'su 0 am broadcast -n ' \
                                  f'"{self.package}/{self.intents[num]["name"]}" -a "{self.intents[num]["action"][0]}"'
             # in case there is more than one action
             self.intents[num]["action"].rotate(1)
         else:
             if self.intents[num]['type'] == 'service':
-                command_string = f'{adb_path} -s {self.udid} shell su 0 am startservice -n ' \
-                                 f'"{self.package}/{self.intents[num]["name"]}"'
+                command_string = f'su 0 am startservice -n "{self.package}/{self.intents[num]["name"]}"'
             else:
-                command_string = f'{adb_path} -s {self.udid} shell su 0 am broadcast ' \
-                                 f'-n "{self.package}/{self.intents[num]["name"]}"'
+                command_string = f'su 0 am broadcast -n "{self.package}/{self.intents[num]["name"]}"'
         if self.emulator is None:
-            command_string = command_string.replace('su 0', '')
-        os.system(command_string)
+            command_string = command_string.replace('su 0 ', '')
+        adb_client(self.udid).check_shell(command_string)
@@ -7,6 +7,9 @@ from stable_baselines3 import DDPG
 from algorithms.ExplorationAlgorithm import ExplorationAlgorithm
 from utils.TimerCallback import TimerCallback
 from utils.wrapper import TimeFeatureWrapper
+from utils.vec_env import is_vec_env
+from utils.replay_buffer import PackedReplayBuffer
+from utils.async_learner import AsyncDDPG
 
 
 logger = logging.getLogger("Traning")
@@ -16,9 +19,21 @@ class DDPGAlgorithm(ExplorationAlgorithm):
 
     @staticmethod
     def explore(app, emulator, appium, timesteps, timer, save_policy=False, app_name='', reload_policy=False,
-                policy_dir='.', cycle=0, train_freq=5, target_update_interval=10, **kwargs):
+                policy_dir='.', cycle=0, train_freq=5, target_update_interval=10, async_learner=False,
+                max_update_ratio=None, packed_replay=False, buffer_size=None,
+                **kwargs):
         try:
-            env = TimeFeatureWrapper(app)
+            # the async learner trains while the device is busy executing the actions
+            model_class = AsyncDDPG if async_learner else DDPG
+            async_kwargs = dict(max_update_ratio=max_update_ratio) if async_learner else {}
+            # one bit per entry of the one-hot observations instead of a float32
+            buffer_kwargs = dict(replay_buffer_class=PackedReplayBuffer) if packed_replay else {}
+            if buffer_size is not None:
+                # the default buffer of a million transitions holds 8 bytes per observation entry
+                buffer_kwargs['buffer_size'] = buffer_size
+            # a VecEnv drives several devices with one learner
+            vec_env = is_vec_env(app)
+            env = app if vec_env else TimeFeatureWrapper(app)
             # Loading a previous policy and checking file existence
             if reload_policy and (os.path.isfile(f'{policy_dir}{os.sep}{app_name}.zip')):
                 # TODO: fix to match env
@@ -30,9 +45,10 @@ class DDPGAlgorithm(ExplorationAlgorithm):
                 pass
             else:
                 logger.info('Starting training from zero')
-                model = DDPG(MlpPolicy, env, verbose=1, train_freq=train_freq, learning_starts=kwargs.get("learning_steps"))
+                model = model_class(MlpPolicy, env, verbose=1, train_freq=train_freq, learning_starts=kwargs.get("learning_steps"),
+                                    **async_kwargs, **buffer_kwargs)
             # model.env.envs[0].check_activity() # why?
-            callback = TimerCallback(timer=timer, app=app)
+            callback = TimerCallback(timer=timer, app=None if vec_env else app)
             model.learn(total_timesteps=timesteps, callback=callback)
             # It will overwrite the previous policy
 
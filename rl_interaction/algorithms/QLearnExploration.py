@@ -6,14 +6,23 @@ from utils.q import Q
 class QLearnAlgorithm(ExplorationAlgorithm):
 
     @staticmethod
-    def explore(app, emulator, appium, timesteps, timer, eps=0.8, **kwargs):
+    def explore(app, emulator, appium, timesteps, timer, eps=0.8, save_policy=False, app_name='',
+                reload_policy=False, policy_dir='.', q_memory_mb=None, **kwargs):
         try:
             t = Timer(timer)
-            q_l = Q(app, t, eps=eps)
+            q_l = Q(app, t, eps=eps, max_memory_mb=q_memory_mb)
+            if reload_policy and q_l.load(policy_dir, app_name):
+                print(f'Reloading Q-table {app_name}.npz')
             q_l.learn(timesteps)
+            # It will overwrite the previous table
+            if save_policy:
+                print('Saving Q-table...')
+                q_l.save(policy_dir, app_name)
             return True
         except Exception as e:
-            appium.restart_appium()
+            # Offline (SimulatedApplicationEnv) there is no device to restart
+            if appium is not None:
+                appium.restart_appium()
             if emulator is not None:
                 emulator.restart_emulator()
             return False
@@ -20,7 +20,9 @@ class RandomAlgorithm(ExplorationAlgorithm):
                     app.reset()
             return True
         except Exception:
-            appium.restart_appium()
+            # Offline (SimulatedApplicationEnv) there is no device to restart
+            if appium is not None:
+                appium.restart_appium()
             if emulator is not None:
                 emulator.restart_emulator()
             return False
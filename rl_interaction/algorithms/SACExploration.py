@@ -7,37 +7,57 @@ from stable_baselines3 import SAC
 from algorithms.ExplorationAlgorithm import ExplorationAlgorithm
 from utils.TimerCallback import TimerCallback
 from utils.wrapper import TimeFeatureWrapper
+from utils.vec_env import is_vec_env, get_action_space_size
+from utils.replay_buffer import PackedReplayBuffer
+from utils.async_learner import AsyncSAC
 
 
 class SACAlgorithm(ExplorationAlgorithm):
 
     @staticmethod
     def explore(app, emulator, appium, timesteps, timer, save_policy=False, app_name='', reload_policy=False,
-                policy_dir='.', cycle=0, train_freq=5, target_update_interval=10, **kwargs):
+                policy_dir='.', cycle=0, train_freq=5, target_update_interval=10, async_learner=False,
+                max_update_ratio=None, packed_replay=False, buffer_size=None,
+                **kwargs):
         try:
-            env = TimeFeatureWrapper(app)
+            # the async learner trains while the device is busy executing the actions
+            model_class = AsyncSAC if async_learner else SAC
+            async_kwargs = dict(max_update_ratio=max_update_ratio) if async_learner else {}
+            # one bit per entry of the one-hot observations instead of a float32
+            buffer_kwargs = dict(replay_buffer_class=PackedReplayBuffer) if packed_replay else {}
+            if buffer_size is not None:
+                # the default buffer of a million transitions holds 8 bytes per observation entry
+                buffer_kwargs['buffer_size'] = buffer_size
+            # a VecEnv drives several devices with one learner
+            vec_env = is_vec_env(app)
+            env = app if vec_env else TimeFeatureWrapper(app)
             # Loading a previous policy and checking file existence
             if reload_policy and (os.path.isfile(f'{policy_dir}{os.sep}{app_name}.zip')):
                 temp_dim = env.action_space.high[0]
-                env.action_space.high[0] = env.env.ACTION_SPACE
+                env.action_space.high[0] = get_action_space_size(env)
                 print(f'Reloading Policy {app_name}.zip')
-                model = SAC.load(f'{policy_dir}{os.sep}{app_name}', env)
+                model = model_class.load(f'{policy_dir}{os.sep}{app_name}', env, **async_kwargs, **buffer_kwargs)
                 env.action_space.high[0] = temp_dim
             else:
                 print('Starting training from zero')
-                model = SAC(MlpPolicy, env, verbose=1, train_freq=train_freq, target_update_interval=target_update_interval, learning_starts=kwargs.get("learning_steps"))
-            model.env.envs[0].check_activity()
-            callback = TimerCallback(timer=timer, app=app)
+                model = model_class(MlpPolicy, env, verbose=1, train_freq=train_freq, target_update_interval=target_update_interval, learning_starts=kwargs.get("learning_steps"), **async_kwargs, **buffer_kwargs)
+            if vec_env:
+                model.env.env_method('check_activity')
+            else:
+                model.env.envs[0].check_activity()
+            callback = TimerCallback(timer=timer, app=None if vec_env else app)
             model.learn(total_timesteps=timesteps, callback=callback)
             # It will overwrite the previous policy
             if save_policy:
                 print('Saving Policy...')
-                model.action_space.high[0] = model.env.envs[0].ACTION_SPACE
+                model.action_space.high[0] = get_action_space_size(env)
                 model.save(f'{policy_dir}{os.sep}{app_name}')
             return True
         except Exception as e:
             print(e)
-            appium.restart_appium()
+            # With a VecEnv the devices are owned by the worker processes
+            if appium is not None:
+                appium.restart_appium()
             if emulator is not None:
                 emulator.restart_emulator()
             return False
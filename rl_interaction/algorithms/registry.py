@@ -0,0 +1,39 @@
+import importlib
+
+# algorithm name -> (module, class), a module is only imported once its algorithm is selected:
+# SAC and DDPG pull in torch and stable_baselines3, random and Q-learning only need numpy
+ALGORITHMS = {
+    'random': ('algorithms.RandomExploration', 'RandomAlgorithm'),
+    'Q': ('algorithms.QLearnExploration', 'QLearnAlgorithm'),
+    'SAC': ('algorithms.SACExploration', 'SACAlgorithm'),
+    'DDPG': ('algorithms.DDPGExploration', 'DDPGAlgorithm'),
+}
+# imported ahead of the device workers by parallel_exec --workers forkserver
+RUNTIME_MODULES = ['test_application', 'RL_application_env']
+
+
+def algorithm_names():
+    return list(ALGORITHMS)
+
+
+def get_algorithm_class(name):
+    """
+    :param name: (str) key of ALGORITHMS
+    :return: (type) ExplorationAlgorithm subclass, its module is imported on the first call
+    """
+    if name not in ALGORITHMS:
+        raise ValueError(f'algo must be one of {algorithm_names()}')
+    module, class_name = ALGORITHMS[name]
+    return getattr(importlib.import_module(module), class_name)
+
+
+def make_algorithm(name):
+    return get_algorithm_class(name)()
+
+
+def preload_modules(names):
+    """
+    :param names: (list) algorithms a worker may run
+    :return: (list) modules to import once in a preloading parent process
+    """
+    return RUNTIME_MODULES + [ALGORITHMS[name][0] for name in names]
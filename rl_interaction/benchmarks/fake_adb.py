@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the `adb` executable, serving the logcat buffer and the app PID written by benchmarks.fake_appium.FakeDevice
+in the directory named by FAKE_ADB_STATE. Shell commands without an answer succeed silently.
+FakeAdbServer serves the same device through the adb server's host protocol.
+"""
+import io
+import os
+import re
+import shlex
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+from collections import Counter
+
+STATE_VARIABLE = 'FAKE_ADB_STATE'
+# len, hdr_size, pid, tid, sec, nsec, lid, uid
+LOGGER_ENTRY_V4 = struct.Struct('<HHiIIIII')
+LOG_PRIORITIES = '??VDIWEFS'
+SHELL_ANSWERS = {
+    ('settings', 'get', 'secure', 'default_input_method'): 'com.android.inputmethod.latin/.LatinIME',
+    ('getprop', 'sys.boot_completed'): '1',
+    ('getprop', 'init.svc.bootanim'): 'stopped',
+    ('pm', 'path', 'android'): 'package:/system/framework/framework-res.apk',
+}
+
+DUMPSYS_PACKAGE = '''Packages:
+  Package [com.ares.synthetic]:
+    requested permissions:
+      android.permission.INTERNET
+      android.permission.CAMERA
+    install permissions:
+      android.permission.INTERNET: granted=true'''
+
+
+def install(sdk_dir, state_dir):
+    """
+    Makes `<sdk_dir>/platform-tools/adb` run this script with the current interpreter.
+    :param sdk_dir: (str) directory used as ANDROID_HOME
+    :param state_dir: (str) directory of the fake device state
+    :return: (dict) environment variables to set
+    """
+    tools_dir = os.path.join(sdk_dir, 'platform-tools')
+    os.makedirs(tools_dir, exist_ok=True)
+    adb = os.path.join(tools_dir, 'adb')
+    with open(adb, 'w') as file:
+        file.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n')
+    os.chmod(adb, os.stat(adb).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return {'ANDROID_HOME': sdk_dir, STATE_VARIABLE: state_dir,
+            'PATH': tools_dir + os.pathsep + os.environ.get('PATH', '')}
+
+
+def read_pid(state_dir):
+    try:
+        with open(os.path.join(state_dir, 'pid')) as file:
+            return file.read().strip()
+    except OSError:
+        return ''
+
+
+def read_generation(state_dir):
+    try:
+        with open(os.path.join(state_dir, 'logcat.generation')) as file:
+            return int(file.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def matches(line, pid, pattern):
+    if pid is not None and line.split(None, 2)[1:2] != [pid]:
+        return False
+    return pattern is None or pattern.search(line) is not None
+
+
+def logcat(state_dir, args, out=sys.stdout):
+    path = os.path.join(state_dir, 'logcat.txt')
+    if '-c' in args:
+        open(path, 'w').close()
+        # followers cannot tell a cleared buffer that grew back from new lines, they watch this counter
+        generation = read_generation(state_dir)
+        with open(os.path.join(state_dir, 'logcat.generation'), 'w') as file:
+            file.write(str(generation + 1))
+        return 0
+    pid, pattern = None, None
+    for i, arg in enumerate(args):
+        if arg.startswith('--pid='):
+            pid = arg[len('--pid='):]
+        elif arg == '-e' and i + 1 < len(args):
+            pattern = re.compile(args[i + 1])
+    with open(path) as file:
+        for line in file:
+            if matches(line, pid, pattern):
+                out.write(line)
+        if '-d' in args:
+            return 0
+        # follow mode, like a plain `adb logcat`
+        out.flush()
+        position = file.tell()
+        generation = read_generation(state_dir)
+        while True:
+            if os.path.getsize(path) < position or read_generation(state_dir) != generation:
+                # the buffer was cleared
+                generation = read_generation(state_dir)
+                file.seek(0)
+            line = file.readline()
+            if line:
+                if matches(line, pid, pattern):
+                    out.write(line)
+                    out.flush()
+                position = file.tell()
+            else:
+                time.sleep(0.02)
+
+
+def binary_entry(pid, tid, seconds, priority, tag, message):
+    """
+    :return: (bytes) logger_entry v4 record, as printed by `logcat -B`
+    """
+    payload = bytes([LOG_PRIORITIES.index(priority)]) + tag.encode() + b'\0' + message.encode() + b'\0'
+    sec = int(seconds)
+    return LOGGER_ENTRY_V4.pack(len(payload), LOGGER_ENTRY_V4.size, pid, tid, sec, int(round((seconds - sec) * 1e9)),
+                                0, 0) + payload
+
+
+def binary_line(line):
+    """
+    :param line: (str) `<epoch> <pid> <tid> <priority> <tag>: <message>` line of the fake logcat
+    """
+    seconds, pid, tid, priority, rest = line.rstrip('\r\n').split(None, 4)
+    tag, _, message = rest.partition(': ')
+    return binary_entry(int(pid), int(tid), float(seconds), priority, tag, message)
+
+
+class BinaryLogcatWriter:
+    """
+    Writes the text lines of the fake logcat as `logcat -B` records.
+    """
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, line):
+        self.out.write(binary_line(line))
+
+    def flush(self):
+        self.out.flush()
+
+
+def shell_command(state_dir, args):
+    """
+    :return: (tuple) output and exit code of one shell command
+    """
+    if args[:1] == ['pidof']:
+        pid = read_pid(state_dir)
+        return (pid + '\n', 0) if pid else ('', 1)
+    if args[:1] == ['logcat']:
+        out = io.StringIO()
+        code = logcat(state_dir, args[1:] if '-c' in args else args[1:] + ['-d'], out)
+        return out.getvalue(), code
+    if args[:2] == ['dumpsys', 'package']:
+        return DUMPSYS_PACKAGE + '\n', 0
+    args = [arg for arg in args if arg not in ('su', '0')]
+    answer = SHELL_ANSWERS.get(tuple(args))
+    return ('' if answer is None else answer + '\n'), 0
+
+
+def run_script(state_dir, script):
+    """
+    Runs a command line of the device shell: commands separated by `;`, `echo` expands `$?`.
+    :return: (tuple) output and exit code of the last command
+    """
+    output, code = [], 0
+    for command in script.split(';'):
+        args = shlex.split(command)
+        if not args:
+            continue
+        if args[0] == 'echo':
+            output.append(' '.join(args[1:]).replace('$?', str(code)) + '\n')
+            code = 0
+        else:
+            text, code = shell_command(state_dir, args)
+            output.append(text)
+    return ''.join(output), code
+
+
+def shell(state_dir, args):
+    # a single argument is a command line run by the device shell
+    output, code = run_script(state_dir, args[0]) if len(args) == 1 else shell_command(state_dir, args)
+    sys.stdout.write(output)
+    return code
+
+
+class FakeAdbServer:
+    """
+    Speaks the subset of the adb server host protocol used by utils.adb.AdbClient (transport selection, `shell:`
+    and the RECV request of `sync:`) for the device state in the directory named by FAKE_ADB_STATE. Files pulled from
+    the device are read from `<state_dir>/files/<device path>`.
+    :param port: (int) port to listen on, 0 picks a free one
+    """
+    def __init__(self, port=0):
+        self.requests = Counter()
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server.serve(self.request)
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(name='fake-adb-server', target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def read_exactly(sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def serve(self, sock):
+        state_dir = os.environ.get(STATE_VARIABLE, '.')
+        try:
+            while True:
+                request = self.read_exactly(sock, int(self.read_exactly(sock, 4), 16)).decode()
+                self.requests[request.split(':', 1)[0] + ':'] += 1
+                if request.startswith('host:transport'):
+                    sock.sendall(b'OKAY')
+                elif request.startswith('shell:'):
+                    sock.sendall(b'OKAY')
+                    output, _ = run_script(state_dir, request[len('shell:'):])
+                    sock.sendall(output.encode())
+                    return
+                elif request == 'sync:':
+                    sock.sendall(b'OKAY')
+                    self.sync(sock, state_dir)
+                    return
+                else:
+                    message = f'unknown service {request}'.encode()
+                    sock.sendall(b'FAIL' + b'%04x' % len(message) + message)
+                    return
+        except EOFError:
+            pass
+
+    def sync(self, sock, state_dir):
+        while True:
+            kind, length = self.read_exactly(sock, 4), struct.unpack('<I', self.read_exactly(sock, 4))[0]
+            if kind != b'RECV':
+                return
+            remote = self.read_exactly(sock, length).decode()
+            path = os.path.join(state_dir, 'files', remote.lstrip('/'))
+            if not os.path.isfile(path):
+                message = b'No such file or directory'
+                sock.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+                continue
+            with open(path, 'rb') as file:
+                while True:
+                    chunk = file.read(64 * 1024)
+                    if not chunk:
+                        break
+                    sock.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+            sock.sendall(b'DONE' + struct.pack('<I', 0))
+
+
+def main(argv):
+    state_dir = os.environ.get(STATE_VARIABLE, '.')
+    if argv[:1] == ['-s']:
+        argv = argv[2:]
+    if not argv:
+        return 1
+    command, args = argv[0], argv[1:]
+    if command == 'logcat':
+        return logcat(state_dir, args)
+    if command == 'shell':
+        return shell(state_dir, args)
+    if command == 'exec-out' and args[:1] == ['logcat']:
+        out = BinaryLogcatWriter(sys.stdout.buffer) if '-B' in args else sys.stdout
+        return logcat(state_dir, args[1:], out)
+    if command == 'devices':
+        print('List of devices attached\nemulator-5554\tdevice\n')
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        sys.exit(0)
@@ -0,0 +1,305 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+FIRST_PID = 4000
+
+
+class FakeDevice:
+    """
+    State of the emulated device, shared with the fake adb through files in `state_dir`: the logcat buffer
+    (`logcat.txt`, `-v epoch -v threadtime` format) and the PID of the app (`pid`).
+    :param app: (SyntheticApp) app running on the device
+    :param state_dir: (str) directory read by the fake adb
+    :param seed: (int) seed of the crashes
+    :param transition: (float) seconds the screen keeps changing after a widget is used
+    :param install_time: (float) seconds taken by a reinstall of the app
+    """
+    def __init__(self, app, state_dir, seed=0, transition=0.0, install_time=0.0):
+        self.app = app
+        self.state_dir = state_dir
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.logcat_path = os.path.join(state_dir, 'logcat.txt')
+        self.pid_path = os.path.join(state_dir, 'pid')
+        self.pid = FIRST_PID
+        self.activity = 0
+        self.back_stack = []
+        self.counter = 0
+        self.crashes = 0
+        self.transition = transition
+        self.busy_until = 0.0
+        self.install_time = install_time
+        self.running = True
+        open(self.logcat_path, 'w').close()
+        self.start_process()
+
+    def log(self, lines):
+        with open(self.logcat_path, 'a') as file:
+            file.write(''.join(f'{time.time():.3f} {pid} {pid} {level} {message}\n' for pid, level, message in lines))
+
+    def start_process(self):
+        self.pid += 1
+        with open(self.pid_path, 'w') as file:
+            file.write(str(self.pid))
+        self.log([(1000, 'I', f'ActivityManager: Start proc {self.pid}:{self.app.package}/u0a100 for activity '
+                              f'{self.app.activities[self.activity]}')])
+
+    def page_source(self):
+        with self.lock:
+            self.counter += 1
+            if time.perf_counter() < self.busy_until:
+                # the screen is still animating, every snapshot differs
+                return self.app.page_source(self.activity, self.counter, loading=True)
+            return self.app.page_source(self.activity, self.counter)
+
+    def current_activity(self):
+        # Appium reports the activity relative to the package
+        return self.app.activities[self.activity][len(self.app.package):]
+
+    def find_widget(self, bounds):
+        for widget in self.app.screens[self.activity]:
+            if widget.bounds == bounds:
+                return widget
+        return None
+
+    def use_widget(self, widget):
+        with self.lock:
+            millis = int(time.time() * 1000)
+            self.busy_until = time.perf_counter() + self.transition
+            file_name = f'Activity{self.activity}.java'
+            self.log([(self.pid, 'I', f'InstruAPK: ;;{method};;{file_name};;onClick;;android.view.View;;{millis}')
+                      for method in widget.methods])
+            if self.rng.random() < self.app.crash_rate:
+                self.crash(widget)
+            elif widget.target is not None and widget.target != self.activity:
+                self.back_stack.append(self.activity)
+                self.activity = widget.target
+
+    def crash(self, widget):
+        self.crashes += 1
+        activity = self.app.activities[self.activity]
+        self.log([(self.pid, 'E', 'AndroidRuntime: FATAL EXCEPTION: main'),
+                  (self.pid, 'E', f'AndroidRuntime: Process: {self.app.package}, PID: {self.pid}'),
+                  (self.pid, 'E', f'AndroidRuntime: java.lang.IllegalStateException: widget {widget.index} failed'),
+                  (self.pid, 'E', f'AndroidRuntime: at {activity}.onClick({activity.rsplit(".", 1)[-1]}.java:'
+                                  f'{40 + widget.index})')])
+        self.activity = 0
+        self.back_stack.clear()
+        self.start_process()
+
+    def back(self):
+        with self.lock:
+            if self.back_stack:
+                self.activity = self.back_stack.pop()
+
+    def reset(self):
+        time.sleep(self.install_time)
+        with self.lock:
+            self.activity = 0
+            self.back_stack.clear()
+            self.start_process()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+
+    def launch(self, activity=None):
+        with self.lock:
+            if activity is not None and activity in self.app.activities:
+                self.activity = self.app.activities.index(activity)
+                self.back_stack.clear()
+            elif not self.running:
+                self.activity = 0
+                self.back_stack.clear()
+            if not self.running:
+                self.running = True
+                self.start_process()
+
+
+class FakeAppiumServer:
+    """
+    In-process HTTP server speaking the subset of the WebDriver/Appium protocol used by RLApplicationEnv. Elements are
+    resolved against the page source of the synthetic app, every other command succeeds without effect.
+    :param device: (FakeDevice) device driven by the sessions
+    :param port: (int) port to listen on
+    :param latency: (float) seconds added to every command, to emulate the device round trip
+    """
+    def __init__(self, device, port, latency=0.0):
+        self.device = device
+        self.port = port
+        self.latency = latency
+        self.commands = Counter()
+        self.elements = {}
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(name='fake-appium', target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are sent separately, Nagle would delay every keep-alive response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.dispatch('GET')
+
+            def do_POST(self):
+                self.dispatch('POST')
+
+            def do_DELETE(self):
+                self.dispatch('DELETE')
+
+            def dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                status, value = fake.execute(method, self.path, body)
+                payload = json.dumps({'value': value}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def execute(self, method, path, body):
+        if self.latency:
+            time.sleep(self.latency)
+        path = path.split('?')[0]
+        if path.startswith('/wd/hub'):
+            path = path[len('/wd/hub'):]
+        # /session/<id>/<command>, the id is dropped from the command name
+        command = re.sub(r'^/session/[^/]+', '/session', path)
+        command = re.sub(r'/element/[^/]+', '/element/:id', command)
+        self.commands[f'{method} {command}'] += 1
+        device = self.device
+        if method == 'POST' and path == '/session':
+            return 200, {'sessionId': uuid.uuid4().hex, 'capabilities': body.get('capabilities', {})}
+        if command == '/status':
+            return 200, {'ready': True, 'message': 'fake appium'}
+        if command == '/session/source':
+            return 200, device.page_source()
+        if command == '/session/appium/device/current_activity':
+            return 200, device.current_activity()
+        if command == '/session/appium/device/current_package':
+            return 200, device.app.package
+        if command == '/session/window/rect':
+            return 200, {'x': 0, 'y': 0, 'width': 1080, 'height': 1920}
+        if command == '/session/window/size':
+            return 200, {'width': 1080, 'height': 1920}
+        if command == '/session/orientation' and method == 'GET':
+            return 200, 'PORTRAIT'
+        if command == '/session/appium/app/reset':
+            device.reset()
+            return 200, None
+        if command == '/session/appium/device/terminate_app':
+            device.stop()
+            return 200, True
+        if command == '/session/appium/device/activate_app':
+            device.launch()
+            return 200, None
+        if command == '/session/appium/device/start_activity':
+            activity = body.get('appActivity', '')
+            device.launch(device.app.package + activity if activity.startswith('.') else activity)
+            return 200, None
+        if command == '/session/back':
+            device.back()
+            return 200, None
+        if command in ('/session/element', '/session/elements'):
+            return self.find_elements(body, command == '/session/element')
+        if command.startswith('/session/element/:id/attribute/'):
+            widget = self.elements.get(path.split('/element/')[1].split('/')[0])
+            return 200, None if widget is None else self.attribute(widget, command.rsplit('/', 1)[1])
+        if command in ('/session/element/:id/click', '/session/element/:id/value'):
+            widget = self.elements.get(path.split('/element/')[1].split('/')[0])
+            if widget is None:
+                return 404, {'error': 'stale element reference', 'message': 'The element is no longer attached'}
+            if command.endswith('click'):
+                device.use_widget(widget)
+            return 200, None
+        return 200, None
+
+    @staticmethod
+    def attribute(widget, name):
+        return {'class': widget.class_name, 'className': widget.class_name, 'clickable': widget.clickable,
+                'long-clickable': widget.long_clickable, 'scrollable': widget.scrollable,
+                'resource-id': widget.resource_id or None, 'content-desc': None, 'text': widget.text,
+                'bounds': widget.bounds}.get(name)
+
+    def find_elements(self, body, single):
+        using, value = body.get('using'), body.get('value', '')
+        widgets = []
+        if using == 'xpath':
+            # ElementTree only evaluates relative paths
+            if value.startswith('//'):
+                query = '.' + value
+            else:
+                query = './' + value.split('/', 2)[2] if value.startswith('/hierarchy/') else None
+            if query is not None:
+                try:
+                    nodes = ET.fromstring(self.device.page_source()).findall(query)
+                except SyntaxError:
+                    nodes = []
+                for node in nodes:
+                    widget = self.device.find_widget(node.get('bounds'))
+                    if widget is not None:
+                        widgets.append(widget)
+        elements = []
+        for widget in widgets:
+            element_id = f'{self.device.activity}-{widget.index}'
+            self.elements[element_id] = widget
+            elements.append({ELEMENT_KEY: element_id})
+        if single:
+            if not elements:
+                return 404, {'error': 'no such element', 'message': f'{value} not found'}
+            return 200, elements[0]
+        return 200, elements
+
+
+class FakeAppiumLauncher:
+    """
+    Drop-in replacement of utils.utils.AppiumLauncher serving a FakeAppiumServer.
+    """
+    def __init__(self, port, device, latency=0.0):
+        self.port = port
+        self.server = FakeAppiumServer(device, port, latency)
+        self.start_appium()
+
+    def terminate(self):
+        self.server.stop()
+
+    def start_appium(self):
+        self.server.start()
+
+    def restart_appium(self):
+        commands = self.server.commands
+        self.terminate()
+        self.server = FakeAppiumServer(self.server.device, self.port, self.server.latency)
+        self.server.commands = commands
+        self.start_appium()
@@ -0,0 +1,174 @@
+"""
+Throughput of the fault detection of LogReader on large synthetic logcat captures: the FaultScanner, which searches
+the keywords starting a fault in whole chunks and walks the flagged lines with a state machine, against the line by
+line keyword matching it replaced. The lines are parsed beforehand, only the classification of the lines is timed,
+for the text lines and for the `logcat -B` records, where the scanner searches the raw records and the line by line
+matching decodes every message. Run from the rl_interaction folder:
+
+    python -m benchmarks.fault_scanner_benchmark --lines 500000
+"""
+import argparse
+import json
+import sys
+import time
+
+import texttable as tt
+
+from benchmarks.fake_adb import binary_line
+from benchmarks.logcat_benchmark import PACKAGE, chunks as split, synthetic_lines
+from us_logs.binaryLogcat import PRIORITIES, BinaryInstrumentationLine, BinaryLogDecoder, BinaryLogLine
+from us_logs.faultScanner import ERROR_PRIORITY
+from us_logs.logReader import Fault, FaultType, InstrumentationLine, LogReader, LogTag
+
+# crash rates of the captures: Java crashes, native crashes
+SCENARIOS = {'rare crashes': (0.001, 0.0), 'frequent crashes': (0.01, 0.0), 'native crashes': (0.005, 0.005)}
+
+
+class LegacyClassifier(object):
+    """
+    Fault detection of LogReader before the FaultScanner: every line is matched against the lists of keywords, the
+    keyword of the header is pushed on the list of the continuation keywords while the fault is read.
+    """
+
+    def __init__(self, packageName):
+        self.packageName = packageName
+        self.pendingFaultLines, self.pendingFaultKeyword = [], None
+
+    def classifyLines(self, logLines):
+        faultStartKeywords = [fault.value for fault in FaultType if fault is not FaultType.NATIVE_CRASH]
+        faultReadingKeywords = ["Caused by", ": at ", ": ... ", f"Process: {self.packageName}", "AndroidRuntime: "]
+        faultReading = len(self.pendingFaultLines) > 0
+        currentFaultLines = self.pendingFaultLines
+        if faultReading:
+            faultReadingKeywords.append(self.pendingFaultKeyword)
+        faults, instrumentationLines = [], []
+        for logLine in logLines:
+            instrumented = isinstance(logLine, InstrumentationLine)
+            if faultReading and (instrumented or FaultType.FATAL_EXCEPTION.value in logLine.message):
+                faultReading = False
+                faults.append(Fault(currentFaultLines))
+                currentFaultLines = []
+                faultReadingKeywords.pop()
+            if instrumented:
+                instrumentationLines.append(logLine.index)
+            elif faultReading:
+                if any(keyword in logLine.message for keyword in faultReadingKeywords):
+                    currentFaultLines.append(logLine)
+                else:
+                    faultReading = False
+                    faults.append(Fault(currentFaultLines))
+                    currentFaultLines = []
+                    faultReadingKeywords.pop()
+            elif logLine.tag == LogTag.ERROR or any(keyword in logLine.message for keyword in faultStartKeywords):
+                # IndexError on a header without a colon
+                faultReadingKeywords.append(logLine.message.split(":")[1].strip())
+                faultReading = True
+                currentFaultLines.append(logLine)
+        self.pendingFaultLines = currentFaultLines if faultReading else []
+        self.pendingFaultKeyword = faultReadingKeywords[-1] if faultReading else None
+        return logLines, instrumentationLines, faults
+
+
+def measure(classifier, chunks):
+    faults, methods = [], 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        _, instrumentationLines, newFaults = classifier.classifyLines(chunk)
+        faults += newFaults
+        methods += len(instrumentationLines)
+    return time.perf_counter() - start, faults, methods
+
+
+def binary_chunks(lines, chunk_bytes):
+    """
+    :return: (list) records of the chunks of the capture and their lines, every process kept
+    """
+    decoder, index, result = BinaryLogDecoder(), 0, []
+    for chunk in split(b''.join(binary_line(line) for line in lines), chunk_bytes):
+        records = decoder.feed(chunk)
+        instrumented, methods = records.instrumentationMethods()
+        methodOf = dict(zip(instrumented.tolist(), methods))
+        logLines = []
+        for record in range(len(records)):
+            method = methodOf.get(record)
+            logLines.append(BinaryLogLine(records, record, index) if method is None else
+                            BinaryInstrumentationLine(records, record, index, method))
+            index += 1
+        result.append((records, logLines))
+    return result
+
+
+def measure_binary(lines, chunk_bytes):
+    # the lines decode and cache their message when read, each classification gets its own
+    legacy = LegacyClassifier(PACKAGE)
+    legacy_chunks = [logLines for _, logLines in binary_chunks(lines, chunk_bytes)]
+    legacy_seconds, legacy_faults, _ = measure(legacy, legacy_chunks)
+    reader = LogReader(PACKAGE)
+    scanner_faults = []
+    scanner_chunks = binary_chunks(lines, chunk_bytes)
+    start = time.perf_counter()
+    for records, logLines in scanner_chunks:
+        # as BinaryLogReader.parseLines
+        flags = reader.faultScanner.markRecords(records.data, records.tagStart)
+        flags[records.priority == PRIORITIES.index(LogTag.ERROR.value)] |= ERROR_PRIORITY
+        scanner_faults += reader.classifyLines(logLines, flags)[2]
+    return legacy_seconds, legacy_faults, time.perf_counter() - start, scanner_faults
+
+
+def count_types(faults):
+    native = sum(fault.type == FaultType.NATIVE_CRASH for fault in faults)
+    return len(faults) - native, native
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput of the fault detection of LogReader')
+    parser.add_argument('--lines', type=int, default=500000)
+    parser.add_argument('--chunk_lines', type=int, default=4096, help='lines classified at once, as read by logcat')
+    parser.add_argument('--chunk_bytes', type=int, default=1 << 16, help='size of the reads of `logcat -B`')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args(argv)
+    results = {}
+    for name, (crash_rate, native_rate) in SCENARIOS.items():
+        lines = synthetic_lines(args.lines, args.seed, crash_rate=crash_rate, native_rate=native_rate)
+        # the whole capture, every process, as in a `logcat -d` dump
+        reader = LogReader(PACKAGE)
+        logLines = reader.readRawLines(lines)[0]
+        chunks = [logLines[i:i + args.chunk_lines] for i in range(0, len(logLines), args.chunk_lines)]
+        legacy_seconds, legacy_faults, legacy_methods = measure(LegacyClassifier(PACKAGE), chunks)
+        scanner_seconds, scanner_faults, scanner_methods = measure(LogReader(PACKAGE), chunks)
+        java, native = count_types(scanner_faults)
+        if legacy_methods != scanner_methods or count_types(legacy_faults)[0] != java:
+            raise RuntimeError(f'{name}: the classifications disagree, {len(legacy_faults)} and {java} Java faults, '
+                               f'{legacy_methods} and {scanner_methods} methods')
+        binary_legacy_seconds, binary_legacy_faults, binary_seconds, binary_faults = \
+            measure_binary(lines, args.chunk_bytes)
+        if count_types(binary_faults) != (java, native) or count_types(binary_legacy_faults)[0] != java:
+            raise RuntimeError(f'{name}: the text and binary classifications disagree')
+        results[name] = {'lines': len(logLines), 'megabytes': sum(map(len, lines)) / 2 ** 20,
+                         'legacy_lines_per_s': len(logLines) / legacy_seconds,
+                         'scanner_lines_per_s': len(logLines) / scanner_seconds,
+                         'speedup': legacy_seconds / scanner_seconds,
+                         'binary_legacy_lines_per_s': len(logLines) / binary_legacy_seconds,
+                         'binary_scanner_lines_per_s': len(logLines) / binary_seconds,
+                         'binary_speedup': binary_legacy_seconds / binary_seconds, 'java_faults': java,
+                         'native_faults': native,
+                         'legacy_native_faults': count_types(legacy_faults)[1]}
+    table = tt.Texttable(max_width=0)
+    table.header(['capture', 'lines', 'MB', 'text lines/s\nbefore', 'text lines/s\nscanner', 'text\nspeedup',
+                  'binary lines/s\nbefore', 'binary lines/s\nscanner', 'binary\nspeedup', 'Java faults',
+                  'native faults'])
+    for name, result in results.items():
+        table.add_row([name, result['lines'], result['megabytes'], result['legacy_lines_per_s'],
+                       result['scanner_lines_per_s'], result['speedup'], result['binary_legacy_lines_per_s'],
+                       result['binary_scanner_lines_per_s'], result['binary_speedup'], result['java_faults'],
+                       f"{result['native_faults']} ({result['legacy_native_faults']} before)"])
+    print(table.draw())
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
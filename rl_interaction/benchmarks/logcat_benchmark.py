@@ -0,0 +1,246 @@
+"""
+Ingestion throughput of the logcat readers on a synthetic buffer of an instrumented app: mostly InstruAPK lines,
+lines of other processes and a few crashes. The same lines are parsed as `logcat -v epoch -v threadtime` text by
+LogReader and as `logcat -B` records by BinaryLogReader. The memory and the time of a clear of the lines kept by
+`LogReader.readLog` are compared with a plain list of LogLine objects, and the whole ingestion path is timed: the
+reader and the consumers of LogIngestionService. Run from the rl_interaction folder:
+
+    python -m benchmarks.logcat_benchmark --lines 200000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import texttable as tt
+from loguru import logger
+
+from benchmarks.fake_adb import binary_line
+from us_logs.binaryLogcat import BinaryLogDecoder, BinaryLogReader
+from us_logs.logIngestion import CoverageAccumulator, FaultContext, FaultDetector, LogBatch, RawArchive
+from us_logs.logReader import InstrumentationLine, LogReader
+from us_logs.logStore import LogStore
+
+PACKAGE = 'com.ares.benchmark'
+APP_PID = 4242
+
+
+def synthetic_lines(count, seed, instrumented=0.8, crash_rate=0.001, native_rate=0.0):
+    """
+    :param native_rate: (float) share of native crashes, logged by libc in the app and by crash_dump in its own process
+    :return: (list) text lines of the app and of other processes, in the format of the fake logcat
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    lines = [f'{now:.3f} 1000 1000 I ActivityManager: Start proc {APP_PID}:{PACKAGE}/u0a100 for activity '
+             f'{PACKAGE}.MainActivity']
+    while len(lines) < count:
+        now += 0.001
+        draw = rng.random()
+        if draw < native_rate:
+            dump = APP_PID + 10
+            lines += [f'{now:.3f} {APP_PID} {APP_PID} F libc: Fatal signal 11 (SIGSEGV), code 1 (SEGV_MAPERR), fault '
+                      f'addr 0x{rng.randrange(1 << 32):x} in tid {APP_PID} (main), pid {APP_PID} ({PACKAGE})',
+                      f'{now:.3f} {dump} {dump} F DEBUG: *** *** *** *** *** *** *** *** *** *** *** *** *** *** ***',
+                      f'{now:.3f} {dump} {dump} F DEBUG: pid: {APP_PID}, tid: {APP_PID}, name: main  >>> {PACKAGE} <<<',
+                      f'{now:.3f} {dump} {dump} F DEBUG: backtrace:',
+                      f'{now:.3f} {dump} {dump} F DEBUG:       #00 pc 000000000004c2b8  /system/lib64/libc.so',
+                      f'{now:.3f} {dump} {dump} F DEBUG:       #01 pc 0000000000012a40  /data/app/{PACKAGE}/lib/'
+                      f'libnative.so',
+                      f'{now:.3f} {APP_PID} {APP_PID} I ViewRootImpl: window recreated']
+        elif draw < native_rate + crash_rate:
+            lines += [f'{now:.3f} {APP_PID} {APP_PID} E AndroidRuntime: FATAL EXCEPTION: main',
+                      f'{now:.3f} {APP_PID} {APP_PID} E AndroidRuntime: Process: {PACKAGE}, PID: {APP_PID}',
+                      f'{now:.3f} {APP_PID} {APP_PID} E AndroidRuntime: java.lang.IllegalStateException: '
+                      f'widget {rng.randrange(50)} failed',
+                      f'{now:.3f} {APP_PID} {APP_PID} E AndroidRuntime: at {PACKAGE}.MainActivity.onClick('
+                      f'MainActivity.java:{rng.randrange(40, 90)})',
+                      f'{now:.3f} {APP_PID} {APP_PID} I ViewRootImpl: window recreated']
+        elif draw < instrumented:
+            lines.append(f'{now:.3f} {APP_PID} {APP_PID} I InstruAPK: ;;{rng.randrange(5000)};;'
+                         f'Activity{rng.randrange(20)}.java;;onClick;;android.view.View;;{int(now * 1000)}')
+        elif draw < 0.9:
+            lines.append(f'{now:.3f} {APP_PID} {APP_PID + 1} D OpenGLRenderer: frame {rng.randrange(10 ** 6)} '
+                         f'drawn in {rng.random():.3f} ms')
+        else:
+            pid = rng.randrange(1500, 3000)
+            lines.append(f'{now:.3f} {pid} {pid} I chatty: uid=10{rng.randrange(100)} expire {rng.randrange(99)} '
+                         f'lines')
+    return lines[:count]
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def measure_text(lines, chunk_lines):
+    reader = LogReader(PACKAGE)
+    methods, faults = [], 0
+    start = time.perf_counter()
+    for i in range(0, len(lines), chunk_lines):
+        # the text reader filters the lines of the app with `--pid`
+        chunk = [line for line in lines[i:i + chunk_lines] if line.split(None, 2)[1] == str(APP_PID)]
+        logLines, instrumentationLines, newFaults = reader.parseLines(chunk)
+        methods += [logLines[index - logLines[0].index].methodIndex for index in instrumentationLines]
+        faults += len(newFaults)
+    return time.perf_counter() - start, methods, faults
+
+
+def measure_binary(data, chunk_bytes):
+    reader = BinaryLogReader(PACKAGE)
+    methods, faults = [], 0
+    start = time.perf_counter()
+    for chunk in chunks(data, chunk_bytes):
+        logLines, instrumentationLines, newFaults = reader.parseLines(chunk)
+        methods += [logLines[index - logLines[0].index].methodIndex for index in instrumentationLines]
+        faults += len(newFaults)
+    return time.perf_counter() - start, methods, faults
+
+
+def measure_decode(data, chunk_bytes):
+    decoder = BinaryLogDecoder()
+    methods = 0
+    start = time.perf_counter()
+    for chunk in chunks(data, chunk_bytes):
+        records = decoder.feed(chunk)
+        methods += len(records.instrumentationMethods()[1])
+    return time.perf_counter() - start, methods
+
+
+class MethodCounter:
+    """
+    Stands for the CoverageProcessor fed by CoverageAccumulator, without the method locations of an app.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def process_methods(self, methods):
+        self.calls += len(methods)
+
+
+def measure_ingestion(reader, reads, binary):
+    """
+    The path of LogIngestionService.poll: every read is parsed, then the batch is handed to the consumers of the
+    environment one after the other, in this thread.
+    :param reads: (list) text lines or chunks of records returned by the reads of the log
+    :return: (dict) seconds spent in the reader and in every consumer
+    """
+    # FaultDetector logs every batch with faults
+    logger.disable('us_logs')
+    with tempfile.TemporaryDirectory() as directory:
+        archive = os.path.join(directory, 'logcat.bin' if binary else 'logcat.txt')
+        consumers = [FaultDetector(), CoverageAccumulator(MethodCounter()), RawArchive(archive, binary),
+                     FaultContext(os.path.join(directory, 'fault_context'))]
+        seconds = dict.fromkeys(['reader'] + [consumer.name for consumer in consumers], 0.0)
+        for read in reads:
+            start = time.perf_counter()
+            logLines, instrumentationLines, faults = reader.parseLines(read)
+            seconds['reader'] += time.perf_counter() - start
+            if not logLines:
+                continue
+            batch = LogBatch(logLines, [logLines[index - logLines[0].index] for index in instrumentationLines], faults)
+            for consumer in consumers:
+                start = time.perf_counter()
+                consumer.consume(batch)
+                seconds[consumer.name] += time.perf_counter() - start
+        for consumer in consumers:
+            consumer.close()
+    logger.enable('us_logs')
+    return seconds
+
+
+def measure_storage(lines, capacity):
+    """
+    Lines of the app kept by readLog in a list of LogLine objects, as before LogStore, and in a LogStore.
+    """
+    app_lines = [line for line in lines if line.split(None, 2)[1] == str(APP_PID)]
+    results = {}
+    for name in ('list', 'store'):
+        tracemalloc.start()
+        logLines, instrumentationLines, faults = LogReader(PACKAGE).parseLines(app_lines)
+        if name == 'list':
+            kept = logLines
+        else:
+            kept = LogStore(type(logLines[0]), InstrumentationLine, capacity)
+            kept.extend(logLines, instrumentationLines, faults)
+        del logLines
+        # the faults, and the lines they hold, are kept either way
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        if name == 'list':
+            # LogReader.clearLog before LogStore: delete every line that is not InstruAPK, then rebuild the indices
+            for i in range(len(kept) - 1, -1, -1):
+                if not isinstance(kept[i], InstrumentationLine):
+                    del kept[i]
+            list(range(len(kept)))
+        else:
+            kept.clear()
+        clear_seconds = time.perf_counter() - start
+        results[name] = {'lines': len(app_lines), 'bytes': size, 'clear_ms': clear_seconds * 1000}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Throughput of the text and binary logcat readers')
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--chunk_bytes', type=int, default=1 << 16, help='size of the reads of `logcat -B`')
+    parser.add_argument('--capacity', type=int, default=100000, help='ring buffer capacity of the LogStore')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args(argv)
+    lines = synthetic_lines(args.lines, args.seed)
+    text = ''.join(line + '\n' for line in lines).encode()
+    data = b''.join(binary_line(line) for line in lines)
+    # the text reader gets as many lines per read as the binary reader
+    chunk_lines = max(1, args.chunk_bytes * len(lines) // len(data))
+    text_seconds, text_methods, text_faults = measure_text(lines, chunk_lines)
+    binary_seconds, binary_methods, binary_faults = measure_binary(data, args.chunk_bytes)
+    decode_seconds, decoded_methods = measure_decode(data, args.chunk_bytes)
+    if text_methods != binary_methods or text_faults != binary_faults:
+        raise RuntimeError(f'the readers disagree: {len(text_methods)} and {len(binary_methods)} methods, '
+                           f'{text_faults} and {binary_faults} faults')
+    results = {'text': {'bytes': len(text), 'seconds': text_seconds, 'lines_per_s': len(lines) / text_seconds,
+                        'methods': len(text_methods), 'faults': text_faults},
+               'binary': {'bytes': len(data), 'seconds': binary_seconds, 'lines_per_s': len(lines) / binary_seconds,
+                          'methods': len(binary_methods), 'faults': binary_faults},
+               'binary decode only': {'bytes': len(data), 'seconds': decode_seconds,
+                                      'lines_per_s': len(lines) / decode_seconds, 'methods': decoded_methods,
+                                      'faults': None}}
+    table = tt.Texttable(max_width=0)
+    table.header(['reader', 'MB', 'lines/s', 'methods', 'faults'])
+    for name, result in results.items():
+        table.add_row([name, result['bytes'] / 2 ** 20, result['lines_per_s'], result['methods'],
+                       '-' if result['faults'] is None else result['faults']])
+    print(table.draw())
+    # the text reader filters the lines of the app with `--pid`
+    text_reads = [[line for line in lines[i:i + chunk_lines] if line.split(None, 2)[1] == str(APP_PID)]
+                  for i in range(0, len(lines), chunk_lines)]
+    ingestion = {'text': measure_ingestion(LogReader(PACKAGE), text_reads, False),
+                 'binary': measure_ingestion(BinaryLogReader(PACKAGE), chunks(data, args.chunk_bytes), True)}
+    table = tt.Texttable(max_width=0)
+    consumers = list(ingestion['text'])
+    table.header(['ingestion', 'lines/s'] + [f'{name} s' for name in consumers])
+    for name, seconds in ingestion.items():
+        seconds['lines_per_s'] = len(lines) / sum(seconds.values())
+        table.add_row([name, seconds['lines_per_s']] + [seconds[consumer] for consumer in consumers])
+    print(table.draw())
+    storage = measure_storage(lines, args.capacity)
+    table = tt.Texttable(max_width=0)
+    table.header(['kept lines', 'lines', 'MB', 'clear ms'])
+    for name, result in storage.items():
+        table.add_row([name, result['lines'], result['bytes'] / 2 ** 20, result['clear_ms']])
+    print(table.draw())
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results, 'ingestion': ingestion, 'storage': storage}, file,
+                      indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Memory per transition and throughput of the SAC/DDPG replay buffers, filled with one-hot observations followed by a
+time feature as produced by RLApplicationEnv behind TimeFeatureWrapper. Run from the rl_interaction folder:
+
+    python -m benchmarks.replay_benchmark --observation_space 2000 --transitions 50000
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import texttable as tt
+from gym import spaces
+from stable_baselines3.common.buffers import ReplayBuffer
+
+from utils.replay_buffer import PackedReplayBuffer
+
+BUFFERS = {'default': ReplayBuffer, 'packed': PackedReplayBuffer}
+
+
+def transitions(count, observation_space, active, seed):
+    """
+    :return: (numpy.ndarray) count + 1 float32 observations with `active` entries set to 1 and a time feature
+    """
+    rng = np.random.default_rng(seed)
+    obs = np.zeros((count + 1, observation_space + 1), dtype=np.float32)
+    rows = np.repeat(np.arange(count + 1), active)
+    obs[rows, rng.integers(0, observation_space, size=rows.shape)] = 1
+    obs[:, -1] = rng.random(count + 1)
+    return obs
+
+
+def measure(buffer_class, obs, batch_size, samples):
+    count = len(obs) - 1
+    observation_space = spaces.Box(low=0, high=1, shape=obs.shape[1:], dtype=np.float32)
+    action_space = spaces.Box(low=0, high=1, shape=(3,), dtype=np.float32)
+    buffer = buffer_class(count, observation_space, action_space, device='cpu')
+    action, reward, done, infos = np.zeros((1, 3), dtype=np.float32), np.zeros(1), np.zeros(1), [{}]
+    start = time.perf_counter()
+    for i in range(count):
+        buffer.add(obs[i:i + 1], obs[i + 1:i + 2], action, reward, done, infos)
+    add_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(samples):
+        buffer.sample(batch_size)
+    sample_seconds = time.perf_counter() - start
+    if isinstance(buffer, PackedReplayBuffer):
+        bytes_per_transition = buffer.bytes_per_transition()
+    else:
+        arrays = [buffer.observations, buffer.next_observations, buffer.actions, buffer.rewards, buffer.dones,
+                  buffer.timeouts]
+        bytes_per_transition = sum(array.nbytes for array in arrays) / buffer.buffer_size
+    return {'bytes_per_transition': bytes_per_transition,
+            'adds_per_s': count / add_seconds,
+            'batches_per_s': samples / sample_seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Memory and throughput of the replay buffers')
+    parser.add_argument('--observation_space', type=int, default=2000)
+    parser.add_argument('--transitions', type=int, default=50000)
+    parser.add_argument('--active', type=int, default=30, help='entries set to 1 in every observation')
+    parser.add_argument('--batch_size', type=int, default=256)
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args(argv)
+    obs = transitions(args.transitions, args.observation_space, args.active, args.seed)
+    results = {name: measure(buffer_class, obs, args.batch_size, args.samples)
+               for name, buffer_class in BUFFERS.items()}
+    table = tt.Texttable(max_width=0)
+    table.header(['buffer', 'bytes/transition', 'adds/s', f'batches of {args.batch_size}/s'])
+    for name, result in results.items():
+        table.add_row([name, result['bytes_per_transition'], result['adds_per_s'], result['batches_per_s']])
+    print(table.draw())
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+End-to-end benchmark of RLApplicationEnv on a plain Linux box: a FakeAppiumServer and a fake `adb` stand in for the
+device, the app is a SyntheticApp. Run from the rl_interaction folder:
+
+    python -m benchmarks.run_benchmark --algos random,Q,SAC,DDPG --timesteps 300 --output benchmark.json
+
+`--mode env` drives each ExplorationAlgorithm directly, `--mode main` runs test_application.main end to end.
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import texttable as tt
+
+from algorithms.registry import make_algorithm
+from benchmarks import fake_adb
+from benchmarks.fake_adb import FakeAdbServer
+from benchmarks.fake_appium import FakeAppiumLauncher, FakeDevice
+from benchmarks.synthetic_app import SyntheticApp
+from utils.app_reset import RESET_STRATEGIES
+
+ALGORITHMS = ['random', 'Q', 'SAC', 'DDPG']
+RL_INTERACTION_DIR = Path(__file__).resolve().parent.parent
+
+
+class StepRecorder:
+    """
+    Times every call to RLApplicationEnv.step.
+    """
+    def __init__(self):
+        self.durations = []
+        self.original_step = None
+
+    def install(self, env_class):
+        recorder = self
+        original_step = self.original_step = env_class.step
+
+        def timed_step(env, action):
+            start = time.perf_counter()
+            try:
+                return original_step(env, action)
+            finally:
+                recorder.durations.append(time.perf_counter() - start)
+
+        env_class.step = timed_step
+
+    def uninstall(self, env_class):
+        env_class.step = self.original_step
+
+
+class StepBudgetTimer:
+    """
+    Replaces utils.utils.Timer in the algorithms: expires after a number of steps instead of minutes.
+    """
+    def __init__(self, recorder, budget):
+        self.recorder = recorder
+        self.budget = budget
+        self.start = time.perf_counter()
+
+    def time_elapsed_seconds(self):
+        return time.perf_counter() - self.start
+
+    def timer_expired(self):
+        return len(self.recorder.durations) >= self.budget
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb():
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def patch_timers(recorder, budget):
+    # every algorithm stops on its timer, the budget makes runs comparable
+    import algorithms.QLearnExploration
+    import algorithms.RandomExploration
+    import utils.TimerCallback
+    for module in (algorithms.QLearnExploration, algorithms.RandomExploration, utils.TimerCallback):
+        module.Timer = lambda timer=None: StepBudgetTimer(recorder, budget)
+
+
+def run_env(args, algo, app, device, launcher, work_dir):
+    from RL_application_env import RLApplicationEnv
+    coverage_dict = {}
+    exported_activities, services, receivers, providers, string_activities, package = app.analyze('', coverage_dict)
+    log_dir = work_dir / 'logs'
+    log_dir.mkdir(parents=True, exist_ok=True)
+    env = RLApplicationEnv(coverage_dict=coverage_dict, app_path=str(work_dir / 'synthetic.apk'),
+                           list_activities=list(coverage_dict.keys()), widget_list=[], bug_set=set(),
+                           coverage_dir=work_dir, log_dir=str(log_dir), rotation=False, internet=False,
+                           merdoso_button_menu=False, platform_name='Android', platform_version='9.0',
+                           udid=args.udid, instr_emma=False, instr_jacoco=False, instr_instruapk=True,
+                           method_locations=str(work_dir / f'{package}-locations.json'), timer_start=time.time(),
+                           algo=algo, coverage_report=work_dir, device_name='benchmark',
+                           exported_activities=exported_activities, services=services, receivers=receivers,
+                           is_headless=True, appium=launcher, emulator=None, package=package,
+                           pool_strings=str(RL_INTERACTION_DIR / 'strings.txt'), visited_activities=[],
+                           clicked_buttons=[], number_bugs=[], appium_port=launcher.port,
+                           max_episode_len=args.max_timesteps, string_activities=string_activities,
+                           OBSERVATION_SPACE=args.observation_space, settle=args.settle,
+                           reset_strategy=args.reset_strategy, log_format=args.log_format,
+                           log_streaming=args.log_streaming, fault_index=str(work_dir / 'faults.sqlite'))
+    try:
+        # a bounded replay buffer, SAC and DDPG allocate a million transitions by default
+        return make_algorithm(algo).explore(env, None, launcher, args.timesteps, 1,
+                                           learning_steps=min(args.learning_steps, args.timesteps // 2),
+                                           buffer_size=args.buffer_size, packed_replay=args.packed_replay)
+    finally:
+        env.close()
+
+
+def run_main(args, algo, app, device, launcher, work_dir):
+    import test_application
+    test_application.AppiumLauncher = lambda port: launcher
+    test_application.apk_analyzer.analyze = app.analyze
+    sys.argv = ['test_application.py', '--algo', algo, '--appium_port', str(launcher.port), '--real_device',
+                '--udid', args.udid, '--apps', str(work_dir / 'synthetic.apk'), '--iterations', '1',
+                '--timesteps', str(args.timesteps), '--max_timesteps', str(args.max_timesteps), '--timer', '1',
+                '--pool_strings', str(RL_INTERACTION_DIR / 'strings.txt'), '--instr_instruapk',
+                '--method_locations_path', str(work_dir / f'{app.package}-locations.json'),
+                '--coverage_report_path', str(work_dir / 'reports'), '--settle', args.settle,
+                '--reset_strategy', args.reset_strategy, '--log_format', args.log_format,
+                '--fault_index', str(work_dir / 'faults.sqlite')] + \
+        (['--log_streaming'] if args.log_streaming else []) + (['--packed_replay'] if args.packed_replay else [])
+    return test_application.main() == 0
+
+
+def percentile_ms(durations, q):
+    return float(np.percentile(durations, q) * 1000) if durations else 0.0
+
+
+def benchmark(args, algo, root):
+    work_dir = Path(tempfile.mkdtemp(prefix=f'{algo}-', dir=root))
+    state_dir = work_dir / 'device'
+    state_dir.mkdir()
+    app = SyntheticApp(activities=args.activities, widgets=args.widgets, methods=args.methods,
+                       crash_rate=args.crash_rate, dynamic_text=args.dynamic_text, seed=args.seed)
+    app.write_locations(work_dir / f'{app.package}-locations.json')
+    os.environ.update(fake_adb.install(str(root / 'sdk'), str(state_dir)))
+    device = FakeDevice(app, str(state_dir), seed=args.seed, transition=args.transition_ms / 1000,
+                        install_time=args.install_ms / 1000)
+    launcher = FakeAppiumLauncher(free_port(), device, latency=args.latency_ms / 1000)
+
+    from RL_application_env import RLApplicationEnv
+    recorder = StepRecorder()
+    recorder.install(RLApplicationEnv)
+    patch_timers(recorder, args.timesteps)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    try:
+        run = run_main if args.mode == 'main' else run_env
+        success = run(args, algo, app, device, launcher, work_dir)
+    finally:
+        elapsed = time.perf_counter() - start
+        os.chdir(cwd)
+        recorder.uninstall(RLApplicationEnv)
+        launcher.terminate()
+    durations = recorder.durations
+    commands = sum(launcher.server.commands.values())
+    return {
+        'algo': algo,
+        'success': bool(success),
+        'steps': len(durations),
+        'seconds': elapsed,
+        'steps_per_second': len(durations) / elapsed if elapsed else 0.0,
+        'step_ms_mean': float(np.mean(durations) * 1000) if durations else 0.0,
+        'step_ms_p50': percentile_ms(durations, 50),
+        'step_ms_p95': percentile_ms(durations, 95),
+        'step_ms_p99': percentile_ms(durations, 99),
+        'appium_commands_per_step': commands / max(len(durations), 1),
+        'crashes': device.crashes,
+        'rss_mb': rss_mb(),
+        'rss_delta_mb': rss_mb() - rss_before,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'max_rss_children_mb': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def print_report(results):
+    table = tt.Texttable(max_width=0)
+    columns = ['steps', 'steps_per_second', 'step_ms_p50', 'step_ms_p95', 'step_ms_p99', 'appium_commands_per_step',
+               'max_rss_mb']
+    table.header(['algo', 'result', 'steps', 'steps/s', 'p50 ms', 'p95 ms', 'p99 ms', 'cmds/step', 'max RSS MB'])
+    for result in results:
+        table.add_row([result['algo'], 'ok' if result['success'] else 'FAILED'] +
+                      [result[column] for column in columns])
+    print(table.draw())
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark of RLApplicationEnv with a fake Appium server and adb')
+    parser.add_argument('--algos', type=str, default=','.join(ALGORITHMS))
+    parser.add_argument('--mode', choices=['env', 'main'], default='env')
+    parser.add_argument('--timesteps', type=int, default=200)
+    parser.add_argument('--max_timesteps', type=int, default=50)
+    parser.add_argument('--learning_steps', type=int, default=100)
+    parser.add_argument('--observation_space', type=int, default=2000)
+    parser.add_argument('--activities', type=int, default=10)
+    parser.add_argument('--widgets', type=int, default=12)
+    parser.add_argument('--methods', type=int, default=3)
+    parser.add_argument('--crash_rate', type=float, default=0.01)
+    parser.add_argument('--dynamic_text', default=False, action='store_true')
+    parser.add_argument('--latency_ms', type=float, default=0.0, help='added to every Appium command')
+    parser.add_argument('--transition_ms', type=float, default=0.0, help='time the screen changes after an action')
+    parser.add_argument('--install_ms', type=float, default=0.0, help='time taken by a reinstall of the app')
+    parser.add_argument('--reset_strategy', choices=RESET_STRATEGIES, type=str, default='reinstall')
+    parser.add_argument('--settle', choices=['fixed', 'adaptive'], type=str, default='fixed')
+    parser.add_argument('--log_format', choices=['text', 'binary'], type=str, default='text')
+    parser.add_argument('--log_streaming', default=False, action='store_true')
+    parser.add_argument('--buffer_size', type=int, default=10000, help='replay buffer of SAC and DDPG, env mode')
+    parser.add_argument('--packed_replay', default=False, action='store_true')
+    parser.add_argument('--adb_executable', default=False, action='store_true',
+                        help='run device commands with the fake adb executable instead of the fake adb server')
+    parser.add_argument('--udid', type=str, default='emulator-5554')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    root = Path(tempfile.mkdtemp(prefix='ares-benchmark-'))
+    adb_server = None
+    if not args.adb_executable:
+        # device commands go through the host protocol, as with a real adb server
+        adb_server = FakeAdbServer().start()
+        os.environ['ANDROID_ADB_SERVER_PORT'] = str(adb_server.port)
+    results = []
+    for algo in args.algos.split(','):
+        if algo not in ALGORITHMS:
+            raise ValueError(f'algo must be one of {ALGORITHMS}')
+        results.append(benchmark(args, algo, root))
+    if adb_server is not None:
+        adb_server.stop()
+    print_report(results)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, indent=2)
+    return 0 if all(result['success'] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Startup cost of the device workers started by parallel_exec: time until test_application and the selected algorithm
+are imported, and memory of every worker, with the algorithms imported eagerly, lazily through the registry, or
+preloaded once in a forkserver. Run from the rl_interaction folder:
+
+    python -m benchmarks.startup_benchmark --algos random,SAC --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import texttable as tt
+
+from algorithms.registry import ALGORITHMS, get_algorithm_class, preload_modules
+from benchmarks import fake_adb
+
+MODES = ['eager', 'lazy', 'forkserver']
+# workers measure their memory once all of them are up, so that shared pages are split between them
+SETTLE_SECONDS = 1.0
+
+
+def memory_mb():
+    """
+    :return: (dict) resident, proportional (shared pages split between the processes) and private memory in MB
+    """
+    values = {}
+    with open('/proc/self/smaps_rollup') as file:
+        for line in file:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:', 'Private_Clean:', 'Private_Dirty:'):
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    return {'rss_mb': values.get('Rss', 0.0), 'pss_mb': values.get('Pss', 0.0),
+            'uss_mb': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0)}
+
+
+def load(algo, eager):
+    import test_application  # noqa: F401
+    for name in (ALGORITHMS if eager else [algo]):
+        get_algorithm_class(name)
+
+
+def worker(algo, eager, started, queue):
+    load(algo, eager)
+    startup = time.time() - started
+    time.sleep(SETTLE_SECONDS)
+    queue.put(dict(startup_s=startup, **memory_mb()))
+
+
+def interpreter_worker(algo, eager, started):
+    # body of the `python -c` workers
+    load(algo, eager)
+    startup = time.time() - started
+    time.sleep(SETTLE_SECONDS)
+    print(json.dumps(dict(startup_s=startup, **memory_mb())))
+
+
+def run_interpreters(algo, eager, workers):
+    code = f'from benchmarks.startup_benchmark import interpreter_worker; ' \
+           f'interpreter_worker({algo!r}, {eager!r}, {time.time()!r})'
+    processes = [subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                 for _ in range(workers)]
+    return [json.loads(process.communicate()[0].decode().strip().splitlines()[-1]) for process in processes]
+
+
+def run_forkserver(algo, workers):
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(preload_modules([algo]))
+    # the forkserver starts with the first process, its own import time is part of the campaign start
+    start = time.time()
+    warmup = context.Process(target=time.sleep, args=(0,))
+    warmup.start()
+    warmup.join()
+    preload = time.time() - start
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(algo, False, time.time(), queue)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return results, preload
+
+
+def forkserver_interpreter(algo, workers):
+    # the preload list only applies when the forkserver starts, every algorithm gets a campaign of its own
+    results, preload = run_forkserver(algo, workers)
+    print(json.dumps({'results': results, 'preload': preload}))
+
+
+def run_forkserver_campaign(algo, workers):
+    code = f'from benchmarks.startup_benchmark import forkserver_interpreter; ' \
+           f'forkserver_interpreter({algo!r}, {workers!r})'
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    measure = json.loads(output.decode().strip().splitlines()[-1])
+    return measure['results'], measure['preload']
+
+
+def summarize(mode, algo, results, preload=0.0):
+    count = len(results)
+    return {'mode': mode, 'algo': algo, 'workers': count, 'preload_s': preload,
+            'startup_s': sum(result['startup_s'] for result in results) / count,
+            'rss_mb': sum(result['rss_mb'] for result in results) / count,
+            'pss_mb': sum(result['pss_mb'] for result in results) / count,
+            'uss_mb': sum(result['uss_mb'] for result in results) / count,
+            'total_pss_mb': sum(result['pss_mb'] for result in results)}
+
+
+def print_report(results):
+    table = tt.Texttable(max_width=0)
+    columns = ['mode', 'algo', 'workers', 'preload_s', 'startup_s', 'rss_mb', 'pss_mb', 'uss_mb', 'total_pss_mb']
+    table.header(['mode', 'algo', 'workers', 'preload s', 'startup s', 'RSS MB', 'PSS MB', 'private MB',
+                  'total PSS MB'])
+    for result in results:
+        table.add_row([result[column] for column in columns])
+    print(table.draw())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Startup time and memory of the parallel_exec device workers')
+    parser.add_argument('--algos', type=str, default='random,SAC')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--modes', type=str, default=','.join(MODES))
+    parser.add_argument('--output', type=str, default=None)
+    args = parser.parse_args(argv)
+    # RL_application_env looks for adb at import time
+    os.environ.update(fake_adb.install(tempfile.mkdtemp(prefix='ares-sdk-'), tempfile.mkdtemp(prefix='ares-adb-')))
+    results = []
+    for algo in args.algos.split(','):
+        for mode in args.modes.split(','):
+            if mode == 'forkserver':
+                results.append(summarize(mode, algo, *run_forkserver_campaign(algo, args.workers)))
+            else:
+                results.append(summarize(mode, algo, run_interpreters(algo, mode == 'eager', args.workers)))
+    print_report(results)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({'arguments': vars(args), 'results': results}, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
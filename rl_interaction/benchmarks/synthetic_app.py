@@ -0,0 +1,137 @@
+import json
+import random
+from xml.sax.saxutils import quoteattr
+
+SCREEN_WIDTH = 1080
+SCREEN_HEIGHT = 1920
+WIDGET_HEIGHT = 70
+# class, clickable, long-clickable, scrollable
+WIDGET_KINDS = [('android.widget.Button', 'true', 'false', 'false'),
+                ('android.widget.ImageButton', 'true', 'false', 'false'),
+                ('android.widget.EditText', 'true', 'false', 'false'),
+                ('android.widget.LinearLayout', 'true', 'true', 'false'),
+                ('android.widget.ListView', 'false', 'false', 'true')]
+WIDGET_WEIGHTS = [50, 15, 15, 10, 10]
+NODE_ATTRIBUTES = ['index', 'package', 'class', 'text', 'resource-id', 'content-desc', 'checkable', 'checked',
+                   'clickable', 'enabled', 'focusable', 'focused', 'long-clickable', 'password', 'scrollable',
+                   'selected', 'bounds', 'displayed']
+
+
+class SyntheticWidget:
+    def __init__(self, index, class_name, clickable, long_clickable, scrollable, resource_id, text, bounds, target,
+                 methods):
+        self.index = index
+        self.class_name = class_name
+        self.clickable = clickable
+        self.long_clickable = long_clickable
+        self.scrollable = scrollable
+        self.resource_id = resource_id
+        self.text = text
+        self.bounds = bounds
+        # activity opened by the widget, None if it stays on the same screen
+        self.target = target
+        # instrumented methods called when the widget is used
+        self.methods = methods
+
+
+class SyntheticApp:
+    """
+    Deterministic app model served by the fake Appium server: every activity has a fixed screen of widgets, using a
+    widget calls a few instrumented methods and may open another activity or crash the app.
+    :param package: (str) package name of the app
+    :param activities: (int) number of activities
+    :param widgets: (int) widgets on every screen
+    :param methods: (int) instrumented methods called by every widget
+    :param crash_rate: (float) probability that using a widget crashes the app
+    :param link_rate: (float) probability that a widget opens another activity
+    :param dynamic_text: (bool) screens show a counter that changes at every command, like a clock would
+    :param seed: (int) seed of the app layout
+    """
+    def __init__(self, package='com.ares.synthetic', activities=10, widgets=12, methods=3, crash_rate=0.01,
+                 link_rate=0.3, dynamic_text=False, seed=0):
+        rng = random.Random(seed)
+        self.package = package
+        self.crash_rate = crash_rate
+        self.dynamic_text = dynamic_text
+        self.activities = [f'{package}.ui.Activity{i}' for i in range(activities)]
+        # method id -> (file name, smali path)
+        self.methods = {}
+        self.screens = []
+        package_path = package.replace('.', '/')
+        for activity_index, activity in enumerate(self.activities):
+            screen = []
+            file_name = f'Activity{activity_index}.java'
+            for index in range(widgets):
+                class_name, clickable, long_clickable, scrollable = rng.choices(WIDGET_KINDS, WIDGET_WEIGHTS)[0]
+                top = 200 + index * (WIDGET_HEIGHT + 10)
+                target = rng.randrange(activities) if rng.random() < link_rate else None
+                widget_methods = []
+                for _ in range(methods):
+                    method_id = str(len(self.methods))
+                    self.methods[method_id] = (file_name, f'smali/{package_path}/ui/Activity{activity_index}.smali')
+                    widget_methods.append(method_id)
+                # a quarter of the widgets has no resource-id, their identifier falls back to the text
+                resource_id = '' if index % 4 == 3 else f'{package}:id/widget_{activity_index}_{index}'
+                screen.append(SyntheticWidget(index, class_name, clickable, long_clickable, scrollable, resource_id,
+                                              f'Item {index}', f'[40,{top}][{SCREEN_WIDTH - 40},{top + WIDGET_HEIGHT}]',
+                                              target, widget_methods))
+            self.screens.append(screen)
+        self.page_templates = [self.render(activity_index) for activity_index in range(activities)]
+
+    def node(self, class_name, index, bounds, children='', **attributes):
+        values = {'index': str(index), 'package': self.package, 'class': class_name, 'text': '', 'resource-id': '',
+                  'content-desc': '', 'checkable': 'false', 'checked': 'false', 'clickable': 'false',
+                  'enabled': 'true', 'focusable': 'false', 'focused': 'false', 'long-clickable': 'false',
+                  'password': 'false', 'scrollable': 'false', 'selected': 'false', 'bounds': bounds,
+                  'displayed': 'true'}
+        values.update(attributes)
+        attrs = ' '.join(f'{name}={quoteattr(values[name])}' for name in NODE_ATTRIBUTES)
+        return f'<{class_name} {attrs}>{children}</{class_name}>'
+
+    def render(self, activity_index):
+        widgets = []
+        for widget in self.screens[activity_index]:
+            children = ''
+            text = widget.text
+            if widget.class_name == 'android.widget.LinearLayout':
+                # the label is in a child TextView, as in most list items
+                children = self.node('android.widget.TextView', 0, widget.bounds, text=widget.text)
+                text = ''
+            widgets.append(self.node(widget.class_name, widget.index, widget.bounds, children, text=text,
+                                     clickable=widget.clickable, focusable=widget.clickable,
+                                     scrollable=widget.scrollable, **{'resource-id': widget.resource_id,
+                                                                      'long-clickable': widget.long_clickable}))
+        status = self.node('android.widget.TextView', 0, '[0,100][1080,180]', text='{status}')
+        content = self.node('android.widget.LinearLayout', 0, f'[0,100][{SCREEN_WIDTH},{SCREEN_HEIGHT}]',
+                            status + ''.join(widgets))
+        frame = self.node('android.widget.FrameLayout', 0, f'[0,0][{SCREEN_WIDTH},{SCREEN_HEIGHT}]', content)
+        # braces of the template are only those of the status placeholder
+        frame = frame.replace('{', '{{').replace('}', '}}').replace('{{status}}', '{status}')
+        return "<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>" \
+               f'<hierarchy index="0" class="hierarchy" rotation="0" width="{SCREEN_WIDTH}" ' \
+               f'height="{SCREEN_HEIGHT}">{frame}</hierarchy>'
+
+    def page_source(self, activity_index, counter=0, loading=False):
+        if loading:
+            status = f'Loading {counter}'
+        else:
+            status = f'Updated {counter}' if self.dynamic_text else 'Ready'
+        return self.page_templates[activity_index].format(status=status)
+
+    def analyze(self, apk_path, coverage_dict_template, cache_dir=None):
+        """
+        Same result as utils.apk_analyzer.analyze for the synthetic app.
+        """
+        for activity in self.activities:
+            coverage_dict_template.update({activity: {'visited': False}})
+        return list(self.activities), [], [], [], '*', self.package
+
+    def locations(self):
+        # InstruAPK *-locations.json content
+        return {method_id: {'fileName': file_name, 'filePath': file_path}
+                for method_id, (file_name, file_path) in self.methods.items()}
+
+    def write_locations(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.locations(), file)
+        return path
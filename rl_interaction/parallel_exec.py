@@ -3,8 +3,13 @@ import os
 from pathlib import Path
 import platform
 import subprocess
+import sys
 import argparse
-from itertools import zip_longest
+import multiprocessing
+
+from algorithms.registry import algorithm_names, preload_modules
+from utils.apk_analyzer import preanalyze
+from utils.scheduler import CampaignJournal, CampaignScheduler, Unit
 
 
 def close_old_appium_services():
@@ -20,6 +25,13 @@ def close_old_appium_services():
         os.system('adb start-server')
 
 
+def run_test_application(argv):
+    # runs in a child of the forkserver, the modules preloaded there are already imported
+    import test_application
+    sys.argv = argv
+    sys.exit(test_application.main())
+
+
 def main():
     parser = argparse.ArgumentParser()
     # list of emulators
@@ -45,7 +57,7 @@ def main():
     # how many times do you want to repeat the test ?
     parser.add_argument('--iterations', type=int, default=10)
     # choose one
-    parser.add_argument('--algo', choices=['SAC', 'random', 'Q',"DDPG"], type=str, required=True)
+    parser.add_argument('--algo', choices=algorithm_names(), type=str, required=True)
     # in case you want to test using timesteps
     parser.add_argument('--timesteps', type=int, required=True)
     # enable if you want to use rotation
@@ -61,6 +73,30 @@ def main():
     parser.add_argument('--trials_per_app', type=str, default=3)
     parser.add_argument('--method_locations_path', type=str, default="org.sudowars-locations.json")
     parser.add_argument('--coverage_report_path', type=str, default="./reports/")
+    # keep one logcat process per device instead of dumping the whole buffer on every read (InstruAPK)
+    parser.add_argument('--log_streaming', default=False, action='store_true')
+    parser.add_argument('--log_format', choices=['text', 'binary'], type=str, default='text')
+    # shared by every device of the campaign, and by the next campaigns
+    parser.add_argument('--fault_index', type=str, default=os.path.join('logs', 'faults.sqlite'))
+    # SAC/DDPG gradient updates in a learner thread, overlapped with the device latency
+    parser.add_argument('--async_learner', default=False, action='store_true')
+    parser.add_argument('--packed_replay', default=False, action='store_true')
+    # transitions recorded for the offline simulator (simulate.py)
+    parser.add_argument('--record_session', default=False, action='store_true')
+    parser.add_argument('--settle', choices=['fixed', 'adaptive'], type=str, default='fixed')
+    parser.add_argument('--screen_cache', type=int, default=256)
+    parser.add_argument('--q_memory_mb', type=float, default=None)
+    parser.add_argument('--reset_strategy', choices=['reinstall', 'clear', 'relaunch', 'relaunch_exported'], type=str,
+                        default='reinstall')
+    # resumable record of the campaign, units already done in it are skipped
+    parser.add_argument('--journal', type=str, default='campaign_journal.jsonl')
+    # attempts of an (app, cycle) unit after its first failure, on another device when possible
+    parser.add_argument('--max_retries', type=int, default=2)
+    # manifests of the apks, analyzed in a process pool before the devices start
+    parser.add_argument('--apk_cache', type=str, default='apk_cache')
+    # 'forkserver' imports torch, stable_baselines3 and the environment once, the device workers are forked from it
+    # and share those pages copy-on-write; 'subprocess' starts a new interpreter per unit
+    parser.add_argument('--workers', choices=['subprocess', 'forkserver'], type=str, default='subprocess')
 
     args = parser.parse_args()
     algo = args.algo
@@ -83,11 +119,7 @@ def main():
     appium_ports = [int(p) for p in args.appium_ports.split(" ")]
     android_ports = [int(a_p) for a_p in args.android_ports.split(" ")]
     path = args.path
-    apps = glob.glob(f'{path}{os.sep}*.apk')
-    app_lists = [list(i) for i in zip_longest(*[apps[i:i + len(android_ports)]
-                                                for i in range(0, len(apps), len(android_ports))])]
-    for i in range(len(app_lists)):
-        app_lists[i] = ','.join(list(filter(None, app_lists[i])))
+    apps = sorted(glob.glob(f'{path}{os.sep}*.apk'))
     timer = args.timer
     timesteps = args.timesteps
     max_timesteps = args.max_timesteps
@@ -103,26 +135,23 @@ def main():
         for port in android_ports:
             udids.append(f'emulator-{port}')
 
-    # print everyting to the console
-    # Set app path
-    processes = []
-    for i in range(len(device_names)):
-        
-        app = Path(app_lists[i])
-        covreport = Path(args.coverage_report_path)
-        methodlocs = Path(args.method_locations_path)
-        pool = Path(pool_strings)
-        
-        py = "python"
-        script = 'rl_interaction\\test_application.py'
-        cmd = [py, script, '--algo', algo, '--appium_port',
-               str(appium_ports[i]), '--timesteps', str(timesteps), '--iterations', str(iterations),
-               '--udid', str(udids[i]), '--android_port', str(android_ports[i]), '--device_name', device_names[i],
-               '--apps', str(app.resolve()), '--max_timesteps', str(max_timesteps), '--pool_strings', str(pool.resolve()),
-               '--timer', str(timer), '--platform_version', android_v, '--trials_per_app', str(trials_per_app),
-               '--menu']
+    covreport = Path(args.coverage_report_path)
+    methodlocs = Path(args.method_locations_path)
+    pool = Path(pool_strings)
+    for name, file in [('strings', pool), ('method locations', methodlocs)]:
+        if not file.is_file():
+            print(f'{name}: path {file.absolute()} not found')
+    devices = {device_names[i]: i for i in range(len(device_names))}
 
-        
+    def build_command(i, unit):
+        script = os.path.join('rl_interaction', 'test_application.py')
+        cmd = [sys.executable, script, '--algo', algo, '--appium_port',
+               str(appium_ports[i]), '--timesteps', str(timesteps), '--iterations', '1',
+               '--first_cycle', str(unit.cycle), '--keep_emulator',
+               '--udid', str(udids[i]), '--android_port', str(android_ports[i]), '--device_name', device_names[i],
+               '--apps', str(Path(unit.app).resolve()), '--max_timesteps', str(max_timesteps),
+               '--pool_strings', str(pool.resolve()), '--timer', str(timer), '--platform_version', android_v,
+               '--trials_per_app', str(trials_per_app), '--menu']
         if emu is not None:
             cmd = cmd + ['--emu', emu]
         if instr_jacoco:
@@ -135,42 +164,69 @@ def main():
             cmd.append('--internet')
         if save_policy:
             cmd.append('--save_policy')
-        if save_policy:
+        if reload_policy:
             cmd.append('--reload_policy')
         if real_device:
             cmd.append('--real_device')
         if instr_instruapk:
             cmd.append('--instr_instruapk')
+        if args.log_streaming:
+            cmd.append('--log_streaming')
+        cmd.append('--log_format')
+        cmd.append(args.log_format)
+        cmd.append('--fault_index')
+        cmd.append(args.fault_index)
+        if args.async_learner:
+            cmd.append('--async_learner')
+        if args.packed_replay:
+            cmd.append('--packed_replay')
+        if args.record_session:
+            cmd.append('--record_session')
+        cmd.append('--settle')
+        cmd.append(args.settle)
+        cmd.append('--screen_cache')
+        cmd.append(str(args.screen_cache))
+        if args.q_memory_mb is not None:
+            cmd.append('--q_memory_mb')
+            cmd.append(str(args.q_memory_mb))
+        cmd.append('--reset_strategy')
+        cmd.append(args.reset_strategy)
+        cmd.append('--apk_cache')
+        cmd.append(str(Path(args.apk_cache).resolve()))
         cmd.append('--method_locations_path')
         cmd.append(str(methodlocs.resolve()))
         cmd.append('--coverage_report_path')
-        cmd.append(str(covreport.resolve())+"\\")
+        cmd.append(str(covreport.resolve()) + os.sep)
+        return cmd
 
-        
-        if app.is_file():
-            print(f'{device_names[i]} is running {app.absolute()}')
-        else:
-            print(f'path {app.absolute()} not found')
-        if pool.is_file():
-            print(f'{device_names[i]} is running {pool.absolute()}')
-        else:
-            print(f'path {pool.absolute()} not found')
-        if covreport.is_dir():
-            print(f'{device_names[i]} is running {covreport.absolute()}')
-        else:
-            print(f'path {covreport.absolute()} not found')
-        if methodlocs.is_file():
-            print(f'{device_names[i]} is running {methodlocs.absolute()}')
-        else:
-            print(f'path {methodlocs.absolute()} not found')
-        
+    if args.workers == 'forkserver':
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(preload_modules([algo]))
+
+    def run_unit(device, unit):
+        cmd = build_command(devices[device], unit)
         print(cmd)
-        # stdout = subprocess.check_output(cmd, cwd=os.getcwd(), shell=True)
-        # print(process.decode('utf-8'))
-        processes.append(subprocess.Popen(cmd, cwd=os.getcwd(), shell=True))
+        if args.workers == 'forkserver':
+            process = context.Process(target=run_test_application, args=(cmd[1:],), name=f'ares-{device}')
+            process.start()
+            process.join()
+            return process.exitcode == 0
+        return subprocess.run(cmd, cwd=os.getcwd()).returncode == 0
 
-    exit_codes = [p.wait() for p in processes]
+    manifests = preanalyze(apps, args.apk_cache)
+    print(f'{len(manifests)} of {len(apps)} apks analyzed, cache in {args.apk_cache}')
+    # (app, cycle) units pulled by the devices as soon as they are free, cycle by cycle
+    units = [Unit(app, cycle) for cycle in range(iterations) for app in apps]
+    scheduler = CampaignScheduler(units, device_names, run_unit, CampaignJournal(args.journal),
+                                  max_retries=args.max_retries, ordered_cycles=reload_policy)
+    done, abandoned = scheduler.run()
+    print(f'{len(done)} units done, {len(abandoned)} abandoned, journal in {args.journal}')
+    if not real_device:
+        # the emulators were kept up between the units
+        for port in android_ports:
+            subprocess.run(['adb', '-s', f'emulator-{port}', 'emu', 'kill'])
+    return 1 if abandoned else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import argparse
+import time
+
+from loguru import logger
+
+from algorithms.registry import algorithm_names, make_algorithm
+from simulated_application_env import SimulatedApplicationEnv, FALLBACK_POLICIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs an exploration algorithm on the UI graph recorded with '
+                                                 '--record_session, without devices')
+    parser.add_argument('--sessions', type=str, required=True, help='comma separated session.jsonl files')
+    parser.add_argument('--algo', choices=algorithm_names(), type=str, required=True)
+    parser.add_argument('--timesteps', type=int, default=10000)
+    parser.add_argument('--timer', type=int, default=60)
+    parser.add_argument('--max_timesteps', type=int, default=None)
+    parser.add_argument('--learning_steps', type=int, default=250)
+    parser.add_argument('--fallback', choices=FALLBACK_POLICIES, type=str, default='stay')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--async_learner', default=False, action='store_true')
+    parser.add_argument('--packed_replay', default=False, action='store_true')
+    args = parser.parse_args()
+
+    app = SimulatedApplicationEnv(args.sessions.split(','), fallback=args.fallback,
+                                  max_episode_len=args.max_timesteps, seed=args.seed)
+    algorithm = make_algorithm(args.algo)
+    start = time.perf_counter()
+    flag = algorithm.explore(app, None, None, args.timesteps, args.timer, learning_steps=args.learning_steps,
+                             async_learner=args.async_learner, packed_replay=args.packed_replay)
+    elapsed = time.perf_counter() - start
+    app.close()
+    logger.info(f'{args.algo}: {app.total_steps} steps in {elapsed:.1f}s ({app.total_steps / elapsed:.0f} steps/s), '
+                f'{len(app.visited_activities)} of {len(app.list_activities)} activities visited')
+    return 0 if flag else 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,208 @@
+import random
+from collections import defaultdict
+
+import numpy
+from gym import Env
+from gym import spaces
+from loguru import logger
+
+from utils.observation import ObservationEncoder
+from utils.session_recorder import read_session
+
+FALLBACK_POLICIES = ['stay', 'back', 'random', 'reset']
+EDIT_TEXT_CLASS = 'android.widget.EditText'
+
+
+def action_key(widgets, session, action):
+    """
+    Part of an action that decides its outcome, the other components are ignored by RLApplicationEnv.
+    :param widgets: (list) widgets of the screen the action is executed on
+    :param session: (dict) session record of the recording
+    :param action: (list) action as received by `step`
+    :return: (tuple)
+    """
+    a0, a1, a2 = action
+    shift = session['shift']
+    if a0 < shift:
+        if a0 == session['intent_action'] and session['intents'] > 0:
+            return a0, a1 % session['intents'], 0
+        return a0, 0, 0
+    if len(widgets) == 0:
+        # touch action, the coordinates come from the first two components
+        return a0, a1, 0
+    widget = widgets[a0 - shift]
+    if widget['class_name'] == EDIT_TEXT_CLASS:
+        return a0, a1, 0
+    if widget['long-clickable'] == 'true' or widget['scrollable'] == 'true':
+        return a0, 0, a2
+    return a0, 0, 0
+
+
+class SimulatedApplicationEnv(Env):
+    """
+    Replays the UI graph recorded by RLApplicationEnv (`--record_session`) without Appium. Spaces, observations,
+    rewards and termination follow RLApplicationEnv, transitions are sampled among the recorded outcomes of the
+    same action on the same screen.
+    :param sessions: (list) session.jsonl files recorded on the same app
+    :param fallback: (str) outcome of an action never recorded on a screen: 'stay' on the screen, go 'back' to the
+        previous screen, jump to a 'random' recorded screen or 'reset' the episode
+    :param max_episode_len: (int) overrides the episode length of the recording
+    :param seed: (int) seed of the transition sampling
+    """
+    def __init__(self, sessions, fallback='stay', max_episode_len=None, seed=None):
+        if fallback not in FALLBACK_POLICIES:
+            raise ValueError(f'fallback must be one of {FALLBACK_POLICIES}')
+        self.fallback = fallback
+        self.rng = random.Random(seed)
+        self.session = None
+        self.widgets = {}
+        self.activities = {}
+        self.initial_states = []
+        transitions = []
+        for path in sessions:
+            for record in read_session(path):
+                if record['type'] == 'session':
+                    if self.session is None:
+                        self.session = record
+                    elif record['package'] != self.session['package']:
+                        raise ValueError(f'{path} was recorded on {record["package"]}, '
+                                         f'not on {self.session["package"]}')
+                elif record['type'] == 'state':
+                    self.widgets.setdefault(record['state'], record['widgets'])
+                    self.activities.setdefault(record['state'], record['activity'])
+                elif record['type'] == 'reset':
+                    self.initial_states.append(record['state'])
+                elif record['type'] == 'transition':
+                    transitions.append(record)
+        if self.session is None or not self.initial_states:
+            raise ValueError('No recorded session found')
+
+        self.OBSERVATION_SPACE = self.session['observation_space']
+        self.ACTION_SPACE = self.session['action_space']
+        self.shift = self.session['shift']
+        self._max_episode_steps = max_episode_len or self.session['max_episode_len']
+        self.list_activities = list(self.session['activities'])
+        self.widget_list = []
+        self.encoder = ObservationEncoder(self.list_activities, self.widget_list, self.OBSERVATION_SPACE)
+
+        # Recorded outcomes of every (screen, action)
+        self.graph = defaultdict(list)
+        for record in transitions:
+            widgets = self.widgets[record['state']]
+            if record['action'][0] >= self.action_space_size(widgets):
+                continue
+            key = (record['state'], action_key(widgets, self.session, record['action']))
+            self.graph[key].append((record['next_state'], record['bug'], record['outside'], record['terminal']))
+
+        # Observations do not depend on the episode, they are computed once per screen
+        self.observations = {}
+        self.observation_indices_cache = {}
+        for state, widgets in self.widgets.items():
+            for widget in widgets:
+                self.encoder.add_widget(widget['identifier'])
+        for state, widgets in self.widgets.items():
+            self.observations[state] = self.encoder.encode(self.activities[state],
+                                                           [widget['identifier'] for widget in widgets]).copy()
+            self.observation_indices_cache[state] = self.encoder.active
+        self.states = list(self.widgets)
+        logger.info(f'Simulating {self.session["package"]}: {len(self.states)} screens, '
+                    f'{len(self.graph)} recorded actions')
+
+        self.action_space = spaces.Box(low=numpy.array([0, 0, 0]),
+                                       high=numpy.array([self.ACTION_SPACE, self.session['strings'] - 1, 1]),
+                                       dtype=numpy.int64)
+        self.observation_space = spaces.Box(low=0, high=1, shape=(self.OBSERVATION_SPACE,), dtype=numpy.int32)
+        self.instr = False
+        self.coverage_count = -1
+        self.timesteps = 0
+        self.total_steps = 0
+        self.unseen_transitions = 0
+        self.visited_activities = set()
+        self.bug = False
+        self.history = []
+        self.reset()
+        self.coverage_count = -1
+
+    def action_space_size(self, widgets):
+        return len(widgets) + self.shift if widgets else self.ACTION_SPACE
+
+    def set_state(self, state):
+        self.state = state
+        self.observation = self.observations[state]
+        self.observation_indices = self.observation_indices_cache[state]
+        self.action_space.high[0] = self.action_space_size(self.widgets[state])
+
+    def step(self, action_number):
+        action_number = numpy.asarray(action_number).astype(int)
+        if action_number[0] >= self.action_space.high[0]:
+            return self.observation, numpy.array([-50.0]), numpy.array(False), {}
+        self.timesteps += 1
+        self.total_steps += 1
+        outcomes = self.graph.get((self.state, action_key(self.widgets[self.state], self.session,
+                                                          action_number.tolist())))
+        if outcomes:
+            next_state, self.bug, outside, terminal = self.rng.choice(outcomes)
+        else:
+            next_state, self.bug, outside, terminal = self.fallback_outcome()
+        if next_state != self.state and not (self.fallback == 'back' and not outcomes):
+            self.history.append(self.state)
+        self.set_state(next_state)
+        if outside:
+            return self.observation, numpy.array([-100.0]), numpy.array(terminal), {}
+        if not self.bug and self.activities[next_state] != self.current_activity:
+            self.old_activity = self.current_activity
+            self.current_activity = self.activities[next_state]
+            self.visited_activities.add(self.current_activity)
+        reward = self.compute_reward()
+        done = terminal or self.timesteps >= self._max_episode_steps
+        if done:
+            self.bug = False
+        return self.observation, numpy.array([reward]), numpy.array(done), {}
+
+    def fallback_outcome(self):
+        self.unseen_transitions += 1
+        if self.fallback == 'back' and self.history:
+            return self.history.pop(), False, False, False
+        if self.fallback == 'random':
+            return self.rng.choice(self.states), False, False, False
+        return self.state, False, False, self.fallback == 'reset'
+
+    def compute_reward(self):
+        MAX_REWARD = 1000.0
+        if self.bug:
+            return MAX_REWARD
+        if self.old_activity != self.current_activity:
+            if self.current_activity not in self.set_activities_episode:
+                self.set_activities_episode.add(self.current_activity)
+                return MAX_REWARD
+            else:
+                return 0.0
+        else:
+            return -1.0
+
+    def reset(self):
+        self.coverage_count += 1
+        self.timesteps = 0
+        self.bug = False
+        self.history = []
+        self.set_state(self.rng.choice(self.initial_states))
+        self.current_activity = self.activities[self.state]
+        self.visited_activities.add(self.current_activity)
+        self.old_activity = self.current_activity
+        self.set_activities_episode = {self.current_activity}
+        return self.observation
+
+    def check_activity(self):
+        return False, False
+
+    def get_action_space(self):
+        return list(self.action_space.high)
+
+    def get_observation_space(self):
+        return list(self.observation_space.shape)
+
+    def collect_coverage(self):
+        self.coverage_count += 1
+
+    def close(self):
+        logger.info(f'{self.unseen_transitions} unseen transitions handled with the {self.fallback} fallback')
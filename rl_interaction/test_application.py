@@ -1,24 +1,23 @@
 import argparse
 import logging
 import os
+import sys
 from pathlib import Path
 from re import sub
 import time
 import warnings
 
-# from rl_interaction.algorithms.DDPGExploration import DDPGAlgorithm
-from algorithms.DDPGExploration import DDPGAlgorithm
-from algorithms.QLearnExploration import QLearnAlgorithm
-from algorithms.SACExploration import SACAlgorithm
-from algorithms.RandomExploration import RandomAlgorithm
+# algorithms are imported when selected, torch and stable_baselines3 are only loaded by SAC and DDPG
+from algorithms.registry import algorithm_names, get_algorithm_class
 # from rl_interaction.algorithms.TD3Exploration import TD3Algorithm
 # from rl_interaction.algorithms.TestApp import TestApp
 import pickle
 from utils.utils import AppiumLauncher, EmulatorLauncher, Utils
+from utils.app_reset import RESET_STRATEGIES
 from RL_application_env import RLApplicationEnv
 # from rl_interaction.utils.utils import AppiumLauncher, EmulatorLauncher, Utils
 # from rl_interaction.RL_application_env import RLApplicationEnv
-from selenium.common.exceptions import InvalidSessionIdException, WebDriverException
+from selenium.common.exceptions import WebDriverException
 from utils import apk_analyzer
 from loguru import logger
 import subprocess
@@ -59,7 +58,7 @@ def main():
     parser.add_argument('--rotation', default=False, action='store_true')
     parser.add_argument('--internet', default=False, action='store_true')
     parser.add_argument('--menu', default=False, action='store_true')
-    parser.add_argument('--algo', choices=['SAC', 'random', 'Q', 'DDPG'], type=str, required=True)
+    parser.add_argument('--algo', choices=algorithm_names(), type=str, required=True)
     parser.add_argument('--emu', choices=['normal', 'headless'], type=str, required=False, default='normal')
     parser.add_argument('--appium_port', type=int, required=True)
     parser.add_argument('--platform_name', choices=['Android', 'iOS'], type=str, default='Android')
@@ -74,6 +73,34 @@ def main():
     parser.add_argument('--trials_per_app', type=int, default=3)
     parser.add_argument('--method_locations_path', type=str)
     parser.add_argument('--coverage_report_path', type=str, default="./reports/")
+    parser.add_argument('--observation_overflow', choices=['hash', 'drop'], type=str, default='hash')
+    parser.add_argument('--log_streaming', default=False, action='store_true')
+    # 'binary' streams `logcat -B` and decodes the records in bulk (InstruAPK)
+    parser.add_argument('--log_format', choices=['text', 'binary'], type=str, default='text')
+    # faults of every run keyed by a normalized stack signature, '' to disable it
+    parser.add_argument('--fault_index', type=str, default=os.path.join('logs', 'faults.sqlite'))
+    # "udid,appium_port,android_port,device_name ..." devices driven together by one SAC/DDPG learner
+    parser.add_argument('--vec_devices', type=str, default=None)
+    # SAC/DDPG gradient updates run in a learner thread while the device executes the actions
+    parser.add_argument('--async_learner', default=False, action='store_true')
+    parser.add_argument('--max_update_ratio', type=float, default=None)
+    # SAC/DDPG replay buffer with bit-packed observations
+    parser.add_argument('--packed_replay', default=False, action='store_true')
+    # Q-learning evicts the least recently visited states beyond this size
+    parser.add_argument('--q_memory_mb', type=float, default=None)
+    # saves every transition in <log_dir>/session.jsonl, replayed offline by simulate.py
+    parser.add_argument('--record_session', default=False, action='store_true')
+    # wait a fixed time after each action, or until the UI settles
+    parser.add_argument('--settle', choices=['fixed', 'adaptive'], type=str, default='fixed')
+    # parsed screens kept in memory, 0 parses every new screen
+    parser.add_argument('--screen_cache', type=int, default=256)
+    # reinstall the app at every episode, or clear its data, or just restart it
+    parser.add_argument('--reset_strategy', choices=RESET_STRATEGIES, type=str, default='reinstall')
+    # used by the parallel_exec scheduler: one app and cycle per run, the emulator stays up between runs
+    parser.add_argument('--first_cycle', type=int, default=0)
+    parser.add_argument('--keep_emulator', default=False, action='store_true')
+    # manifests analyzed once per apk (SHA-256), shared by every run
+    parser.add_argument('--apk_cache', type=str, default='apk_cache')
 
     args = parser.parse_args()
 
@@ -133,33 +160,46 @@ def main():
     my_log = logger.add(os.path.join('logs', 'logger.log'), format="{time} {level} {message}",
                         filter=lambda record: record["level"].name == "INFO" or "ERROR")
 
-    appium = AppiumLauncher(appium_port)
-    if real_device:
+    # In vectorized mode every device worker starts its own Appium server and emulator
+    vec_devices = []
+    if args.vec_devices:
+        if algo not in ['SAC', 'DDPG']:
+            parser.error('--vec_devices is only supported by SAC and DDPG')
+        from utils.vec_env import make_device_vec_env, merge_device_bookkeeping, parse_device_specs
+        vec_devices = parse_device_specs(args.vec_devices)
+    start = time.perf_counter()
+    algorithm_class = get_algorithm_class(algo)
+    logger.info(f'{algo} loaded in {time.perf_counter() - start:.2f} s')
+
+    appium = None if vec_devices else AppiumLauncher(appium_port)
+    if real_device or vec_devices:
         emulator = None
     else:
-        emulator = EmulatorLauncher(emu, device_name, android_port)
+        emulator = EmulatorLauncher(emu, device_name, android_port, reuse=args.keep_emulator)
 
+    failures = 0
     if len(apps) == 0:
         raise Exception(f'The folder is empty or the path is wrong')
         exit()
     for application in apps:
         app_name = os.path.basename(os.path.splitext(application)[0])
         logger.info(f'now testing: {app_name}\n')
-        cycle = 0
+        cycle = args.first_cycle
         trial = 0
         coverage_dict_template = {}
         try:
             exported_activities, services, receivers, providers, string_activities, my_package = apk_analyzer.analyze(
                 application,
-                coverage_dict_template)
+                coverage_dict_template, cache_dir=args.apk_cache)
             ready = True
         except Exception as e:
             logger.error(f'{e} at app: {application}')
             ready = False
+            failures += 1
         if ready:
             package = None
 
-            while cycle < N:
+            while cycle < args.first_cycle + N:
                 logger.info(f'app: {app_name}, test {cycle} of {N} starting')
                 # coverage dir
                 coverage_dir = ''
@@ -191,56 +231,52 @@ def main():
                 #     capture_output=True)
                 # package = result.stdout.decode('utf-8').strip('\n').rsplit('/')[-1]
 
+                env_kwargs = dict(coverage_dict=coverage_dict, app_path=application,
+                                  list_activities=list(coverage_dict.keys()),
+                                  widget_list=widget_list, bug_set=bug_set,
+                                  coverage_dir=coverage_dir,
+                                  log_dir=log_dir,
+                                  visited_activities=visited_activities,
+                                  clicked_buttons=clicked_buttons,
+                                  number_bugs=number_bugs,
+                                  string_activities=string_activities,
+                                  internet=internet,
+                                  instr_emma=instr_emma,
+                                  instr_jacoco=instr_jacoco,
+                                  instr_instruapk=instr_instruapk,
+                                  method_locations=method_locations_path,
+                                  timer_start=time.time(),
+                                  algo=algo,
+                                  coverage_report=coverage_report_path,
+                                  merdoso_button_menu=merdoso_button_menu,
+                                  rotation=rotation,
+                                  platform_name=platform_name,
+                                  platform_version=platform_version,
+                                  pool_strings=pool_strings,
+                                  max_episode_len=max_timesteps,
+                                  is_headless=is_headless,
+                                  package=my_package, exported_activities=exported_activities,
+                                  services=services, receivers=receivers,
+                                  observation_overflow=args.observation_overflow,
+                                  log_streaming=args.log_streaming, log_format=args.log_format,
+                                  record_session=args.record_session,
+                                  settle=args.settle, screen_cache=args.screen_cache,
+                                  reset_strategy=args.reset_strategy, fault_index=args.fault_index)
+                app = None
                 try:
-                    app = RLApplicationEnv(coverage_dict, app_path=application,
-                                           list_activities=list(coverage_dict.keys()),
-                                           widget_list=widget_list, bug_set=bug_set,
-                                           coverage_dir=coverage_dir,
-                                           log_dir=log_dir,
-                                           visited_activities=visited_activities,
-                                           clicked_buttons=clicked_buttons,
-                                           number_bugs=number_bugs,
-                                           string_activities=string_activities,
-                                           appium_port=appium_port,
-                                           internet=internet,
-                                           instr_emma=instr_emma,
-                                           instr_jacoco=instr_jacoco,
-                                           instr_instruapk=instr_instruapk,
-                                           method_locations=method_locations_path,
-                                           timer_start=time.time(),
-                                           algo=algo,
-                                           coverage_report=coverage_report_path,
-                                           merdoso_button_menu=merdoso_button_menu,
-                                           rotation=rotation,
-                                           platform_name=platform_name,
-                                           platform_version=platform_version,
-                                           udid=udid,
-                                           pool_strings=pool_strings,
-                                           device_name=device_name,
-                                           max_episode_len=max_timesteps,
-                                           is_headless=is_headless, appium=appium, emulator=emulator,
-                                           package=my_package, exported_activities=exported_activities,
-                                           services=services, receivers=receivers
-                                           )
-                    if algo == 'TD3':
-                        # algorithm = TD3Algorithm()
-                        pass
-                    elif algo == 'random':
-                        algorithm = RandomAlgorithm()
-                    elif algo == 'SAC':
-                        algorithm = SACAlgorithm()
-                    elif algo == 'Q':
-                        algorithm = QLearnAlgorithm()
-                    elif algo == 'DDPG':
-                        algorithm = DDPGAlgorithm()
-                        pass
-                    elif algo == 'test':
-                        # algorithm = TestApp()
-                        pass
+                    if vec_devices:
+                        # One learner, one worker process per device
+                        app = make_device_vec_env(vec_devices, env_kwargs, real_device=real_device, emu=emu)
+                    else:
+                        app = RLApplicationEnv(udid=udid, device_name=device_name, appium_port=appium_port,
+                                               appium=appium, emulator=emulator, **env_kwargs)
+                    algorithm = algorithm_class()
                     logger.debug("save_policy value: {}".format(save_policy))
                     flag = algorithm.explore(app, emulator, appium, timesteps, timer, save_policy=save_policy,
                                              reload_policy=reload_policy, app_name=app_name, policy_dir=policy_dir,
-                                             cycle=cycle, learning_steps=max_timesteps)
+                                             cycle=cycle, learning_steps=max_timesteps,
+                                             async_learner=args.async_learner, max_update_ratio=args.max_update_ratio,
+                                             q_memory_mb=args.q_memory_mb, packed_replay=args.packed_replay)
                     if flag:
                         with open(f'logs{os.sep}success.log', 'a+') as f:
                             f.write(f'{app_name}\n')
@@ -250,49 +286,50 @@ def main():
                 except Exception as e:
                     logger.error(e)
                     flag = False
-                try:
-                    # bye handler, it has been an honour
-                    os.kill(app.bug_proc_pid, 9)
-                except Exception:
-                    pass
+                finally:
+                    if vec_devices and app is not None:
+                        try:
+                            merge_device_bookkeeping(app, widget_list, coverage_dict, bug_set, visited_activities,
+                                                     clicked_buttons, number_bugs)
+                        except Exception as e:
+                            logger.error(f'could not collect the bookkeeping of the devices: {e}')
+                    elif flag:
+                        try:
+                            app.reset()
+                        except WebDriverException:
+                            pass
+                        except Exception as e:
+                            logger.error(f'could not reset the app: {e}')
+                    if app is not None:
+                        # stops the log ingestion, the fault index, the recorder, the driver and the loggers of the
+                        # run, a retry or the next cycle opens its own
+                        try:
+                            app.close()
+                        except Exception as e:
+                            logger.error(f'could not close the environment: {e}')
                 if flag:
-                    try:
-                        app.reset()
-                        app.driver.quit()
-                    except InvalidSessionIdException:
-                        pass
-                    except WebDriverException:
-                        pass
-                    logger.remove(app.logger_id)
-                    logger.remove(app.bug_logger_id)
                     # save_pickles(algo, app_name, cycle, clicked_buttons, visited_activities, number_bugs, bug_set)
                     logger.info(f'app: {app_name}, test {cycle} of {N} ending\n')
                     cycle += 1
                 else:
                     trial += 1
-                    try:
-                        logger.remove(app.logger_id)
-                        logger.remove(app.bug_logger_id)
-                    except Exception:
-                        pass
                     if trial == max_trials:
-                        try:
-                            app.driver.quit()
-                        except Exception:
-                            pass
                         logger.error(f'Too Many Times tried, app: {app_name}, iteration: {cycle}')
+                        failures += 1
                         break
             # in order to avoid faulty behavior we uninstall the application
             # if package:
             #     os.system(f'{adb_path} -s {udid} uninstall {package}')
-    if emulator is not None:
+    if emulator is not None and not args.keep_emulator:
         emulator.terminate()
-    appium.terminate()
+    if appium is not None:
+        appium.terminate()
     # restore_ime_command = f'{adb_path} -s {udid} shell ime set {current_IME}'
     restore_ime_command = f'{adb_path} -s {udid} shell ime set com.google.android.inputmethod.latin/com.android.inputmethod.latin.LatinIME'
     os.system(restore_ime_command)
-    return 0
+    # parallel_exec retries the runs with a failure on another device
+    return 1 if failures else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
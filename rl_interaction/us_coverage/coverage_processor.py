@@ -1,26 +1,33 @@
 from pathlib import Path
 import subprocess
 import os
-import json
-import re
 import sys
+import numpy as np
 from loguru import logger
+from us_coverage.method_index import MethodIndex
+from utils.adb import adb_client
 
 INSTRUAPK_SPLIT = "InstruAPK:"
 SEMICOLON_SPLIT = ";;"
 
 
 class CoverageProcessor(object):
-    def __init__(self, device_id: str, apk_package: str, method_locations_path=None):
+    def __init__(self, device_id: str, apk_package: str, method_locations_path=None, method_index_cache=None):
         self.device_id = device_id
         self.apk_package = apk_package
         self.logcat_position = 0
         self.logcat_current = None
-        self.methods_info = {}
-        self.uncalled_methods = None
-        self.cumulative_uncalled_methods = None
-        self.methods_called = {}
-        self.cumulative_methods_called = {}
+        # methods are mapped to dense indices, coverage is kept in arrays indexed by them
+        self.method_ids = np.empty(0, dtype=str)
+        self.method_index = {}
+        self.filenames = self.packages = np.empty(0, dtype=str)
+        self.filename_ids = np.empty(0, dtype=np.int32)
+        self.package_ids = np.empty(0, dtype=np.int32)
+        self.called = np.empty(0, dtype=bool)
+        self.cumulative_called = np.empty(0, dtype=bool)
+        self.hit_counts = np.empty(0, dtype=np.int64)
+        self.cumulative_hit_counts = np.empty(0, dtype=np.int64)
+        self.method_index_cache = method_index_cache
         self.read_number_of_methods_instrumented(method_locations_path)
 
     def get_device_id(self):
@@ -35,32 +42,55 @@ class CoverageProcessor(object):
     def get_logcat_current(self):
         return self.logcat_current
 
+    def __methods_report(self, mask, counts=None):
+        # dictionaries are only built when a report is requested
+        report = {}
+        for index in np.flatnonzero(mask):
+            entry = {"filename": self.filenames[self.filename_ids[index]],
+                     "package": self.packages[self.package_ids[index]]}
+            if counts is not None:
+                entry = {"count": int(counts[index]), **entry}
+            report[self.method_ids[index]] = entry
+        return report
+
     def get_methods_id_called(self):
-        return self.methods_called
+        return self.__methods_report(self.called, self.hit_counts)
 
     def get_cumulative_methods_id_called(self):
-        return self.cumulative_methods_called
+        return self.__methods_report(self.cumulative_called, self.cumulative_hit_counts)
 
     def get_methods_id_uncalled(self):
-        return self.uncalled_methods
+        return self.__methods_report(~self.called)
 
     def get_cumulative_methods_id_uncalled(self):
-        return self.cumulative_uncalled_methods
+        return self.__methods_report(~self.cumulative_called)
 
     def get_number_of_methods_instrumented(self):
         return self.methods_instrumented
 
     def get_number_methods_called(self):
-        return len(self.methods_called)
+        return int(np.count_nonzero(self.called))
 
     def get_number_cumulative_methods_called(self):
-        return len(self.cumulative_methods_called)
+        return int(np.count_nonzero(self.cumulative_called))
 
     def get_number_methods_uncalled(self):
-        return len(self.uncalled_methods)
+        return self.get_number_of_methods_instrumented() - self.get_number_methods_called()
 
     def get_number_cumulative_methods_uncalled(self):
-        return len(self.cumulative_uncalled_methods)
+        return self.get_number_of_methods_instrumented() - self.get_number_cumulative_methods_called()
+
+    def __group_coverage(self, group_ids, names, cumulative):
+        called = self.cumulative_called if cumulative else self.called
+        totals = np.bincount(group_ids, minlength=len(names))
+        hits = np.bincount(group_ids, weights=called, minlength=len(names))
+        return {name: (hits[i] / totals[i]) * 100 for i, name in enumerate(names) if totals[i] > 0}
+
+    def get_package_coverage(self, cumulative=False):
+        return self.__group_coverage(self.package_ids, self.packages, cumulative)
+
+    def get_file_coverage(self, cumulative=False):
+        return self.__group_coverage(self.filename_ids, self.filenames, cumulative)
 
     def set_methods_instrumented(self, methods_instrumented):
         self.methods_instrumented = methods_instrumented
@@ -71,42 +101,33 @@ class CoverageProcessor(object):
     def set_logcat_position(self, logcat_line):
         self.logcat_position += logcat_line
 
-    def __read_file_number_of_methods(self, file):
-        package_path = r"[\\/]".join(self.get_apk_package().split("."))
-        pattern_package = re.compile(r"smali[\\/]" + package_path + r"[\\/](\w+)[\\/]")
-
-        text = file.read().replace("\\", "\\\\")
-
-        data = json.loads(text)
-        for key, value in data.items():
-            package = re.findall(pattern_package, value["filePath"])
-            self.methods_info[key] = {
-                "filename": value["fileName"],
-                "package": "root" if not package else package[0]
-            }
-
-        self.cumulative_uncalled_methods = self.methods_info.copy()
-
-        return len(self.methods_info)
-
     def read_number_of_methods_instrumented(self, path=None):
         if path is None:
             path = Path.cwd().joinpath(f"{self.get_apk_package()}-locations.json")
         else:
             path = Path(path)
-        with open(path) as file:
-            self.set_methods_instrumented(self.__read_file_number_of_methods(file))
-        file.close()
+        index = MethodIndex.load(path, self.get_apk_package(), self.method_index_cache)
+        self.method_ids = index.method_ids
+        self.method_index = {method: i for i, method in enumerate(index.method_ids.tolist())}
+        self.filenames, self.packages = index.filenames, index.packages
+        self.filename_ids, self.package_ids = index.filename_ids, index.package_ids
+        self.called = np.zeros(len(index), dtype=bool)
+        self.cumulative_called = np.zeros(len(index), dtype=bool)
+        self.hit_counts = np.zeros(len(index), dtype=np.int64)
+        self.cumulative_hit_counts = np.zeros(len(index), dtype=np.int64)
+        self.set_methods_instrumented(len(index))
 
     def clear_logcat(self):
-        command = f"adb -s {self.get_device_id()} logcat -c"
-        subprocess.Popen(command)
+        adb_client(self.get_device_id()).check_shell("logcat -c")
 
     def generate_adb_logcat(self):
-        command = f"adb -s {self.get_device_id()} logcat -e \"InstruAPK(.)*\" -d"
+        command = ["adb", "-s", self.get_device_id(), "logcat", "-e", "InstruAPK(.)*", "-d"]
         process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         self.set_logcat_current(process.stdout)
         self.read_logcat()
+        return self.coverage_summary()
+
+    def coverage_summary(self):
         return self.get_number_of_methods_instrumented(), self.get_number_methods_called(), self.get_coverage_percentage(), self.get_cumulative_coverage(), self.get_number_cumulative_methods_called(), self.get_number_methods_uncalled(), self.get_number_cumulative_methods_uncalled()
 
     def read_logcat(self):
@@ -114,11 +135,15 @@ class CoverageProcessor(object):
         position = self.get_logcat_position()
 
         self.read_lines(logcat, position)
+        methods = []
         line = logcat.readline().decode('utf-8')
         while line is not None and line != '':
-            self.process_line(line)
+            method = self.parse_line(line)
+            if method is not None:
+                methods.append(method)
             self.set_logcat_position(1)
             line = logcat.readline().decode('utf-8')
+        self.process_methods(methods)
 
     def read_lines(self, logcat, lines):
         if lines == 0:
@@ -128,39 +153,33 @@ class CoverageProcessor(object):
             for i in range(lines):
                 logcat.readline()
 
-    def process_line(self, line):
-        pattern = re.compile(INSTRUAPK_SPLIT)
-        splittedLine = re.split(pattern, line)
+    def parse_line(self, line):
+        splittedLine = line.split(INSTRUAPK_SPLIT, 1)
         if len(splittedLine) > 1:
-            line = splittedLine[1]
-            data_method = line.split(SEMICOLON_SPLIT)
-            method = data_method[1]
-            self.methods_called[method] = self.methods_called.get(method,
-                                                                  {"count": 0, "filename": self.methods_info[method][
-                                                                      "filename"],
-                                                                   "package": self.methods_info[method]["package"]})
-            self.methods_called[method]["count"] += 1
-
-            self.cumulative_methods_called[method] = self.methods_called.get(method, {"count": 0,
-                                                                                      "filename":
-                                                                                          self.methods_info[method][
-                                                                                              "filename"],
-                                                                                      "package":
-                                                                                          self.methods_info[method][
-                                                                                              "package"]})
-            self.cumulative_methods_called[method]["count"] += 1
-
-            try:
-                del self.uncalled_methods[method]
-            except KeyError:
-                pass
-
-            try:
-                del self.cumulative_uncalled_methods[method]
-            except KeyError:
-                pass
-        else:
-            logger.info(f"Instruapk line not processed: {line}")
+            return splittedLine[1].split(SEMICOLON_SPLIT)[1]
+        logger.info(f"Instruapk line not processed: {line}")
+        return None
+
+    def process_line(self, line):
+        method = self.parse_line(line)
+        if method is not None:
+            self.process_methods([method])
+
+    def process_methods(self, methods):
+        indices = []
+        for method in methods:
+            index = self.method_index.get(method)
+            if index is None:
+                logger.info(f"Method {method} is not in the method locations file")
+            else:
+                indices.append(index)
+        if not indices:
+            return
+        indices = np.array(indices, dtype=np.intp)
+        np.add.at(self.hit_counts, indices, 1)
+        np.add.at(self.cumulative_hit_counts, indices, 1)
+        self.called[indices] = True
+        self.cumulative_called[indices] = True
 
     def get_coverage_percentage(self):
         if self.get_number_of_methods_instrumented() > 0:
@@ -171,13 +190,14 @@ class CoverageProcessor(object):
             return (self.get_number_cumulative_methods_called() / self.get_number_of_methods_instrumented()) * 100
 
     def reset(self):
-        self.methods_called.clear()
-        self.uncalled_methods = self.methods_info.copy()
-        self.clear_logcat()
+        # in place, nothing is copied on episode reset; the log is cleared by its reader, which tracks its position in
+        # the buffer
+        self.called.fill(False)
+        self.hit_counts.fill(0)
 
     def clear_cumulative_methods(self):
-        self.cumulative_methods_called.clear()
-        self.cumulative_uncalled_methods = self.methods_info.copy()
+        self.cumulative_called.fill(False)
+        self.cumulative_hit_counts.fill(0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+from hashlib import sha256
+from pathlib import Path
+import json
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+
+CACHE_DIR_NAME = ".method_index_cache"
+INDEX_ARRAYS = ["method_ids", "filename_ids", "package_ids", "filenames", "packages"]
+
+
+class MethodIndex(object):
+    """
+    Compiled form of an InstruAPK `*-locations.json` file: method ids with the id of their file and package.
+    The arrays are cached as .npy files keyed by the hash of the source file, later loads map them read-only,
+    so every device testing the same app shares the same pages.
+    """
+
+    def __init__(self, method_ids, filename_ids, package_ids, filenames, packages):
+        self.method_ids = method_ids
+        self.filename_ids = filename_ids
+        self.package_ids = package_ids
+        self.filenames = filenames
+        self.packages = packages
+
+    def __len__(self):
+        return len(self.method_ids)
+
+    @staticmethod
+    def parse(text, apk_package):
+        package_path = r"[\\/]".join(apk_package.split("."))
+        pattern_package = re.compile(r"smali[\\/]" + package_path + r"[\\/](\w+)[\\/]")
+
+        # paths in the locations file are not escaped
+        data = json.loads(text.replace("\\", "\\\\"))
+        filename_index, package_index = {}, {}
+        method_ids, filename_ids, package_ids = [], [], []
+        for key, value in data.items():
+            package = pattern_package.search(value["filePath"])
+            package = "root" if package is None else package.group(1)
+            method_ids.append(key)
+            filename_ids.append(filename_index.setdefault(value["fileName"], len(filename_index)))
+            package_ids.append(package_index.setdefault(package, len(package_index)))
+
+        return MethodIndex(np.array(method_ids, dtype=str), np.array(filename_ids, dtype=np.int32),
+                           np.array(package_ids, dtype=np.int32), np.array(list(filename_index), dtype=str),
+                           np.array(list(package_index), dtype=str))
+
+    @staticmethod
+    def cache_path(source, apk_package, cache_dir=None):
+        source = Path(source)
+        digest = sha256(source.read_bytes())
+        # the package is part of the key, it drives the package extraction
+        digest.update(apk_package.encode("utf-8"))
+        cache_dir = source.parent.joinpath(CACHE_DIR_NAME) if cache_dir is None else Path(cache_dir)
+        return cache_dir.joinpath(f"{source.stem}-{digest.hexdigest()[:16]}")
+
+    @staticmethod
+    def load_cached(path):
+        return MethodIndex(*[np.load(path.joinpath(f"{name}.npy"), mmap_mode="r") for name in INDEX_ARRAYS])
+
+    def save(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written aside and renamed, devices starting together never see a partial index
+        temp_dir = Path(tempfile.mkdtemp(prefix=f"{path.name}-", dir=path.parent))
+        for name in INDEX_ARRAYS:
+            np.save(temp_dir.joinpath(f"{name}.npy"), getattr(self, name))
+        try:
+            os.rename(temp_dir, path)
+        except OSError:
+            # another process compiled the same index first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def load(source, apk_package, cache_dir=None):
+        path = MethodIndex.cache_path(source, apk_package, cache_dir)
+        if path.is_dir():
+            try:
+                return MethodIndex.load_cached(path)
+            except (OSError, ValueError):
+                pass
+        with open(source) as file:
+            index = MethodIndex.parse(file.read(), apk_package)
+        try:
+            index.save(path)
+        except OSError:
+            pass
+        return index
@@ -0,0 +1,353 @@
+from datetime import datetime
+import queue
+import re
+import struct
+import subprocess
+import threading
+
+import numpy as np
+
+from us_logs.faultScanner import ERROR_PRIORITY
+from us_logs.logReader import InstrumentationLine, LogLine, LogReader, LogTag
+
+# common prefix of every logger_entry version: payload length, header size (0 in v1), pid, tid, sec, nsec
+ENTRY_DTYPE = np.dtype([("len", "<u2"), ("hdrSize", "<u2"), ("pid", "<i4"), ("tid", "<u4"), ("sec", "<u4"),
+                        ("nsec", "<u4")])
+ENTRY_PREFIX = struct.Struct("<HH")
+V1_HEADER_SIZE = ENTRY_DTYPE.itemsize
+# hdrSize of logger_entry v1 (padding), v2 and v3, v4
+HEADER_SIZES = (0, 24, 28)
+# LOGGER_ENTRY_MAX_PAYLOAD of the oldest versions, the newer ones are smaller
+MAX_PAYLOAD = 5 * 1024
+# android_LogPriority, 0 and 1 are not written to the buffers
+PRIORITIES = "??VDIWEFS"
+# first letter of the LogTag of every priority, as stored by LogStore
+PRIORITY_LETTERS = np.frombuffer(b"uuVDIWEFS", dtype=np.uint8)
+# method index of an InstruAPK message, right after its tag: InstruAPK\0;;<methodIndex>;;<fileName>;;...
+INSTRUAPK_METHOD = re.compile(rb"InstruAPK\x00 ?;;([^;\x00]*);;")
+START_PROC = re.compile(rb"Start proc (\d+):([\w.]+)")
+
+
+class LogRecords(object):
+    """
+    Records decoded from a chunk of `logcat -B` output, kept column by column. Tags and messages are offsets into
+    the chunk: `message` returns a memoryview, text is only decoded on request.
+    """
+
+    def __init__(self, data: bytes, offsets: np.ndarray):
+        self.data = data
+        self.view = memoryview(data)
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        offsets = offsets.astype(np.int64)
+        self.offsets = offsets
+        # the fixed size prefixes of every header, gathered and reinterpreted in one go
+        headers = buffer[offsets[:, None] + np.arange(ENTRY_DTYPE.itemsize)].view(ENTRY_DTYPE).reshape(-1)
+        self.pid = headers["pid"]
+        self.tid = headers["tid"]
+        self.sec = headers["sec"]
+        self.nsec = headers["nsec"]
+        headerSize = headers["hdrSize"].astype(np.int64)
+        payloadStart = offsets + np.where(headerSize == 0, V1_HEADER_SIZE, headerSize)
+        payloadEnd = payloadStart + headers["len"]
+        self.payloadEnd = payloadEnd
+        # an empty payload has no priority, the decoder never yields one but the columns stay in bounds
+        self.priority = np.where(payloadEnd > payloadStart, buffer[np.minimum(payloadStart, max(len(buffer) - 1, 0))],
+                                 0) if len(buffer) else np.zeros(len(offsets), dtype=np.uint8)
+        self.tagStart = payloadStart + 1
+        # the tag ends at the first NUL of the payload, found for every record at once
+        nuls = np.flatnonzero(buffer == 0)
+        found = np.searchsorted(nuls, self.tagStart)
+        tagEnd = np.where(found < len(nuls), nuls[np.minimum(found, len(nuls) - 1)], payloadEnd) if len(nuls) \
+            else payloadEnd
+        self.tagEnd = np.minimum(tagEnd, payloadEnd)
+        self.messageStart = np.minimum(self.tagEnd + 1, payloadEnd)
+        # without its trailing NUL
+        trailingNul = buffer[np.maximum(payloadEnd - 1, 0)] == 0
+        self.messageEnd = np.maximum(payloadEnd - trailingNul, self.messageStart)
+
+    def __len__(self):
+        return len(self.pid)
+
+    def tag(self, i: int) -> str:
+        return self.data[self.tagStart[i]:self.tagEnd[i]].decode("utf-8", errors="replace")
+
+    def message(self, i: int) -> memoryview:
+        return self.view[self.messageStart[i]:self.messageEnd[i]]
+
+    def text(self, i: int) -> str:
+        return bytes(self.message(i)).decode("utf-8", errors="replace")
+
+    def time(self, i: int) -> float:
+        return float(self.sec[i]) + float(self.nsec[i]) / 1e9
+
+    def priorityLetter(self, i: int) -> str:
+        return PRIORITIES[min(int(self.priority[i]), len(PRIORITIES) - 1)]
+
+    def priorityLetters(self, positions: np.ndarray) -> np.ndarray:
+        return PRIORITY_LETTERS[np.minimum(self.priority[positions], len(PRIORITIES) - 1)]
+
+    def messages(self, positions: np.ndarray):
+        """
+        Messages of some records as LogLine.message (`<tag>: <message>`), each followed by a newline, copied from the
+        chunk in one gather without decoding them.
+        :param positions: (numpy.ndarray) positions of the records
+        :return: (tuple) concatenated messages (bytes), offset of every message (numpy.ndarray)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        # the separators are gathered from two bytes past the end of the chunk
+        source = np.frombuffer(self.data + b": \n", dtype=np.uint8)
+        tagStart, tagEnd = self.tagStart[positions], self.tagEnd[positions]
+        messageStart, messageEnd = self.messageStart[positions], self.messageEnd[positions]
+        separators = np.full(len(positions), len(self.data), dtype=np.int64)
+        starts = np.stack([tagStart, separators, messageStart, separators + 2], axis=1).reshape(-1)
+        lengths = np.stack([tagEnd - tagStart, np.full(len(positions), 2), messageEnd - messageStart,
+                            np.ones(len(positions), dtype=np.int64)], axis=1).reshape(-1)
+        ends = np.cumsum(lengths)
+        gather = np.arange(ends[-1] if len(ends) else 0) + np.repeat(starts - (ends - lengths), lengths)
+        return source[gather].tobytes(), (ends - lengths)[::4]
+
+    def entries(self, positions: np.ndarray) -> bytes:
+        """
+        :param positions: (numpy.ndarray) positions of the records, in order
+        :return: (bytes) the records as read from `logcat -B`, headers included
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if not len(positions):
+            return b""
+        starts, ends = self.offsets[positions], self.payloadEnd[positions]
+        # the records of the app mostly follow each other in the chunk, each run of them is copied in one slice
+        breaks = np.flatnonzero(starts[1:] != ends[:-1]) + 1
+        runStarts = starts[np.concatenate(([0], breaks))].tolist()
+        runEnds = ends[np.concatenate((breaks - 1, [len(positions) - 1]))].tolist()
+        return b"".join(self.view[start:end] for start, end in zip(runStarts, runEnds))
+
+    def instrumentationMethods(self):
+        """
+        Method indices of the InstruAPK records, extracted with one regular expression scan of the chunk.
+        :return: (tuple) positions of the records (numpy.ndarray), method indices (list of str)
+        """
+        positions, methods = [], []
+        for match in INSTRUAPK_METHOD.finditer(self.data):
+            positions.append(match.start())
+            methods.append(match.group(1).decode())
+        records = np.searchsorted(self.tagStart, np.array(positions, dtype=np.int64))
+        # matches inside a message rather than at a tag are dropped
+        keep = records < len(self)
+        keep[keep] = self.tagStart[records[keep]] == np.array(positions, dtype=np.int64)[keep]
+        return records[keep], [method for method, kept in zip(methods, keep) if kept]
+
+
+class BinaryLogDecoder(object):
+    """
+    Splits a stream of `logcat -B` output into LogRecords, a record cut at the end of a chunk is completed by the
+    next one. A header that cannot be one (unknown header size, payload too long, priority out of range or no tag) is
+    skipped byte by byte until the records line up again.
+    """
+
+    def __init__(self):
+        self.pending = b""
+        self.skippedBytes = 0
+
+    def feed(self, data: bytes) -> LogRecords:
+        data = self.pending + data
+        offsets = []
+        position, size = 0, len(data)
+        # records have variable lengths, only their 4 bytes prefix is read here
+        while position + ENTRY_PREFIX.size <= size:
+            length, headerSize = ENTRY_PREFIX.unpack_from(data, position)
+            if headerSize not in HEADER_SIZES or not 2 <= length <= MAX_PAYLOAD:
+                position += 1
+                self.skippedBytes += 1
+                continue
+            payloadStart = position + (headerSize or V1_HEADER_SIZE)
+            end = payloadStart + length
+            if end > size:
+                break
+            if not 2 <= data[payloadStart] < len(PRIORITIES) or data.find(b"\0", payloadStart + 1, end) < 0:
+                position += 1
+                self.skippedBytes += 1
+                continue
+            offsets.append(position)
+            position = end
+        self.pending = data[position:]
+        return LogRecords(data[:position], np.array(offsets, dtype=np.int64))
+
+
+class BinaryLogLine(LogLine):
+    """
+    LogLine backed by LogRecords, its fields are decoded the first time they are read.
+    """
+
+    def __init__(self, records: LogRecords, record: int, index: int):
+        self.records = records
+        self.record = record
+        self.index = index
+        self._message = None
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.records.time(self.record))
+
+    @property
+    def pid(self):
+        return str(self.records.pid[self.record])
+
+    @property
+    def tid(self):
+        return str(self.records.tid[self.record])
+
+    @property
+    def tag(self):
+        try:
+            return LogTag(self.records.priorityLetter(self.record))
+        except ValueError:
+            return LogTag.UNKNOWN
+
+    @property
+    def message(self):
+        # same as the text parser: "<tag>: <message>"
+        if self._message is None:
+            self._message = f"{self.records.tag(self.record)}: {self.records.text(self.record)}"
+        return self._message
+
+    @property
+    def rawLine(self):
+        return f"{self.records.time(self.record):.3f} {self.pid} {self.tid} " \
+               f"{self.records.priorityLetter(self.record)} {self.message}"
+
+
+class BinaryInstrumentationLine(BinaryLogLine, InstrumentationLine):
+    """
+    InstruAPK record whose method index was extracted in bulk, the other fields are parsed on request.
+    """
+
+    def __init__(self, records: LogRecords, record: int, index: int, methodIndex: str):
+        super().__init__(records, record, index)
+        self.methodIndex = methodIndex
+
+    def fields(self):
+        return self.message.split(";;")
+
+    @property
+    def filename(self):
+        return self.fields()[2]
+
+    @property
+    def methodName(self):
+        return self.fields()[3]
+
+    @property
+    def methodParameters(self):
+        return self.fields()[4:-1]
+
+    @property
+    def callTime(self):
+        return datetime.fromtimestamp(float(self.fields()[-1]) / 1000)
+
+
+class BinaryLogReader(LogReader):
+    """
+    LogReader reading `logcat -B` through `adb exec-out`: the stream is read in large chunks, the record headers are
+    decoded with numpy and the InstruAPK method indices are extracted in bulk, the fault keywords are searched in the
+    raw records and only the lines around the faults are decoded to text.
+    """
+
+    def __init__(self, packageName: str, deviceSerial: str = None, streamingTimeout: float = 0.2,
+                 chunkSize: int = 1 << 16, maxQueuedChunks: int = 1024):
+        super().__init__(packageName, deviceSerial, streaming=True, streamingTimeout=streamingTimeout)
+        self.chunkSize = chunkSize
+        self.chunks = queue.Queue(maxsize=maxQueuedChunks)
+        self.decoder = BinaryLogDecoder()
+        self.process = None
+        self.trackedPids = set()
+
+    def logcatCommand(self):
+        # exec-out keeps the binary stream intact, `adb shell` may translate newlines
+        return self.addDeviceSerial(['adb']) + ['exec-out', 'logcat', '-B']
+
+    def readStream(self, process):
+        while True:
+            stdout = process.stdout
+            chunk = stdout.read1(self.chunkSize) if hasattr(stdout, "read1") else stdout.read(self.chunkSize)
+            if not chunk:
+                return
+            # the chunks are cut anywhere in the records, none can be dropped without losing the alignment of the
+            # decoder: when the reads lag behind, logcat waits on the pipe
+            while True:
+                try:
+                    self.chunks.put(chunk, timeout=1)
+                    break
+                except queue.Full:
+                    if process.poll() is not None or process is not self.process:
+                        return
+
+    def startStream(self):
+        self.apkPid = self.getPIDApk(self.packageName)
+        self.trackedPids = set() if self.apkPid is None else {self.apkPid}
+        self.decoder = BinaryLogDecoder()
+        self.process = subprocess.Popen(self.logcatCommand(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        threading.Thread(name=f"logcat-B-{self.packageName}", target=self.readStream, args=(self.process,),
+                         daemon=True).start()
+
+    def closeStream(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def getLogLines(self):
+        """
+        :return: (bytes) output of logcat read since the previous call
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.startStream()
+        chunks = []
+        try:
+            chunks.append(self.chunks.get(timeout=self.streamingTimeout))
+            while True:
+                chunks.append(self.chunks.get_nowait())
+        except queue.Empty:
+            pass
+        return b"".join(chunks)
+
+    def trackPids(self, records: LogRecords, instrumented: np.ndarray):
+        for match in START_PROC.finditer(records.data):
+            if match.group(2).decode() == self.packageName:
+                self.followPid(int(match.group(1)))
+        # only the app is instrumented, its Start proc line may have been cleared by `logcat -c` before being read
+        for pid in records.pid[instrumented].tolist():
+            if pid not in self.trackedPids:
+                self.followPid(pid)
+
+    def followPid(self, pid: int):
+        # lines of the previous process are still accepted, a crash is logged by the dying process
+        self.trackedPids = {pid} if self.apkPid is None else {self.apkPid, pid}
+        self.apkPid = pid
+
+    def parseLines(self, data):
+        """
+        :param data: (bytes) output of `logcat -B`
+        :return: (tuple) lines of the app, positions of the InstruAPK lines among them, faults
+        """
+        records = self.decoder.feed(data)
+        instrumented, methods = records.instrumentationMethods()
+        self.trackPids(records, instrumented)
+        keep = np.isin(records.pid, list(self.trackedPids)) if self.trackedPids else np.zeros(len(records), bool)
+        methodOf = dict(zip(instrumented.tolist(), methods))
+        # the fault keywords are searched in the records as they are, the other lines of the app are not decoded
+        flags = self.faultScanner.markRecords(records.data, records.tagStart)
+        flags[records.priority == PRIORITIES.index(LogTag.ERROR.value)] |= ERROR_PRIORITY
+        index = self.parsedLines
+        logLines = []
+        for record in np.flatnonzero(keep).tolist():
+            method = methodOf.get(record)
+            if method is None:
+                logLines.append(BinaryLogLine(records, record, index))
+            else:
+                logLines.append(BinaryInstrumentationLine(records, record, index, method))
+            index += 1
+        self.parsedLines = index
+        return self.classifyLines(logLines, flags[keep])
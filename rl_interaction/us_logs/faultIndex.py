@@ -0,0 +1,178 @@
+from collections import namedtuple
+from datetime import datetime
+import argparse
+import hashlib
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import texttable as tt
+
+# fault sent on the bug queue of the environment: its signature, its exception and its text, as written in
+# bug_logger.log
+FaultReport = namedtuple("FaultReport", ["signature", "header", "text"])
+
+# `<time> <pid> <tid> <priority> ` of a raw logcat line, epoch or threadtime
+LOGCAT_PREFIX = re.compile(r"^(?:[\d.:-]+\s+){1,2}\d+\s+\d+\s+[VDIWEFS]\s+")
+CRASH_TAG = re.compile(r"^(?:[VDIWEFS]\s+)?AndroidRuntime:\s*")
+LINE_NUMBER = re.compile(r"\(([^():]+):\d+\)")
+HEX_ADDRESS = re.compile(r"\b0x[0-9a-fA-F]+\b")
+OBJECT_HASH = re.compile(r"@[0-9a-fA-F]{4,}\b")
+EXCEPTION = re.compile(r"^(?:Caused by: )?[\w$.]+(?:Exception|Error)\b")
+# numbers standing alone, not the digits of an identifier such as MainMenu$1 or Activity2
+NUMBER = re.compile(r"(?<![\w$])\d+(?:\.\d+)?(?![\w$])")
+MAX_FRAMES = 8
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS faults (
+    signature TEXT PRIMARY KEY,
+    package TEXT,
+    header TEXT,
+    text TEXT,
+    firstSeen REAL,
+    lastSeen REAL,
+    hits INTEGER,
+    firstDevice TEXT,
+    firstRun TEXT
+)"""
+COLUMNS = ["signature", "package", "header", "text", "firstSeen", "lastSeen", "hits", "firstDevice", "firstRun"]
+
+
+def normalizeLine(line: str) -> str:
+    """
+    Removes what changes between two occurrences of the same crash: the logcat prefix, runs of spaces, hexadecimal
+    addresses and object hashes, the line numbers of the stack frames and the numbers of the messages (PIDs, indices,
+    sizes...).
+    """
+    text = CRASH_TAG.sub("", LOGCAT_PREFIX.sub("", line.strip())).strip()
+    # the text lines are split on whitespace, the binary records keep the padding of the tombstones
+    text = " ".join(text.split())
+    text = OBJECT_HASH.sub("@#", HEX_ADDRESS.sub("0x#", text))
+    if text.startswith("at "):
+        return LINE_NUMBER.sub(r"(\1)", text)
+    return NUMBER.sub("#", text)
+
+
+def splitLines(lines):
+    # a binary record holds a whole trace when it was logged at once
+    return [part for line in lines for part in line.splitlines()]
+
+
+def faultHeader(lines) -> str:
+    """
+    :return: (str) first exception of the trace, or its first line
+    """
+    stripped = [CRASH_TAG.sub("", LOGCAT_PREFIX.sub("", line.strip())).strip() for line in splitLines(lines)]
+    stripped = [line for line in stripped if line]
+    return next((line for line in stripped if EXCEPTION.match(line)), stripped[0] if stripped else "")
+
+
+def faultSignature(lines, maxFrames: int = MAX_FRAMES) -> str:
+    """
+    :param lines: (list) text of the lines of a fault, header first
+    :param maxFrames: (int) stack frames kept of every exception of the chain, the deepest ones often vary
+    :return: (str) hex digest of the normalized lines, the same for the same crash in another process or run
+    """
+    normalized, frames = [], 0
+    for line in splitLines(lines):
+        text = normalizeLine(line)
+        if not text:
+            continue
+        if text.startswith("at "):
+            frames += 1
+            if frames > maxFrames:
+                continue
+        elif text.startswith("Caused by"):
+            frames = 0
+        normalized.append(text)
+    return hashlib.blake2b("\n".join(normalized).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class FaultIndex(object):
+    """
+    Faults keyed by signature in a SQLite database, with the first and last time they were seen and their number of
+    hits. The file can be shared by the devices of a campaign and by successive campaigns, a crash found again is
+    then recognized without comparing any trace.
+    :param path: (str) database file
+    :param timeout: (float) seconds to wait for another process writing in the database
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.lock = threading.Lock()
+        # the environment records the faults from its main thread, the CLI and the tests from theirs
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.connection:
+            self.connection.execute(SCHEMA)
+
+    def record(self, report: FaultReport, package: str = None, device: str = None, run: str = None) -> int:
+        """
+        :return: (int) hits of the fault, 1 the first time it is seen
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO faults VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                                    (report.signature, package, report.header, report.text, now, now, device, run))
+            self.connection.execute("UPDATE faults SET hits = hits + 1, lastSeen = ? WHERE signature = ?",
+                                    (now, report.signature))
+            return self.connection.execute("SELECT hits FROM faults WHERE signature = ?",
+                                           (report.signature,)).fetchone()[0]
+
+    def get(self, signature: str):
+        """
+        :return: (dict) row of the fault, None if it was never seen
+        """
+        with self.lock:
+            row = self.connection.execute(f"SELECT {', '.join(COLUMNS)} FROM faults WHERE signature = ?",
+                                          (signature,)).fetchone()
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def faults(self, package: str = None, limit: int = None) -> list:
+        """
+        :return: (list) rows of the faults, the most frequent first
+        """
+        query = f"SELECT {', '.join(COLUMNS)} FROM faults"
+        parameters = []
+        if package is not None:
+            query += " WHERE package = ?"
+            parameters.append(package)
+        query += " ORDER BY hits DESC, firstSeen"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        with self.lock:
+            return [dict(zip(COLUMNS, row)) for row in self.connection.execute(query, parameters)]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM faults").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Faults recorded in a fault index")
+    parser.add_argument("index", type=str, help="SQLite file of the index, e.g. logs/faults.sqlite")
+    parser.add_argument("--package", type=str, default=None)
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args(argv)
+    index = FaultIndex(args.index)
+    table = tt.Texttable(max_width=0)
+    table.set_cols_dtype(["t", "t", "i", "t", "t", "t"])
+    table.header(["signature", "package", "hits", "first seen", "last seen", "header"])
+    for fault in index.faults(args.package, args.limit):
+        table.add_row([fault["signature"][:12], fault["package"], fault["hits"],
+                       datetime.fromtimestamp(fault["firstSeen"]).isoformat(timespec="seconds"),
+                       datetime.fromtimestamp(fault["lastSeen"]).isoformat(timespec="seconds"), fault["header"]])
+    print(table.draw())
+    print(f"{len(index)} distinct faults")
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
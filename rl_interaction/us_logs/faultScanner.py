@@ -0,0 +1,167 @@
+from enum import Enum
+from operator import attrgetter
+import re
+
+import numpy as np
+
+
+class FaultType(Enum):
+    ERROR = "Error"
+    EXCEPTION = "Exception"
+    FATAL_EXCEPTION = "FATAL EXCEPTION"
+    NATIVE_CRASH = "Fatal signal"
+
+
+# flags of a line
+START = 1  # names an error or an exception
+FATAL = 2  # header of a crash, ends the fault being read
+NATIVE = 4  # header of a native crash
+ERROR_PRIORITY = 8  # error priority, only a candidate in the text lines
+INSTRUMENTED = 16
+STARTS = START | FATAL | NATIVE | ERROR_PRIORITY
+
+# states of the scanner
+IDLE, JAVA_CRASH, NATIVE_CRASH = 0, 1, 2
+
+# events of a scan, with the position of their line
+FAULT_START, FAULT_LINE, FAULT_END = 0, 1, 2
+
+# lines continuing a Java trace: causes, frames, the process and every line of AndroidRuntime
+JAVA_CONTINUATION = "Caused by|: \\s*at |: \\.\\.\\. |Process: {package}|AndroidRuntime: "
+# lines of a tombstone: written by libc, debuggerd or crash_dump, backtrace and registers
+NATIVE_CONTINUATION = re.compile(r"DEBUG|libc|crash_dump|tombstone|\*\*\* \*\*\* \*\*\*|backtrace:|#\d+ pc ")
+
+
+def startKeywords():
+    return [(FATAL | START, FaultType.FATAL_EXCEPTION.value), (START, FaultType.EXCEPTION.value),
+            (START, FaultType.ERROR.value), (FATAL | NATIVE, FaultType.NATIVE_CRASH.value),
+            (NATIVE, "*** *** ***")]
+
+
+def headerKeyword(message: str):
+    """
+    :return: (str) text between the tag and the next colon of a header, its other lines may repeat it, None if the
+    header has no such text
+    """
+    parts = message.split(":", 2)
+    return (parts[1].strip() or None) if len(parts) > 1 else None
+
+
+class FaultScanner(object):
+    """
+    Finds the faults of chunks of logcat lines in two steps. The keywords that start a fault are searched in the
+    whole chunk at once, one C-level search per keyword, and the lines holding them are flagged. An explicit state
+    machine then walks from flagged line to flagged line: a Java crash goes on with its causes and frames, a native
+    crash with its tombstone, every other line is skipped without being looked at. The state is kept between chunks,
+    a fault cut by the end of a chunk is completed by the next one.
+    :param packageName: (str) package of the app, its name follows `Process: ` in a Java crash
+    """
+
+    def __init__(self, packageName: str):
+        self.javaContinuation = re.compile(JAVA_CONTINUATION.format(package=re.escape(packageName)))
+        self.textKeywords = startKeywords() + [(ERROR_PRIORITY, " E ")]
+        self.binaryKeywords = [(flag, keyword.encode()) for flag, keyword in startKeywords()]
+        self.reset()
+
+    def reset(self):
+        self.state = IDLE
+        self.keyword = None
+
+    @property
+    def reading(self) -> bool:
+        return self.state != IDLE
+
+    @staticmethod
+    def mark(data, lineStarts: np.ndarray, keywords) -> np.ndarray:
+        """
+        :param data: (str or bytes) lines of the chunk
+        :param lineStarts: (numpy.ndarray) offset of every line in `data`, increasing
+        :param keywords: (list) flag and keyword pairs
+        :return: (numpy.ndarray) flags of every line
+        """
+        flags = np.zeros(len(lineStarts), dtype=np.uint8)
+        for flag, keyword in keywords:
+            positions = []
+            position = data.find(keyword)
+            while position >= 0:
+                positions.append(position)
+                position = data.find(keyword, position + 1)
+            if positions:
+                lines = np.searchsorted(lineStarts, positions, side="right") - 1
+                flags[lines[lines >= 0]] |= flag
+        return flags
+
+    def markLines(self, logLines, positions) -> np.ndarray:
+        """
+        :param logLines: (list) LogLine objects
+        :param positions: (list) positions of the lines to search, the InstruAPK lines are left out by the caller
+        :return: (numpy.ndarray) flags of every line, searched in the raw text of the lines at `positions`
+        """
+        rawLines = list(map(attrgetter("rawLine"), map(logLines.__getitem__, positions)))
+        lineStarts = np.zeros(len(rawLines), dtype=np.int64)
+        if len(rawLines) > 1:
+            # one newline after every line
+            np.cumsum(np.fromiter(map(len, rawLines[:-1]), dtype=np.int64, count=len(rawLines) - 1) + 1,
+                      out=lineStarts[1:])
+        flags = np.zeros(len(logLines), dtype=np.uint8)
+        flags[positions] = self.mark("\n".join(rawLines), lineStarts, self.textKeywords)
+        return flags
+
+    def markRecords(self, data: bytes, recordStarts: np.ndarray) -> np.ndarray:
+        """
+        :param data: (bytes) chunk of `logcat -B` records
+        :param recordStarts: (numpy.ndarray) offset of the tag of every record
+        :return: (numpy.ndarray) flags of the records, without their priority
+        """
+        return self.mark(data, recordStarts, self.binaryKeywords)
+
+    def continues(self, logLine) -> bool:
+        if self.state == NATIVE_CRASH:
+            return NATIVE_CONTINUATION.search(logLine.message) is not None
+        message = logLine.message
+        return self.javaContinuation.search(message) is not None or \
+            (self.keyword is not None and self.keyword in message)
+
+    def scan(self, logLines, flags: np.ndarray) -> list:
+        """
+        :param logLines: (list) LogLine objects of the chunk
+        :param flags: (numpy.ndarray) flags of the lines
+        :return: (list) events, as (position of the line, FAULT_START, FAULT_LINE or FAULT_END) pairs. A fault ends
+        on its first line that does not continue it, that line is not part of it. A fault still read at the end of
+        the chunk has no FAULT_END yet.
+        """
+        events = []
+        starts = np.flatnonzero(((flags & STARTS) != 0) & ((flags & INSTRUMENTED) == 0))
+        flags = flags.tolist()
+        position, count = 0, len(flags)
+        while position < count:
+            if self.state == IDLE:
+                following = int(np.searchsorted(starts, position))
+                if following == len(starts):
+                    break
+                position = int(starts[following])
+                flag, logLine = flags[position], logLines[position]
+                if flag & NATIVE:
+                    self.state = NATIVE_CRASH
+                elif flag & START or logLine.tag.value == "E":
+                    # " E " of a text line may be part of its message
+                    self.state, self.keyword = JAVA_CRASH, headerKeyword(logLine.message)
+                else:
+                    position += 1
+                    continue
+                events.append((position, FAULT_START))
+                position += 1
+                continue
+            flag = flags[position]
+            if flag & (INSTRUMENTED | FATAL):
+                # the app runs its code again or crashes again, the line may start the next fault
+                events.append((position, FAULT_END))
+                self.reset()
+                continue
+            if self.continues(logLines[position]):
+                events.append((position, FAULT_LINE))
+            else:
+                events.append((position, FAULT_END))
+                self.reset()
+            position += 1
+        return events
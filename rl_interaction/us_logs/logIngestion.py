@@ -0,0 +1,316 @@
+from collections import namedtuple
+from itertools import groupby
+from operator import attrgetter
+import os
+import queue
+import threading
+import time
+
+from loguru import logger
+
+from us_logs.faultIndex import FaultReport, faultHeader
+from us_logs.logReader import LogLine
+from us_logs.logStore import LogSegment
+
+# records parsed from one read of the log: every LogLine, the InstrumentationLine among them and the Faults
+LogBatch = namedtuple("LogBatch", ["lines", "instrumentationLines", "faults"])
+
+
+class LogConsumer(object):
+    """
+    Receives the batches parsed by a LogIngestionService on an in-process queue and handles them in its own thread,
+    so that a slow consumer does not hold back the others nor the reading of the log.
+    """
+    name = "consumer"
+
+    def __init__(self):
+        self.batches = queue.Queue()
+        self.condition = threading.Condition()
+        self.receivedRecords = 0
+        self.processedRecords = 0
+        self.busySeconds = 0.0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(name=f"log-{self.name}", target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        if self.thread is not None:
+            self.batches.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+        self.close()
+
+    def put(self, batch: LogBatch):
+        with self.condition:
+            self.receivedRecords += len(batch.lines)
+        self.batches.put(batch)
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.consume(batch)
+            except Exception as e:
+                logger.error(f"log consumer {self.name} failed on a batch: {e}")
+            with self.condition:
+                self.busySeconds += time.perf_counter() - start
+                self.processedRecords += len(batch.lines)
+                self.condition.notify_all()
+
+    def consume(self, batch: LogBatch):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def lag(self) -> int:
+        # records handed to the consumer and not handled yet
+        with self.condition:
+            return self.receivedRecords - self.processedRecords
+
+    def throughput(self) -> float:
+        # records handled per second spent handling them
+        with self.condition:
+            return self.processedRecords / self.busySeconds if self.busySeconds > 0 else 0.0
+
+    def waitIdle(self, timeout: float = 10.0) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.processedRecords >= self.receivedRecords, timeout)
+
+    def stats(self) -> dict:
+        return {"consumer": self.name, "records": self.processedRecords, "lag": self.lag(),
+                "recordsPerSecond": round(self.throughput(), 1)}
+
+
+class FaultDetector(LogConsumer):
+    """
+    Sends every fault to the bug queue of the environment and keeps the faults of the run for the coverage reports.
+    """
+    name = "faults"
+
+    def __init__(self, bugQueue=None):
+        super().__init__()
+        self.bugQueue = bugQueue
+        self.lock = threading.Lock()
+        self.faults = []
+        self.uniqueFaultsEpisode, self.uniqueFaultsTotal = set(), set()
+        self.lastFaultRequest = 0
+
+    def consume(self, batch: LogBatch):
+        if not batch.faults:
+            return
+        logger.debug('New faults identified, adding to bug queue')
+        with self.lock:
+            self.faults += batch.faults
+            self.uniqueFaultsEpisode.update(batch.faults)
+            self.uniqueFaultsTotal.update(batch.faults)
+        if self.bugQueue is not None:
+            for fault in batch.faults:
+                messages = [fault.header.message] + [line.message for line in fault.lines]
+                self.bugQueue.put(FaultReport(fault.signature, faultHeader(messages), str(fault)))
+
+    def getNewFaults(self):
+        with self.lock:
+            newFaults = self.faults[self.lastFaultRequest:]
+            self.lastFaultRequest = len(self.faults)
+            return newFaults
+
+    def getUniqueFaults(self):
+        with self.lock:
+            uniqueEpisode = list(self.uniqueFaultsEpisode)
+            self.uniqueFaultsEpisode.clear()
+            return uniqueEpisode, list(self.uniqueFaultsTotal)
+
+    def clear_unique_faults(self):
+        with self.lock:
+            self.uniqueFaultsTotal.clear()
+
+
+class CoverageAccumulator(LogConsumer):
+    """
+    Marks the methods of the InstruAPK lines as called in a CoverageProcessor, replacing its own logcat dump.
+    """
+    name = "coverage"
+
+    def __init__(self, coverageProcessor):
+        super().__init__()
+        self.coverageProcessor = coverageProcessor
+        # held while a coverage report reads the processor
+        self.lock = threading.Lock()
+
+    def consume(self, batch: LogBatch):
+        methods = [line.methodIndex for line in batch.instrumentationLines]
+        if methods:
+            with self.lock:
+                self.coverageProcessor.process_methods(methods)
+
+
+class RawArchive(LogConsumer):
+    """
+    Appends the lines of the app to a file: as printed by logcat, or as the records of `logcat -B` when the log is
+    read in binary, which are then written without being decoded.
+    :param path: (str) file of the archive
+    :param binary: (bool) the lines are BinaryLogLine objects, their records are written
+    """
+    name = "archive"
+
+    def __init__(self, path: str, binary: bool = False):
+        super().__init__()
+        self.path = path
+        self.binary = binary
+        self.file = open(path, "ab") if binary else open(path, "a", encoding="utf-8")
+
+    def consume(self, batch: LogBatch):
+        if self.binary:
+            # the lines of a batch come from one or a few chunks of records
+            for records, lines in groupby(batch.lines, key=attrgetter("records")):
+                self.file.write(records.entries([line.record for line in lines]))
+        else:
+            self.file.writelines(line.rawLine + "\n" for line in batch.lines)
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class FaultContext(LogConsumer):
+    """
+    Keeps the last lines of the app in a LogSegment ring buffer and writes, the first time a fault is seen, the lines
+    logged before it and the fault itself to `<directory>/<signature>.log`: the actions and methods leading to the
+    crash, which the fault report alone does not show.
+    :param directory: (str) folder of the context files
+    :param capacity: (int) lines of the app kept
+    :param contextLines: (int) lines written before the header of a fault
+    """
+    name = "context"
+
+    def __init__(self, directory: str, capacity: int = 5000, contextLines: int = 200):
+        super().__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.contextLines = contextLines
+        # every line in the ring, a fault needs the lines around it whatever their kind. The lines are only decoded
+        # when a fault is written
+        self.store = LogSegment(LogLine, capacity)
+        self.written = set()
+
+    def consume(self, batch: LogBatch):
+        self.store.extend(batch.lines)
+        for fault in batch.faults:
+            if fault.signature in self.written:
+                continue
+            self.written.add(fault.signature)
+            first, last = fault.header.index - self.contextLines, (fault.lines or [fault.header])[-1].index
+            with open(os.path.join(self.directory, f"{fault.signature}.log"), "w", encoding="utf-8") as file:
+                file.writelines(line + "\n" for line in self.store.rawLines(first, last))
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["bytes"] = self.store.nbytes()
+        return stats
+
+
+class LogIngestionService(object):
+    """
+    Reads the log of one device once, parses it with a LogReader and fans the parsed batches out to the registered
+    consumers. A background thread keeps reading; `sync` reads what is pending and waits until every consumer is
+    up to date, e.g. before a coverage report.
+    :param logReader: (LogReader) source and parser of the lines of the app
+    :param consumers: (list) LogConsumer fed with every batch
+    :param interval: (float) seconds between two dumps of the log when the reader is not streaming
+    """
+
+    def __init__(self, logReader, consumers=(), interval: float = 0.5):
+        self.logReader = logReader
+        self.consumers = list(consumers)
+        self.interval = interval
+        # reentrant, clearLog reads the pending lines before clearing
+        self.readLock = threading.RLock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.readLines = 0
+        self.readSeconds = 0.0
+        self.droppedLines = 0
+
+    def register(self, consumer: LogConsumer):
+        self.consumers.append(consumer)
+        if self.thread is not None:
+            consumer.start()
+        return consumer
+
+    def start(self):
+        for consumer in self.consumers:
+            consumer.start()
+        self.stopped.clear()
+        self.thread = threading.Thread(name=f"log-ingestion-{self.logReader.device}", target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(10)
+            self.thread = None
+        self.logReader.closeStream()
+        for consumer in self.consumers:
+            consumer.stop()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"log ingestion failed: {e}")
+            # a streaming reader already waits for the next lines
+            if not self.logReader.streaming:
+                self.stopped.wait(self.interval)
+
+    def poll(self):
+        """
+        Reads the new lines of the log once and hands them to every consumer.
+        :return: (int) number of lines read
+        """
+        with self.readLock:
+            start = time.perf_counter()
+            lines, instrumentationLines, faults = self.logReader.parseLines(self.logReader.getLogLines())
+            self.readSeconds += time.perf_counter() - start
+            self.readLines += len(lines)
+            if self.logReader.droppedLines > self.droppedLines:
+                logger.warning(f"{self.logReader.droppedLines - self.droppedLines} lines of the app log dropped, "
+                               f"the reads fell behind: coverage and faults of these lines are lost")
+                self.droppedLines = self.logReader.droppedLines
+            if not lines:
+                return 0
+            batch = LogBatch(lines, [lines[i - lines[0].index] for i in instrumentationLines], faults)
+            for consumer in self.consumers:
+                consumer.put(batch)
+            return len(lines)
+
+    def clearLog(self):
+        """
+        Reads the pending lines, then clears the log of the device. The reader forgets its position in the log under
+        the same lock, so no read runs with a position from before the clear.
+        """
+        with self.readLock:
+            self.poll()
+            self.logReader.clearLog(clearPhoneLogcat=True)
+
+    def sync(self, timeout: float = 10.0) -> bool:
+        """
+        :return: (bool) False if a consumer did not catch up in time
+        """
+        self.poll()
+        return all(consumer.waitIdle(timeout) for consumer in self.consumers)
+
+    def stats(self) -> list:
+        # the reader first, its dropped lines are lost for every consumer
+        reader = {"consumer": "reader", "records": self.readLines, "lag": 0, "droppedLines": self.droppedLines,
+                  "recordsPerSecond": round(self.readLines / self.readSeconds, 1) if self.readSeconds else 0.0}
+        return [reader] + [consumer.stats() for consumer in self.consumers]
@@ -1,17 +1,21 @@
 from datetime import datetime
 from enum import Enum
+from itertools import repeat
+from operator import attrgetter
 import subprocess
 import sys
 import traceback
 
+import numpy as np
 
-# ! type hinting removed for compatibility with python 3.8
+from us_logs.faultIndex import faultSignature
+from us_logs.faultScanner import FAULT_END, FAULT_START, INSTRUMENTED, FaultScanner, FaultType
+from us_logs.logcatStream import LogcatStream
+from us_logs.logStore import LogStore
+from utils.adb import adb_client
 
 
-class FaultType(Enum):
-    ERROR = "Error"
-    EXCEPTION = "Exception"
-    FATAL_EXCEPTION = "FATAL EXCEPTION"
+# ! type hinting removed for compatibility with python 3.8
 
 
 class LogTag(Enum):
@@ -86,47 +90,76 @@ class Fault(object):
             if fault.value in self.header.message:
                 self.type = fault
         self.time: datetime = self.header.time
+        # computed once, the same crash in another process or run has the same signature
+        self.signature = faultSignature([self.header.message] + [line.message for line in self.lines])
 
     def toJSONSerializableObject(self) -> dict:
         return {"header": self.header.toJSONSerializableObject(),
                 "lines": [line.toJSONSerializableObject() for line in self.lines], "type": self.type.value,
-                "time": self.time.isoformat()}
+                "time": self.time.isoformat(), "signature": self.signature}
 
     def __str__(self) -> str:
         lines = "\n\t".join([str(line) for line in self.lines])
         return f"{self.header};\n{self.type};{self.time};{lines}"
 
     def __hash__(self):
-        for line in self.lines:
-            if ": at " in line.message:
-                return hash((self.header.message, line.message))
-        return hash(self.header.message)
+        return hash(self.signature)
 
     def __eq__(self, other):
-        return hash(self) == hash(other)
+        return isinstance(other, Fault) and self.signature == other.signature
 
 
 class LogReader(object):
-    def __init__(self, packageName: str, deviceSerial: str = None):
+    def __init__(self, packageName: str, deviceSerial: str = None, streaming: bool = False,
+                 streamingTimeout: float = 0.2, maxQueuedLines: int = 100000, maxStoredLines: int = 100000):
         self.packageName = packageName
         self.device = deviceSerial
+        # streaming mode keeps one logcat process open instead of dumping the whole buffer on every read
+        self.streaming = streaming
+        self.streamingTimeout = streamingTimeout
+        self.maxQueuedLines = maxQueuedLines
+        self.stream = None
+        # where the last stream stopped: newest timestamp read and the lines read at it
+        self.streamTimestamp, self.streamLines = None, set()
+        self.droppedStreamLines = 0
         # self.apkFilePath = apkPath
         self.apkPid = None
         self.lastBufferPosition = 0
-        self.rawLines, self.instrumentationLines, self.faults = [], [], []
+        # lines kept by readLog, the lines that are neither InstruAPK nor part of a fault in a ring buffer
+        self.store = LogStore(LogLine, InstrumentationLine, maxStoredLines)
+        self.faults = []
         self.uniqueFaultsEpisode, self.uniqueFaultsTotal = set(), set()
         self.lastCoverageRequest = 0
         self.lastFaultRequest = 0
+        self.lastRawLine = ""
+        self.parsedLines = 0
+        # fault still being read at the end of the previous lines, the scanner keeps its state
+        self.faultScanner = FaultScanner(packageName)
+        self.pendingFaultLines = []
+
+    @property
+    def rawLines(self):
+        # LogStore, iterates over the kept lines in index order
+        return self.store
+
+    @property
+    def instrumentationLines(self):
+        return self.store.instrumentation.column("index").tolist()
 
     def readLog(self):
-        newLines, newInstrumentationLines, newFaults = self.readRawLines(self.getLogLines())
-        self.rawLines += newLines
-        self.instrumentationLines += newInstrumentationLines
+        newLines, newInstrumentationLines, newFaults = self.parseLines(self.getLogLines())
+        self.store.extend(newLines, newInstrumentationLines, newFaults)
         self.faults += newFaults
         self.uniqueFaultsEpisode.update(newFaults)
         self.uniqueFaultsTotal.update(newFaults)
         return self.rawLines, self.instrumentationLines, self.faults
 
+    def parseLines(self, lines):
+        # same as readLog without keeping the lines, for a LogIngestionService that hands them to its consumers
+        newLines, newInstrumentationLines, newFaults = self.readRawLines(lines, self.parsedLines)
+        self.parsedLines += len(newLines)
+        return newLines, newInstrumentationLines, newFaults
+
     def runReadCommand(self, command):
         logCollect = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         stdout, stderr = logCollect.communicate()
@@ -137,7 +170,7 @@ class LogReader(object):
         if self.lastBufferPosition >= len(stdout):
             # opcion 1, si las lineas finales son iguales -> no leí nada
             decodedLines = stdout.decode('utf-8').splitlines() if len(stdout) > 0 else [""]
-            lastReadLine = self.rawLines[-1].rawLine if len(self.rawLines) > 0 else ""
+            lastReadLine = self.lastRawLine
             if lastReadLine == decodedLines[-1]:
                 return []
             # opcion 2, si las lineas finales son diferentes -> leí algo
@@ -160,25 +193,17 @@ class LogReader(object):
 
     def getPIDApk(self, packageName):
         # Get PID of the APK
-        command = ['adb']
-        command = self.addDeviceSerial(command)
-        command.append("shell")
-        command.append("pidof")
-        command.append("-s")
-        command.append(packageName)
         pid = None
-        try:
-            pid = subprocess.check_output(command).decode('utf-8').strip()
-        except subprocess.CalledProcessError as c:
+        result = adb_client(self.device).shell(f"pidof -s {packageName}")
+        if result.exit_code == 0:
+            pid = result.output.strip()
+        else:
             print(f"app with package name {packageName} was not found")
         if pid is not None and pid.isnumeric():
             pid = int(pid)
         return pid
 
-    def getLogLines(self):
-
-        logLines = []
-
+    def logcatCommand(self):
         command = ['adb']
         command = self.addDeviceSerial(command)
         command.append('logcat')
@@ -186,6 +211,56 @@ class LogReader(object):
         command.append('epoch')
         command.append('-v')
         command.append('threadtime')
+        return command
+
+    def getStreamedLogLines(self):
+        logLines = []
+        if self.stream is None or not self.stream.isAlive():
+            logLines = self.retireStream()
+            # started lazily, so that the reader can still be handed to another process before the first read
+            command = self.logcatCommand()
+            if self.streamTimestamp is not None:
+                # restarted from the last line read, not from the start of the buffer
+                command += ['-T', f'{self.streamTimestamp:.3f}']
+            self.stream = LogcatStream(command, self.packageName, self.getPIDApk(self.packageName) or self.apkPid,
+                                       self.maxQueuedLines, self.streamTimestamp, self.streamLines).start()
+        logLines += self.stream.readLines(self.streamingTimeout)
+        self.apkPid = self.stream.currentPid
+        return logLines
+
+    def retireStream(self):
+        """
+        Stops the stream, keeping where it stopped for the next one.
+        :return: (list) lines it had queued
+        """
+        if self.stream is None:
+            return []
+        self.stream.stop()
+        if self.stream.reader is not None:
+            self.stream.reader.join(1)
+        logLines = self.stream.readLines()
+        if self.stream.lastTimestamp is not None:
+            self.streamTimestamp, self.streamLines = self.stream.lastTimestamp, self.stream.lastLines
+        self.droppedStreamLines += self.stream.droppedLines
+        self.stream = None
+        return logLines
+
+    @property
+    def droppedLines(self) -> int:
+        # lines of the app discarded because the reads fell behind the stream
+        return self.droppedStreamLines + (self.stream.droppedLines if self.stream is not None else 0)
+
+    def closeStream(self):
+        # the lines still queued were not asked for
+        self.retireStream()
+
+    def getLogLines(self):
+        if self.streaming:
+            return self.getStreamedLogLines()
+
+        logLines = []
+
+        command = self.logcatCommand()
         command.append('-d')
 
         previousPID = self.apkPid
@@ -214,80 +289,78 @@ class LogReader(object):
         self.apkPid = currentPID
         return logLines
 
-    def readRawLines(self, lines):
-        # ["Exception:", "Error:", "FATAL EXCEPTION"]
-        faultStartKeywords = [fault.value for fault in FaultType]
-        faultReadingKeywords = ["Caused by", ": at ", ": ... ", f"Process: {self.packageName}", "AndroidRuntime: "]
-        faultReading = False
-        currentFaultLines: list[LogLine] = []
-        faults: list[Fault] = []
-        # debugInstrumentationLines: list[InstrumentationLine] = []
-        instrumentationLines: list[int] = []
-        rawLines: list[LogLine] = []
+    def readRawLines(self, lines, index=None):
         # line example
         #         1651079062.458 11732 11798 I ProviderInstaller: Installed default security provider GmsCore_OpenSSL
-        index = len(self.rawLines)
+        if index is None:
+            index = self.parsedLines
+        logLines: list[LogLine] = []
         for line in lines:
-            logLine = None
             if line.startswith("--") or len(line) == 0 or line.isspace():
                 continue
-            else:
-                try:
-                    logLine = LogLine(line, index)
-                except Exception as v:
-                    print(f"Error parsing line: '{line}'")
-                    traceback.print_exc()
-                    continue
-            rawLines.append(logLine)
+            try:
+                logLine = LogLine(line, index)
+            except Exception as v:
+                print(f"Error parsing line: '{line}'")
+                traceback.print_exc()
+                continue
             if logLine.message.startswith("InstruAPK"):
                 logLine = InstrumentationLine(line, index)
-                rawLines[-1] = logLine
-                instrumentationLines.append(index)
-            else:
-                if faultReading:
-                    if any(keyword in logLine.message for keyword in faultReadingKeywords):
-                        currentFaultLines.append(logLine)
-                    else:
-                        faultReading = False
-                        newFault = Fault(currentFaultLines)
-                        faults.append(newFault)
-                        currentFaultLines.clear()
-                        faultReadingKeywords.pop()
-                elif logLine.tag == LogTag.ERROR or any(keyword in logLine.message for keyword in faultStartKeywords):
-                    if not faultReading:
-                        # Add header into the array to match following lines
-                        faultReadingKeywords.append(logLine.message.split(":")[1].strip())
-                        faultReading = True
-                    currentFaultLines.append(logLine)
+            logLines.append(logLine)
             index += 1
-
-        return rawLines, instrumentationLines, faults
+        if logLines:
+            self.lastRawLine = logLines[-1].rawLine
+        return self.classifyLines(logLines)
+
+    def classifyLines(self, logLines, flags=None):
+        """
+        :param logLines: (list) LogLine objects read
+        :param flags: (numpy.ndarray) flags of the lines given by the FaultScanner, searched in their text if None
+        :return: (tuple) the lines, indices of the InstruAPK lines, faults ended in the lines
+        """
+        # the lines are only looked at one by one by the scanner, around the faults, these loops run in C
+        instrumented = np.fromiter(map(isinstance, logLines, repeat(InstrumentationLine)), dtype=bool,
+                                   count=len(logLines))
+        instrumentationLines: list[int] = list(map(attrgetter("index"),
+                                                   map(logLines.__getitem__, np.flatnonzero(instrumented).tolist())))
+        if flags is None:
+            flags = self.faultScanner.markLines(logLines, np.flatnonzero(~instrumented).tolist())
+        flags[instrumented] |= INSTRUMENTED
+        faults: list[Fault] = []
+        currentFaultLines: list[LogLine] = self.pendingFaultLines
+        for position, event in self.faultScanner.scan(logLines, flags):
+            if event == FAULT_END:
+                faults.append(Fault(currentFaultLines))
+                currentFaultLines = []
+            elif event == FAULT_START:
+                currentFaultLines = [logLines[position]]
+            else:
+                currentFaultLines.append(logLines[position])
+        # a fault cut by the end of a read or of a chunk is completed by the next lines
+        self.pendingFaultLines = currentFaultLines if self.faultScanner.reading else []
+        return logLines, instrumentationLines, faults
 
     def clearLog(self, clearPhoneLogcat=True, clearFaults=False, clearInstrumentation=False):
         if clearPhoneLogcat:
-            subprocess.Popen(['adb', 'logcat', '-c'])
+            adb_client(self.device).check_shell("logcat -c")
+            # the next dump starts from the first line logged after the clear
             self.lastBufferPosition = 0
+            self.lastRawLine = ""
         if clearFaults:
             self.faults.clear()
+            self.pendingFaultLines = []
+            self.faultScanner.reset()
             self.lastFaultRequest = 0
         if clearInstrumentation:
             self.lastCoverageRequest = 0
-            self.instrumentationLines.clear()
-            self.rawLines.clear()
-        else:
-            for lineindex in range(len(self.rawLines) - 1, -1, -1):
-                if not isinstance(self.rawLines[lineindex], InstrumentationLine):
-                    del self.rawLines[lineindex]
-            self.instrumentationLines = list(range(len(self.rawLines)))
+        self.store.clear(instrumentation=clearInstrumentation)
         return
 
     def getFaults(self):
         return self.faults
 
     def getInstrumentationLines(self):
-        lines: list[InstrumentationLine] = []
-        for line in self.instrumentationLines:
-            lines.append(self.rawLines[line])
+        lines: list[InstrumentationLine] = list(self.store.instrumentation)
         return lines
 
     def getNewFaults(self):
@@ -301,12 +374,14 @@ class LogReader(object):
         return uniqueEpisode, list(self.uniqueFaultsTotal)
 
     def getNewInstrumentationLines(self):
-        newLines: list[InstrumentationLine] = []
-        for line in self.instrumentationLines[self.lastCoverageRequest:]:
-            newLines.append(self.rawLines[line])
-        self.lastCoverageRequest = len(self.instrumentationLines)
+        newLines: list[InstrumentationLine] = list(self.store.instrumentation.lines(self.lastCoverageRequest))
+        self.lastCoverageRequest = self.store.instrumentation.appended
         return newLines
 
+    def getMemoryUsage(self) -> dict:
+        # lines kept by readLog and the bytes they use
+        return self.store.stats()
+
     def clear_unique_faults(self):
         self.uniqueFaultsTotal.clear()
 
@@ -0,0 +1,267 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from heapq import merge
+from itertools import groupby
+import sys
+
+import numpy as np
+
+# bytes per line besides the arena and the columns: the share of the block and array headers
+BLOCK_OVERHEAD = 4
+# letters of the LogTag priorities, the other fourth fields of a text line are stored as "u"
+TAG_LETTERS = np.frombuffer("VDIWEFS".encode("utf-32-le"), dtype=np.uint32)
+UNKNOWN_TAG = ord("u")
+# padding of the fields of a text line, a missing field is empty
+NO_FIELDS = [""] * 4
+
+
+def toNumbers(tokens: list, dtype, default) -> np.ndarray:
+    """
+    :param tokens: (list) str of numbers, `default` for the others
+    """
+    try:
+        return np.array(list(map(dtype, tokens)), dtype=dtype)
+    except ValueError:
+        numbers = []
+        for token in tokens:
+            try:
+                numbers.append(dtype(token) if dtype is float or token.isdigit() else default)
+            except ValueError:
+                numbers.append(default)
+        return np.array(numbers, dtype=dtype)
+
+
+class LineBlock(object):
+    """
+    Up to `size` lines stored column by column: the lines are concatenated in a byte arena, each followed by a
+    newline, every other field is a typed array. A text line is kept as it was read; for a `logcat -B` record only
+    the message is kept, the raw line is printed from the columns. A LogLine is only rebuilt when it is read.
+    :param binary: (bool) the block holds `logcat -B` records
+    """
+    __slots__ = ("binary", "index", "time", "pid", "tid", "tag", "lineStart", "messageStart", "arena")
+
+    def __init__(self, binary: bool = False):
+        self.binary = binary
+        self.index = array("q")
+        self.time = array("d")
+        self.pid = array("i")
+        self.tid = array("i")
+        # first character of the priority, "u" when unknown
+        self.tag = array("B")
+        self.lineStart = array("I")
+        # start of LogLine.message, "<tag>: <message>"
+        self.messageStart = array("I")
+        self.arena = bytearray()
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def appendColumn(column: array, values):
+        column.frombytes(np.ascontiguousarray(values, dtype=column.typecode).tobytes())
+
+    def extend(self, logLines: list):
+        """
+        :param logLines: (list) LogLine objects, all read as text or all from the same LogRecords
+        """
+        if self.binary:
+            self.extendRecords(logLines)
+        else:
+            self.extendText(logLines)
+
+    def extendText(self, logLines: list):
+        raws = [logLine.rawLine for logLine in logLines]
+        # the fields as LogLine splits them, the fifth is the message
+        fields = [raw.split(None, 4) + NO_FIELDS for raw in raws]
+        data = ("\n".join(raws) + "\n").encode("utf-8", errors="replace")
+        lengths = np.fromiter(map(len, raws), dtype=np.int64, count=len(raws))
+        messageOffsets = lengths - [len(field[4]) for field in fields]
+        if len(data) != lengths.sum() + len(raws):
+            # not only ASCII, the offsets are counted in bytes
+            lengths = np.array([len(raw.encode("utf-8", errors="replace")) for raw in raws], dtype=np.int64)
+            messageOffsets = [len(raw[:offset].encode("utf-8", errors="replace"))
+                              for raw, offset in zip(raws, messageOffsets.tolist())]
+        lineStart = len(self.arena) + np.cumsum(lengths + 1) - lengths - 1
+        priorities = np.array([field[3] for field in fields], dtype="U2").view(np.uint32).reshape(-1, 2)
+        self.appendColumn(self.index, [logLine.index for logLine in logLines])
+        self.appendColumn(self.time, toNumbers([field[0] for field in fields], float, 0.0))
+        self.appendColumn(self.pid, toNumbers([field[1] for field in fields], int, -1))
+        self.appendColumn(self.tid, toNumbers([field[2] for field in fields], int, -1))
+        self.appendColumn(self.tag, np.where((priorities[:, 1] == 0) & np.isin(priorities[:, 0], TAG_LETTERS),
+                                             priorities[:, 0], UNKNOWN_TAG))
+        self.appendColumn(self.lineStart, lineStart)
+        self.appendColumn(self.messageStart, lineStart + messageOffsets)
+        self.arena += data
+
+    def extendRecords(self, logLines: list):
+        records = logLines[0].records
+        positions = np.fromiter((logLine.record for logLine in logLines), dtype=np.int64, count=len(logLines))
+        data, starts = records.messages(positions)
+        self.appendColumn(self.index, [logLine.index for logLine in logLines])
+        self.appendColumn(self.time, records.sec[positions] + records.nsec[positions] / 1e9)
+        self.appendColumn(self.pid, records.pid[positions])
+        self.appendColumn(self.tid, records.tid[positions].astype(np.int64))
+        self.appendColumn(self.tag, records.priorityLetters(positions))
+        self.appendColumn(self.lineStart, len(self.arena) + starts)
+        self.appendColumn(self.messageStart, len(self.arena) + starts)
+        self.arena += data
+
+    def lineEnd(self, i: int) -> int:
+        # before the newline
+        return (self.lineStart[i + 1] if i + 1 < len(self.lineStart) else len(self.arena)) - 1
+
+    def message(self, i: int) -> str:
+        return self.arena[self.messageStart[i]:self.lineEnd(i)].decode("utf-8", errors="replace")
+
+    def rawLine(self, i: int) -> str:
+        line = self.arena[self.lineStart[i]:self.lineEnd(i)].decode("utf-8", errors="replace")
+        if self.binary:
+            # as BinaryLogLine.rawLine
+            return f"{self.time[i]:.3f} {self.pid[i]} {self.tid[i] & 0xffffffff} {chr(self.tag[i])} {line}"
+        return line
+
+    def nbytes(self) -> int:
+        columns = (self.index, self.time, self.pid, self.tid, self.tag, self.lineStart, self.messageStart)
+        return len(self.arena) + sum(column.itemsize * len(column) for column in columns) + \
+            BLOCK_OVERHEAD * len(self) + sys.getsizeof(self)
+
+
+class LogSegment(object):
+    """
+    Lines of one kind in blocks of `blockSize` lines. With a capacity the oldest block is dropped once the segment
+    holds more lines, so the segment behaves as a ring buffer. `clear` starts a new epoch: the blocks are dropped
+    at once and the positions handed out before are no longer valid.
+    :param lineClass: (type) LogLine class rebuilt from the stored raw lines
+    :param capacity: (int) max lines kept, None keeps every line until the next clear
+    :param blockSize: (int) lines per block
+    """
+
+    def __init__(self, lineClass, capacity: int = None, blockSize: int = 4096):
+        self.lineClass = lineClass
+        self.capacity = capacity
+        self.blockSize = blockSize if capacity is None else max(1, min(blockSize, capacity))
+        self.blocks = deque()
+        self.epoch = 0
+        # lines appended since the last clear, and those of them dropped by the ring
+        self.appended = 0
+        self.dropped = 0
+        self.totalDropped = 0
+
+    def __len__(self):
+        return self.appended - self.dropped
+
+    def extend(self, logLines):
+        """
+        :param logLines: (iterable) LogLine objects, in index order. The lines parsed from `logcat -B` are copied
+        from their LogRecords without being decoded.
+        """
+        for records, run in groupby(logLines, key=lambda logLine: getattr(logLine, "records", None)):
+            run = list(run)
+            while run:
+                block = self.blocks[-1] if self.blocks else None
+                if block is None or len(block) >= self.blockSize or block.binary != (records is not None):
+                    block = LineBlock(records is not None)
+                    self.blocks.append(block)
+                count = self.blockSize - len(block)
+                block.extend(run[:count])
+                self.appended += len(run[:count])
+                run = run[count:]
+                while self.capacity is not None and len(self) - len(self.blocks[0]) >= self.capacity:
+                    dropped = len(self.blocks.popleft())
+                    self.dropped += dropped
+                    self.totalDropped += dropped
+
+    def clear(self):
+        self.blocks = deque()
+        self.epoch += 1
+        self.appended = self.dropped = 0
+
+    def lines(self, position: int = 0):
+        """
+        :param position: (int) number of lines appended since the last clear to skip
+        :return: (generator) LogLine objects rebuilt from the lines kept after `position`
+        """
+        skip = max(position - self.dropped, 0)
+        for block in list(self.blocks):
+            if skip >= len(block):
+                skip -= len(block)
+                continue
+            for i in range(skip, len(block)):
+                yield self.lineClass(block.rawLine(i), block.index[i])
+            skip = 0
+
+    def rawLines(self, first: int, last: int):
+        """
+        :return: (generator) raw lines kept whose index is between `first` and `last` included, only these are decoded
+        """
+        for block in list(self.blocks):
+            if not len(block) or block.index[-1] < first or block.index[0] > last:
+                continue
+            for i in range(bisect_left(block.index, first), bisect_right(block.index, last)):
+                yield block.rawLine(i)
+
+    def __iter__(self):
+        return self.lines()
+
+    def column(self, name: str) -> np.ndarray:
+        arrays = [np.frombuffer(getattr(block, name), dtype=getattr(block, name).typecode) for block in self.blocks]
+        return np.concatenate(arrays) if arrays else np.empty(0)
+
+    def nbytes(self) -> int:
+        return sum(block.nbytes() for block in self.blocks)
+
+
+class LogStore(object):
+    """
+    Bounded storage of the lines read by a LogReader. The InstruAPK lines are kept until the coverage is cleared,
+    the lines of the faults until the faults are cleared (every Fault also holds its lines), the other lines in a
+    ring buffer of `capacity` lines. Clearing is O(1) whatever the number of stored lines.
+    :param lineClass: (type) class of the plain lines
+    :param instrumentationLineClass: (type) class of the InstruAPK lines
+    :param capacity: (int) plain lines kept, None for no limit
+    """
+
+    def __init__(self, lineClass, instrumentationLineClass, capacity: int = 100000, blockSize: int = 4096):
+        self.instrumentation = LogSegment(instrumentationLineClass, blockSize=blockSize)
+        self.faults = LogSegment(lineClass, blockSize=blockSize)
+        self.others = LogSegment(lineClass, capacity, blockSize)
+
+    def extend(self, logLines, instrumentationLines, faults):
+        """
+        :param logLines: (list) LogLine objects, in index order
+        :param instrumentationLines: (list) indices of the InstruAPK lines among them
+        :param faults: (list) Fault objects found in them
+        """
+        instrumented = set(instrumentationLines)
+        faulty = {id(line) for fault in faults for line in [fault.header] + fault.lines}
+        if not instrumented and not faulty:
+            self.others.extend(logLines)
+            return
+        segments = ([], [], [])
+        for logLine in logLines:
+            segments[0 if logLine.index in instrumented else 1 if id(logLine) in faulty else 2].append(logLine)
+        self.instrumentation.extend(segments[0])
+        self.faults.extend(segments[1])
+        self.others.extend(segments[2])
+
+    def __len__(self):
+        return len(self.instrumentation) + len(self.faults) + len(self.others)
+
+    def __iter__(self):
+        # every kept line, in index order
+        return merge(self.instrumentation, self.faults, self.others, key=lambda line: line.index)
+
+    def clear(self, instrumentation: bool = False):
+        # the InstruAPK lines stay unless asked, they were not necessarily reported to the coverage yet
+        self.faults.clear()
+        self.others.clear()
+        if instrumentation:
+            self.instrumentation.clear()
+
+    def nbytes(self) -> int:
+        return self.instrumentation.nbytes() + self.faults.nbytes() + self.others.nbytes()
+
+    def stats(self) -> dict:
+        return {"instrumentationLines": len(self.instrumentation), "faultLines": len(self.faults),
+                "otherLines": len(self.others), "droppedLines": self.others.totalDropped, "bytes": self.nbytes()}
@@ -0,0 +1,117 @@
+import queue
+import re
+import subprocess
+import threading
+
+# ActivityManager line used to follow the app process without polling pidof
+START_PROC_PATTERN = re.compile(r"Start proc (\d+):([\w.]+)")
+
+
+class LogcatStream(object):
+    """
+    Long-lived `adb logcat` process read by a background thread. Only the lines of the tracked app process are
+    queued, the PID is followed through the ActivityManager lines of the stream itself. A stream restarted with
+    `-T <lastTimestamp>` is given the lines read at that timestamp, they are not queued again.
+    """
+
+    def __init__(self, command, packageName: str, initialPid=None, maxQueuedLines: int = 100000, since: float = None,
+                 sinceLines=()):
+        self.command = command
+        self.packageName = packageName
+        self.currentPid = initialPid
+        # lines of the previous process are still accepted, a crash is logged by the dying process
+        self.trackedPids = set() if initialPid is None else {str(initialPid)}
+        self.lines = queue.Queue(maxsize=maxQueuedLines)
+        self.droppedLines = 0
+        # newest timestamp read and the lines read at it
+        self.lastTimestamp, self.lastLines = None, set()
+        # timestamp given to `-T` and the lines already read at it
+        self.since, self.sinceLines = since, set(sinceLines)
+        self.process = None
+        self.reader = None
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.reader = threading.Thread(name=f"logcat-{self.packageName}", target=self.readStream, daemon=True)
+        self.reader.start()
+        return self
+
+    def isAlive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def trackPid(self, line: str):
+        if "Start proc" in line:
+            match = START_PROC_PATTERN.search(line)
+            if match is not None and match.group(2) == self.packageName:
+                self.followPid(match.group(1))
+        elif " InstruAPK:" in line:
+            # only the app is instrumented, its Start proc line may have been cleared by `logcat -c` before being read
+            lineComponents = line.split(None, 2)
+            if len(lineComponents) > 1 and lineComponents[1] not in self.trackedPids:
+                self.followPid(lineComponents[1])
+
+    def followPid(self, pid: str):
+        if self.currentPid is not None:
+            self.trackedPids = {str(self.currentPid), pid}
+        else:
+            self.trackedPids = {pid}
+        self.currentPid = int(pid)
+        print(f"App with package name {self.packageName} started with PID {pid}")
+
+    def isNewLine(self, line: str, lineComponents) -> bool:
+        try:
+            timestamp = float(lineComponents[0])
+        except (IndexError, ValueError):
+            return True
+        if self.since is not None:
+            # `-T` starts at the timestamp of the last line read, the lines read at that time come again
+            if timestamp <= self.since and line in self.sinceLines:
+                return False
+            if timestamp > self.since:
+                self.since = None
+        if self.lastTimestamp is None or timestamp > self.lastTimestamp:
+            self.lastTimestamp, self.lastLines = timestamp, set()
+        if timestamp == self.lastTimestamp:
+            self.lastLines.add(line)
+        return True
+
+    def readStream(self):
+        for rawLine in iter(self.process.stdout.readline, b""):
+            line = rawLine.decode("utf-8", errors="replace").rstrip("\r\n")
+            lineComponents = line.split(None, 2)
+            if not self.isNewLine(line, lineComponents):
+                continue
+            self.trackPid(line)
+            if len(lineComponents) < 2 or lineComponents[1] not in self.trackedPids:
+                continue
+            try:
+                self.lines.put_nowait(line)
+            except queue.Full:
+                # the consumer fell behind, the oldest line is discarded to keep memory bounded
+                try:
+                    self.lines.get_nowait()
+                except queue.Empty:
+                    pass
+                self.droppedLines += 1
+                self.lines.put_nowait(line)
+
+    def readLines(self, timeout: float = 0.0):
+        # waits for the first line at most `timeout` seconds, then takes whatever is already queued
+        lines = []
+        try:
+            lines.append(self.lines.get(timeout=timeout) if timeout > 0 else self.lines.get_nowait())
+        except queue.Empty:
+            return lines
+        while True:
+            try:
+                lines.append(self.lines.get_nowait())
+            except queue.Empty:
+                return lines
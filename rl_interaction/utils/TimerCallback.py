@@ -54,12 +54,13 @@ class TimerCallback(BaseCallback):
         """
         if self.timer.timer_expired():
             logger.info(f'Timer expired at {self.num_timesteps}')
-            self.app.coverage_count += 1
-            if self.app.instr:
-                self.app.instr_funct(udid=self.app.udid, package=self.app.package, coverage_dir=self.app.coverage_dir,
-                                     coverage_count=self.app.coverage_count)
+            if self.app is None:
+                # Vectorized env: every device collects its own coverage
+                self.training_env.env_method('collect_coverage')
+            else:
+                self.app.collect_coverage()
             return False
-        elif self.app.instr:
+        elif self.app is not None and self.app.instr:
             # if (self.num_timesteps % 25) == 0:
             #     self.app.coverage_count += 1
             #     self.app.instr_funct(udid=self.app.udid, package=self.app.package, coverage_dir=self.app.coverage_dir,
@@ -0,0 +1,209 @@
+import os
+import socket
+import struct
+import subprocess
+import time
+import uuid
+from collections import namedtuple
+
+from loguru import logger
+
+DEFAULT_SERVER_PORT = 5037
+SYNC_CHUNK = 64 * 1024
+
+ShellResult = namedtuple('ShellResult', ['command', 'output', 'exit_code'])
+
+
+class AdbError(Exception):
+    pass
+
+
+def server_address():
+    # same variables as the adb client, ADB_SERVER_SOCKET=tcp:<host>:<port> takes precedence
+    server_socket = os.environ.get('ADB_SERVER_SOCKET', '')
+    if server_socket.startswith('tcp:'):
+        host, _, port = server_socket[len('tcp:'):].rpartition(':')
+        return host or '127.0.0.1', int(port)
+    return '127.0.0.1', int(os.environ.get('ANDROID_ADB_SERVER_PORT', DEFAULT_SERVER_PORT))
+
+
+class AdbClient:
+    """
+    Runs device commands through the adb server's host protocol on a local socket, without spawning an `adb`
+    process per command. Every shell command reports its exit code, several commands can share one round trip
+    with shell_batch. When the server cannot be reached the commands fall back to the `adb` executable.
+    :param serial: (str) device, None for the only device connected
+    :param timeout: (float) default timeout of a command in seconds
+    """
+    def __init__(self, serial=None, timeout=30.0):
+        self.serial = serial
+        self.timeout = timeout
+        self.address = server_address()
+        self.use_server = True
+        self._adb_path = None
+
+    @property
+    def adb_path(self):
+        if self._adb_path is None:
+            from utils.utils import Utils
+            self._adb_path = Utils.get_adb_executable_path()
+        return self._adb_path
+
+    @staticmethod
+    def read_exactly(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbError('connection closed by the adb server')
+            data.extend(chunk)
+        return bytes(data)
+
+    def read_status(self, sock):
+        status = self.read_exactly(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            length = int(self.read_exactly(sock, 4), 16)
+            raise AdbError(self.read_exactly(sock, length).decode(errors='replace'))
+        raise AdbError(f'unexpected adb server answer {status!r}')
+
+    def send_request(self, sock, request):
+        data = request.encode()
+        sock.sendall(b'%04x' % len(data) + data)
+        self.read_status(sock)
+
+    def open_service(self, service, timeout):
+        sock = socket.create_connection(self.address, timeout=timeout)
+        try:
+            self.send_request(sock, f'host:transport:{self.serial}' if self.serial else 'host:transport-any')
+            self.send_request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def run_service(self, service, timeout):
+        deadline = time.monotonic() + timeout
+        with self.open_service(service, timeout) as sock:
+            chunks = []
+            while True:
+                # a device that keeps writing must not hold the command past its timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(f'{service} took more than {timeout} s')
+                sock.settimeout(remaining)
+                chunk = sock.recv(SYNC_CHUNK)
+                if not chunk:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+
+    def run_adb(self, args, timeout):
+        command = [self.adb_path] + (['-s', self.serial] if self.serial else []) + args
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout)
+        return process.stdout, process.returncode
+
+    def shell_batch(self, commands, timeout=None):
+        """
+        Runs several shell commands in a single shell session, one after the other.
+        :param commands: (list) shell command lines
+        :param timeout: (float) seconds for the whole batch
+        :return: (list) a ShellResult per command
+        """
+        if not commands:
+            return []
+        timeout = timeout or self.timeout
+        # every command is followed by a marker carrying its exit code
+        marker = f'__ARES_{uuid.uuid4().hex[:8]}__'
+        script = '; '.join(f'{command}; echo "{marker}$?"' for command in commands)
+        if self.use_server:
+            try:
+                output = self.run_service(f'shell:{script}', timeout)
+            except ConnectionRefusedError:
+                logger.warning(f'adb server not reachable on {self.address[0]}:{self.address[1]}, '
+                               f'running the adb executable')
+                self.use_server = False
+        if not self.use_server:
+            output, _ = self.run_adb(['shell', script], timeout)
+        return self.split_batch(commands, output.decode(errors='replace'), marker)
+
+    @staticmethod
+    def split_batch(commands, output, marker):
+        results = []
+        rest = output.replace('\r\n', '\n')
+        for command in commands:
+            head, found, tail = rest.partition(marker)
+            if not found:
+                # the session ended early, e.g. the device went away
+                results.append(ShellResult(command, head, None))
+                rest = ''
+                continue
+            code, _, rest = tail.partition('\n')
+            results.append(ShellResult(command, head, int(code) if code.strip().isdigit() else None))
+        return results
+
+    def shell(self, command, timeout=None):
+        """
+        :param command: (str) shell command line
+        :param timeout: (float) seconds
+        :return: (ShellResult) output with stderr merged, exit code (None if unknown)
+        """
+        return self.shell_batch([command], timeout)[0]
+
+    def check_shell(self, command, timeout=None):
+        """
+        Same as shell, for the commands whose failure is not fatal: a failed command and a transport error (device
+        offline or unknown, timeout) are logged, the latter gives an exit code of None.
+        """
+        try:
+            result = self.shell(command, timeout)
+        except (AdbError, OSError, subprocess.SubprocessError) as e:
+            logger.warning(f'`{command}` could not run on {self.serial}: {e!r}')
+            return ShellResult(command, '', None)
+        if result.exit_code != 0:
+            logger.warning(f'`{command}` failed on {self.serial} with exit code {result.exit_code}: '
+                           f'{result.output.strip()}')
+        return result
+
+    def pull(self, remote, local, timeout=None):
+        """
+        Copies a file from the device with the sync protocol.
+        :param remote: (str) path on the device
+        :param local: (str) destination path
+        """
+        timeout = timeout or self.timeout
+        if self.use_server:
+            try:
+                with self.open_service('sync:', timeout) as sock:
+                    path = remote.encode()
+                    sock.sendall(b'RECV' + struct.pack('<I', len(path)) + path)
+                    with open(local, 'wb') as file:
+                        while True:
+                            header = self.read_exactly(sock, 8)
+                            kind, length = header[:4], struct.unpack('<I', header[4:])[0]
+                            if kind == b'DATA':
+                                file.write(self.read_exactly(sock, length))
+                            elif kind == b'DONE':
+                                break
+                            else:
+                                message = self.read_exactly(sock, length).decode(errors='replace')
+                                raise AdbError(f'pull of {remote} failed: {message}')
+                    sock.sendall(b'QUIT' + struct.pack('<I', 0))
+                return
+            except ConnectionRefusedError:
+                self.use_server = False
+        output, code = self.run_adb(['pull', remote, local], timeout)
+        if code != 0:
+            raise AdbError(f'pull of {remote} failed: {output.decode(errors="replace").strip()}')
+
+
+clients = {}
+
+
+def adb_client(serial=None):
+    """
+    :return: (AdbClient) client shared by every caller in the process for the device
+    """
+    if serial not in clients:
+        clients[serial] = AdbClient(serial)
+    return clients[serial]
@@ -1,21 +1,123 @@
-from androguard.core.bytecodes import apk
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
 from collections import deque
+from multiprocessing import Pool
 
+from loguru import logger
 
-def analyze(apk_path, coverage_dict_template):
+# bumped whenever the content of the cached manifests changes
+CACHE_VERSION = 1
+
+
+def analyze(apk_path, coverage_dict_template, cache_dir=None):
+    """
+    :param apk_path: (str) app to analyze
+    :param coverage_dict_template: (dict) filled with one entry per activity
+    :param cache_dir: (str) folder of the manifests cached by SHA-256 of the apk, None to always run androguard
+    :return: (tuple) exported activities, services, receivers, providers, activities string, package
+    """
     string_activities = '*'
+    manifest = cached_manifest(apk_path, cache_dir) if cache_dir else analyze_manifest(apk_path)
+    for activity in manifest['activities']:
+        # string_activities += f'{activity}, '
+        coverage_dict_template.update({activity: {'visited': False}})
+    # intents rotate their actions
+    services, receivers, providers = ([dict(component, action=deque(component['action']))
+                                       for component in manifest[kind]]
+                                      for kind in ('services', 'receivers', 'providers'))
+    return list(manifest['exported_activities']), services, receivers, providers, string_activities, \
+        manifest['package']
+
+
+def analyze_manifest(apk_path):
+    """
+    Parses the apk with androguard.
+    :return: (dict) JSON serializable summary of the manifest
+    """
+    # imported on a cache miss only, androguard takes a long time to import
+    from androguard.core.bytecodes import apk
     a = apk.APK(apk_path)
     activities, services, receivers, providers = find_exported_components(a)
-    androguard_activities = a.get_activities()
+    all_activities = list()
     exported_activities = list()
-    for activity in androguard_activities:
+    for activity in a.get_activities():
         activity = activity.replace("..", ".")
-        # string_activities += f'{activity}, '
-        coverage_dict_template.update({activity: {'visited': False}})
+        all_activities.append(activity)
         for act in activities:
             if act in activity:
                 exported_activities.append(activity)
-    return exported_activities, services, receivers, providers, string_activities, a.package
+    return {'version': CACHE_VERSION, 'package': a.package, 'activities': all_activities,
+            'exported_activities': exported_activities,
+            'services': [dict(service, action=list(service['action'])) for service in services],
+            'receivers': [dict(receiver, action=list(receiver['action'])) for receiver in receivers],
+            'providers': [dict(provider, action=list(provider['action'])) for provider in providers]}
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_manifest(apk_path, cache_dir):
+    """
+    Manifest summary of the apk, read from the cache or computed and stored in it.
+    :param apk_path: (str) app to analyze
+    :param cache_dir: (str) folder of the cache, one `<sha256>.json` per apk
+    :return: (dict) see analyze_manifest
+    """
+    path = os.path.join(cache_dir, f'{sha256(apk_path)}.json')
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+        if manifest.get('version') == CACHE_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    manifest = analyze_manifest(apk_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # written under a temporary name first, concurrent readers never see half a file
+    descriptor, temporary = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(temporary, path)
+    return manifest
+
+
+def cache_worker(arguments):
+    apk_path, cache_dir = arguments
+    try:
+        return apk_path, cached_manifest(apk_path, cache_dir), None
+    except Exception as e:
+        return apk_path, None, f'{type(e).__name__}: {e}'
+
+
+def preanalyze(apk_paths, cache_dir, processes=None):
+    """
+    Fills the cache for several apks in a process pool.
+    :param apk_paths: (list) apps to analyze
+    :param cache_dir: (str) folder of the cache
+    :param processes: (int) size of the pool, the number of CPUs by default
+    :return: (dict) manifest of every apk that could be analyzed
+    """
+    manifests = {}
+    if not apk_paths:
+        return manifests
+    processes = min(processes or os.cpu_count() or 1, len(apk_paths))
+    with Pool(processes) as pool:
+        for apk_path, manifest, error in pool.imap_unordered(cache_worker, [(path, cache_dir) for path in apk_paths]):
+            if error is not None:
+                logger.error(f'{apk_path} could not be analyzed: {error}')
+            else:
+                manifests[apk_path] = manifest
+    return manifests
 
 
 def find_exported_components(apk):
@@ -103,3 +205,19 @@ def find_exported_components(apk):
                         elif tag == "provider":
                             providers.append({'type': 'provider', 'name': name, 'action': actions})
     return activities, services, receivers, providers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyzes the manifests of a folder of apks ahead of the tests')
+    parser.add_argument('--path', type=str, required=True, help='folder of apps')
+    parser.add_argument('--apk_cache', type=str, default='apk_cache')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args(argv)
+    apps = sorted(glob.glob(f'{args.path}{os.sep}*.apk'))
+    manifests = preanalyze(apps, args.apk_cache, args.processes)
+    print(f'{len(manifests)} of {len(apps)} apks analyzed, cache in {args.apk_cache}')
+    return 0 if len(manifests) == len(apps) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import re
+import time
+from collections import deque
+
+from loguru import logger
+
+from utils.adb import adb_client
+
+RESET_STRATEGIES = ['reinstall', 'clear', 'relaunch', 'relaunch_exported']
+PERMISSION_PATTERN = re.compile(r'^\w+(\.\w+)+$')
+
+
+def requested_permissions(dumpsys):
+    """
+    :param dumpsys: (str) output of `dumpsys package <package>`
+    :return: (list) permissions listed under "requested permissions:"
+    """
+    permissions = []
+    in_section = False
+    for line in dumpsys.splitlines():
+        stripped = line.strip()
+        if stripped == 'requested permissions:':
+            in_section = True
+            continue
+        if in_section:
+            # newer releases append the flags of the permission, e.g. ": restricted=true"
+            name = stripped.split(':', 1)[0].strip()
+            if not PERMISSION_PATTERN.match(name):
+                break
+            permissions.append(name)
+    return permissions
+
+
+class AppReset:
+    """
+    Puts the app back in its initial state at the start of an episode.
+    'reinstall' uninstalls and installs the apk again (driver.reset with fullReset), 'clear' wipes the app data with
+    `pm clear`, grants the requested permissions again and starts the launcher activity, 'relaunch' force-stops the
+    app and starts the launcher activity, 'relaunch_exported' does the same starting the exported activities in turn.
+    :param strategy: (str) one of RESET_STRATEGIES
+    :param udid: (str) device
+    :param package: (str) package of the app
+    :param exported_activities: (list) activities started by 'relaunch_exported'
+    """
+    def __init__(self, strategy, udid, package, exported_activities=()):
+        if strategy not in RESET_STRATEGIES:
+            raise ValueError(f'reset strategy must be one of {RESET_STRATEGIES}')
+        self.strategy = strategy
+        self.udid = udid
+        self.package = package
+        self.activities = deque(exported_activities)
+        if strategy == 'relaunch_exported' and not self.activities:
+            logger.warning('No exported activity, relaunching the launcher activity')
+        self.adb = adb_client(udid)
+        self.permissions = None
+        self.durations = []
+
+    def shell(self, command):
+        return self.adb.check_shell(command, timeout=60).output
+
+    def grant_permissions(self):
+        if self.permissions is None:
+            # pm clear revokes the runtime permissions granted by autoGrantPermissions at install time
+            self.permissions = requested_permissions(self.shell(f'dumpsys package {self.package}'))
+        if self.permissions:
+            # install-time permissions cannot be granted, their errors are ignored; one round trip for all of them
+            self.adb.shell_batch([f'pm grant {self.package} {permission}' for permission in self.permissions],
+                                 timeout=60)
+
+    def launch(self, driver):
+        if self.strategy == 'relaunch_exported' and self.activities:
+            activity = self.activities[0]
+            self.activities.rotate(-1)
+            try:
+                driver.start_activity(self.package, activity)
+                return
+            except Exception as e:
+                logger.warning(f'{activity} could not be started, relaunching the launcher activity: {e}')
+        driver.activate_app(self.package)
+
+    def __call__(self, driver):
+        """
+        :param driver: (appium.webdriver.Remote) session of the app
+        :return: (float) seconds taken by the reset
+        """
+        start = time.perf_counter()
+        if self.strategy == 'reinstall':
+            driver.reset()
+        else:
+            if self.strategy == 'clear':
+                self.shell(f'pm clear {self.package}')
+                self.grant_permissions()
+            else:
+                driver.terminate_app(self.package)
+            self.launch(driver)
+        elapsed = time.perf_counter() - start
+        self.durations.append(elapsed)
+        logger.debug(f'{self.strategy} reset in {elapsed:.3f} s')
+        return elapsed
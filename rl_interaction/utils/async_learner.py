@@ -0,0 +1,125 @@
+import copy
+import threading
+import time
+
+from loguru import logger
+from stable_baselines3 import SAC, DDPG
+
+
+class AsyncLearnerMixin:
+    """
+    Off-policy algorithm whose gradient updates run in a learner thread while the actor keeps stepping the device.
+    The actor samples actions from a snapshot of the policy, refreshed every `snapshot_interval` updates into a
+    spare copy that is swapped in between two predictions, and the replay buffer is shared under a lock. `learn` returns once the requested environment steps were collected.
+    :param snapshot_interval: (int) gradient updates between two refreshes of the acting policy
+    :param max_update_ratio: (float) upper bound of gradient updates per environment step, None for no bound
+    """
+    ASYNC_EXCLUDED_PARAMS = ['acting_policy', '_spare_policy', '_snapshot_lock', '_learner_lock', '_learner_stop',
+                             '_learner_thread', '_learner_error']
+
+    def __init__(self, *args, snapshot_interval=10, max_update_ratio=None, **kwargs):
+        self.snapshot_interval = snapshot_interval
+        self.max_update_ratio = max_update_ratio
+        self.acting_policy = self._spare_policy = None
+        # held by the actor while it predicts, and by the learner while it swaps the snapshots
+        self._snapshot_lock = threading.Lock()
+        self.gradient_updates = 0
+        self._learner_lock = threading.Lock()
+        self._learner_stop = threading.Event()
+        self._learner_thread = None
+        self._learner_error = None
+        super(AsyncLearnerMixin, self).__init__(*args, **kwargs)
+
+    def _excluded_save_params(self):
+        return super(AsyncLearnerMixin, self)._excluded_save_params() + self.ASYNC_EXCLUDED_PARAMS
+
+    def updates_per_step(self):
+        return self.gradient_updates / max(self.num_timesteps, 1)
+
+    def refresh_snapshot(self):
+        if self.acting_policy is None:
+            self.acting_policy, self._spare_policy = copy.deepcopy(self.policy), copy.deepcopy(self.policy)
+            self.acting_policy.set_training_mode(False)
+            self._spare_policy.set_training_mode(False)
+            return
+        # no prediction runs on the spare: the last one on it ended before it was swapped out
+        self._spare_policy.load_state_dict(self.policy.state_dict())
+        with self._snapshot_lock:
+            self.acting_policy, self._spare_policy = self._spare_policy, self.acting_policy
+
+    def learner_ready(self):
+        if self.num_timesteps <= self.learning_starts or self.replay_buffer.size() < self.batch_size:
+            return False
+        if self.max_update_ratio is not None:
+            return self.gradient_updates < self.max_update_ratio * self.num_timesteps
+        return True
+
+    def run_learner(self):
+        try:
+            while not self._learner_stop.is_set():
+                if not self.learner_ready():
+                    self._learner_stop.wait(0.01)
+                    continue
+                with self._learner_lock:
+                    super(AsyncLearnerMixin, self).train(gradient_steps=1, batch_size=self.batch_size)
+                    self.gradient_updates += 1
+                    if self.gradient_updates % self.snapshot_interval == 0:
+                        self.refresh_snapshot()
+        except Exception as e:
+            self._learner_error = e
+
+    def start_learner(self):
+        self.refresh_snapshot()
+        self._learner_stop.clear()
+        self._learner_error = None
+        self._learner_thread = threading.Thread(name='async-learner', target=self.run_learner, daemon=True)
+        self._learner_thread.start()
+
+    def stop_learner(self):
+        self._learner_stop.set()
+        if self._learner_thread is not None:
+            self._learner_thread.join()
+            self._learner_thread = None
+        # the saved policy is the trained one, the acting snapshot can lag behind
+        self.refresh_snapshot()
+
+    def learn(self, *args, **kwargs):
+        start = time.time()
+        start_updates, start_steps = self.gradient_updates, self.num_timesteps
+        self.start_learner()
+        try:
+            return super(AsyncLearnerMixin, self).learn(*args, **kwargs)
+        finally:
+            self.stop_learner()
+            steps = self.num_timesteps - start_steps
+            updates = self.gradient_updates - start_updates
+            logger.info(f'Async learner: {updates} gradient updates for {steps} env steps '
+                        f'({updates / max(steps, 1):.2f} updates/step) in {time.time() - start:.1f}s')
+
+    def train(self, gradient_steps, batch_size=100):
+        # the learn loop no longer trains in between env steps, the learner thread does
+        if self._learner_error is not None:
+            raise self._learner_error
+        self.logger.record('train/updates_per_step', self.updates_per_step())
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        if self._learner_thread is None:
+            return super(AsyncLearnerMixin, self).predict(observation, state, episode_start, deterministic)
+        with self._snapshot_lock:
+            return self.acting_policy.predict(observation, state, episode_start, deterministic)
+
+    def _store_transition(self, *args, **kwargs):
+        with self._learner_lock:
+            super(AsyncLearnerMixin, self)._store_transition(*args, **kwargs)
+
+    def _dump_logs(self):
+        with self._learner_lock:
+            super(AsyncLearnerMixin, self)._dump_logs()
+
+
+class AsyncSAC(AsyncLearnerMixin, SAC):
+    pass
+
+
+class AsyncDDPG(AsyncLearnerMixin, DDPG):
+    pass
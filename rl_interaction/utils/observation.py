@@ -0,0 +1,93 @@
+from zlib import crc32
+
+import numpy as np
+
+OVERFLOW_POLICIES = ['hash', 'drop']
+
+
+class ObservationEncoder:
+    """
+    One-hot encoding of the current activity and of the widgets on screen, backed by dictionaries so that
+    every lookup is O(1) no matter how many widgets were discovered during the run.
+    :param list_activities: (list) activities of the app, they take the first slots of the observation
+    :param widget_list: (list) identifiers discovered so far, shared with the caller and extended in place
+    :param observation_space: (int) length of the observation
+    :param overflow: (str) what to do with widgets discovered once every slot is taken: 'hash' folds them onto
+        the widget slots with feature hashing, 'drop' leaves them out of the observation
+    :param dtype: (numpy.dtype) dtype of the observation buffer
+    :param stable_slots: (bool) every widget takes its crc32 slot, so that an identifier has the same position in
+        every process whatever the order the widgets were discovered in (one policy driving several devices)
+    """
+    def __init__(self, list_activities, widget_list, observation_space=2000, overflow='hash', dtype=np.int32,
+                 stable_slots=False):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'overflow must be one of {OVERFLOW_POLICIES}')
+        self.observation_space = observation_space
+        self.overflow = overflow
+        self.stable_slots = stable_slots
+        self.activity_index = {activity: i for i, activity in enumerate(list_activities)
+                               if i < observation_space}
+        self.offset = min(len(list_activities), observation_space)
+        self.capacity = observation_space - self.offset
+        self.widget_list = widget_list
+        self.widget_index = {identifier: i for i, identifier in enumerate(widget_list)}
+        self.buffer = np.zeros(observation_space, dtype=dtype)
+        self.active = np.empty(0, dtype=np.int64)
+        self.overflowed_widgets = 0
+
+    def add_widget(self, identifier):
+        index = self.widget_index.get(identifier)
+        if index is None:
+            index = len(self.widget_list)
+            self.widget_list.append(identifier)
+            self.widget_index[identifier] = index
+            if index >= self.capacity:
+                self.overflowed_widgets += 1
+        return index
+
+    def widget_slot(self, identifier):
+        index = self.widget_index.get(identifier)
+        if index is None:
+            return None
+        if self.stable_slots and self.capacity > 0:
+            return self.offset + crc32(identifier.encode('utf-8')) % self.capacity
+        if index < self.capacity:
+            return self.offset + index
+        if self.overflow == 'hash' and self.capacity > 0:
+            # crc32 is stable across runs, unlike hash() on strings
+            return self.offset + crc32(identifier.encode('utf-8')) % self.capacity
+        return None
+
+    def indices(self, activity, identifiers):
+        """
+        Sparse form of the observation: the sorted positions set to 1.
+        :param activity: (str) current activity
+        :param identifiers: (iterable) identifiers of the widgets on screen
+        :return: (numpy.ndarray)
+        """
+        slots = set()
+        index = self.activity_index.get(activity)
+        if index is not None:
+            slots.add(index)
+        for identifier in identifiers:
+            slot = self.widget_slot(identifier)
+            if slot is not None:
+                slots.add(slot)
+        return np.fromiter(sorted(slots), dtype=np.int64, count=len(slots))
+
+    def encode(self, activity, identifiers):
+        """
+        Writes the observation into the reused buffer, only the previously active positions are cleared.
+        :return: (numpy.ndarray) the internal buffer, copy it if it has to outlive the next call
+        """
+        return self.encode_indices(self.indices(activity, identifiers))
+
+    def encode_indices(self, indices):
+        """
+        Same as encode, from positions computed beforehand with indices.
+        :param indices: (numpy.ndarray) positions set to 1, kept as the active positions
+        """
+        self.buffer[self.active] = 0
+        self.active = indices
+        self.buffer[self.active] = 1
+        return self.buffer
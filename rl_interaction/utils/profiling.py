@@ -0,0 +1,111 @@
+import json
+import time
+from collections import defaultdict
+
+import numpy as np
+
+PERCENTILES = [50, 95, 99]
+
+
+class Phase:
+    """
+    Timing context of one phase, reused at every step so that entering it allocates nothing.
+    """
+    __slots__ = ('durations', 'start')
+
+    def __init__(self):
+        self.durations = []
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.durations.append(time.perf_counter() - self.start)
+        return False
+
+
+class StepProfiler:
+    """
+    Times the phases of every step and the Appium commands sent meanwhile, one summary per episode is appended to
+    a JSON lines file: p50/p95/p99 and total of every phase and command, and the number of commands per step.
+    :param path: (str) summary file, None to keep the summaries in memory only
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.phases = defaultdict(Phase)
+        self.commands = defaultdict(list)
+        self.step_start = None
+        self.step_commands = 0
+        self.commands_per_step = []
+        self.summaries = []
+
+    def phase(self, name):
+        return self.phases[name]
+
+    def command(self, name, duration):
+        self.commands[name].append(duration)
+        self.step_commands += 1
+
+    def start_step(self):
+        self.step_start = time.perf_counter()
+        self.step_commands = 0
+
+    def end_step(self):
+        if self.step_start is not None:
+            self.phases['step'].durations.append(time.perf_counter() - self.step_start)
+            self.commands_per_step.append(self.step_commands)
+            self.step_start = None
+
+    @staticmethod
+    def describe(durations):
+        values = np.array(durations) * 1000
+        summary = {f'p{q}': round(float(v), 3) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+        summary.update(count=len(durations), total=round(float(values.sum()), 3))
+        return summary
+
+    def end_episode(self, episode):
+        """
+        Summarizes and clears the timings collected since the previous call, times are in milliseconds.
+        :param episode: (int) episode the timings belong to
+        :return: (dict) the summary, None if nothing was collected
+        """
+        if not self.commands_per_step and not any(phase.durations for phase in self.phases.values()):
+            return None
+        summary = {'episode': episode, 'steps': len(self.commands_per_step),
+                   'commands_per_step': round(float(np.mean(self.commands_per_step)), 3)
+                   if self.commands_per_step else 0.0,
+                   'phases': {name: self.describe(phase.durations) for name, phase in self.phases.items()
+                              if phase.durations},
+                   'commands': {name: self.describe(durations) for name, durations in self.commands.items()}}
+        for phase in self.phases.values():
+            phase.durations.clear()
+        self.commands.clear()
+        self.commands_per_step.clear()
+        self.summaries.append(summary)
+        if self.path is not None:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(summary) + '\n')
+        return summary
+
+
+def trace_commands(driver, profiler):
+    """
+    Wraps the command executor of a webdriver so that every Appium command is counted and timed.
+    :param driver: (appium.webdriver.Remote) driver to trace
+    :param profiler: (StepProfiler) receiver of the timings
+    :return: driver
+    """
+    executor = driver.command_executor
+    execute = executor.execute
+
+    def traced_execute(command, params):
+        start = time.perf_counter()
+        try:
+            return execute(command, params)
+        finally:
+            profiler.command(command, time.perf_counter() - start)
+
+    executor.execute = traced_execute
+    return driver
@@ -1,13 +1,183 @@
-import gym
+import hashlib
+import os
+from collections import OrderedDict
 
 import numpy as np
 import texttable as tt
+from loguru import logger
+
+KEY_SIZE = 16
+# OrderedDict entry, key, row object and the two array headers
+ROW_OVERHEAD = 400
+
+
+class QRow:
+    """
+    Q-values of the (widget, string, flag) cells visited in a state, every other cell is 0.
+    """
+    __slots__ = ('cells', 'values')
+
+    def __init__(self, cells=None, values=None):
+        self.cells = np.empty(0, dtype=np.int32) if cells is None else cells
+        self.values = np.empty(0, dtype=np.float32) if values is None else values
+
+    def nbytes(self):
+        return ROW_OVERHEAD + self.cells.nbytes + self.values.nbytes
+
+    def get(self, cell):
+        position = np.flatnonzero(self.cells == cell)
+        return float(self.values[position[0]]) if len(position) else 0.0
+
+    def set(self, cell, value):
+        """
+        :return: (int) bytes added to the row
+        """
+        # the environment returns its reward as a 1-element array
+        value = np.float32(np.squeeze(value))
+        position = np.flatnonzero(self.cells == cell)
+        if len(position):
+            self.values[position[0]] = value
+            return 0
+        self.cells = np.append(self.cells, np.int32(cell))
+        self.values = np.append(self.values, value)
+        return self.cells.itemsize + self.values.itemsize
+
+    def argmax(self, size):
+        """
+        Same cell as numpy.argmax over the dense row: the first cell holding the highest value.
+        :param size: (int) cells of the dense row
+        """
+        if len(self.values):
+            best = self.values.max()
+            if best > 0 or len(self.cells) >= size:
+                return int(self.cells[self.values == best].min())
+            zeros = self.cells[self.values == 0]
+        else:
+            zeros = self.cells
+        # every cell that was never visited is 0, the first of them competes with the visited cells set to 0
+        visited = set(self.cells.tolist())
+        first_unvisited = next(cell for cell in range(len(visited) + 1) if cell not in visited)
+        return int(min(zeros.min(), first_unvisited)) if len(zeros) else first_unvisited
+
+    def max(self, size):
+        """
+        :param size: (int) cells of the dense row
+        """
+        if len(self.cells) >= size:
+            return float(self.values.max())
+        # the unvisited cells bound the maximum at 0
+        return max(float(self.values.max()), 0.0) if len(self.values) else 0.0
+
+
+class QTable:
+    """
+    Sparse Q-table: a state is keyed by a 16 bytes digest of the positions (and values) of the non-zero entries of
+    its observation, and only the cells visited in it are stored, as float32. With a memory cap the least recently
+    used states are evicted first.
+    :param shape: (tuple) widgets, strings, flags of the action space
+    :param max_memory_mb: (float) memory cap of the table, None for no cap
+    """
+    def __init__(self, shape, max_memory_mb=None):
+        self.shape = tuple(int(size) for size in shape)
+        self.max_bytes = None if max_memory_mb is None else int(max_memory_mb * 1024 * 1024)
+        self.size = int(np.prod(self.shape))
+        self.rows = OrderedDict()
+        self.nbytes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(obs):
+        obs = np.asarray(obs)
+        active = np.flatnonzero(obs)
+        digest = hashlib.blake2b(active.astype(np.int32).tobytes(), digest_size=KEY_SIZE)
+        values = obs[active]
+        if len(values) and not np.all(values == 1):
+            digest.update(values.astype(np.float64).tobytes())
+        return digest.digest()
+
+    def cell(self, action):
+        return (int(action[0]) * self.shape[1] + int(action[1])) * self.shape[2] + int(action[2])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, obs):
+        return self.key(obs) in self.rows
+
+    def row(self, obs, create=False):
+        """
+        :return: (QRow) row of the state, None if the state is unknown and create is False
+        """
+        key = self.key(obs)
+        row = self.rows.get(key)
+        if row is not None:
+            self.rows.move_to_end(key)
+        elif create:
+            row = self.rows[key] = QRow()
+            self.nbytes += row.nbytes()
+            self.evict()
+        return row
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        # the most recent state always stays
+        while self.nbytes > self.max_bytes and len(self.rows) > 1:
+            _, row = self.rows.popitem(last=False)
+            self.nbytes -= row.nbytes()
+            self.evictions += 1
+
+    def get(self, obs, action):
+        row = self.row(obs)
+        return 0.0 if row is None else row.get(self.cell(action))
+
+    def set(self, obs, action, value):
+        row = self.row(obs, create=True)
+        self.nbytes += row.set(self.cell(action), value)
+        self.evict()
+
+    def argmax(self, obs):
+        row = self.row(obs)
+        return np.array(np.unravel_index(0 if row is None else row.argmax(self.size), self.shape))
+
+    def max(self, obs):
+        row = self.row(obs)
+        return 0.0 if row is None else row.max(self.size)
+
+    def save(self, path):
+        keys = np.frombuffer(b''.join(self.rows.keys()), dtype=np.uint8).reshape(-1, KEY_SIZE)
+        rows = list(self.rows.values())
+        lengths = np.array([len(row.cells) for row in rows], dtype=np.int64)
+        cells = np.concatenate([row.cells for row in rows]) if rows else np.empty(0, dtype=np.int32)
+        values = np.concatenate([row.values for row in rows]) if rows else np.empty(0, dtype=np.float32)
+        np.savez(path, shape=np.array(self.shape), keys=keys, lengths=lengths, cells=cells, values=values)
+
+    def load(self, path):
+        """
+        Adds the states of a saved table, its cells are mapped onto the current shape when the action space changed.
+        """
+        with np.load(path) as data:
+            shape = tuple(int(size) for size in data['shape'])
+            cells, values = data['cells'], data['values']
+            if shape != self.shape:
+                unravelled = np.unravel_index(cells, shape)
+                fits = np.all([index < size for index, size in zip(unravelled, self.shape)], axis=0)
+                cells = np.full(len(cells), -1, dtype=np.int32)
+                cells[fits] = np.ravel_multi_index([index[fits] for index in unravelled], self.shape)
+            offsets = np.concatenate([[0], np.cumsum(data['lengths'])])
+            for i, key in enumerate(data['keys']):
+                row_cells, row_values = cells[offsets[i]:offsets[i + 1]], values[offsets[i]:offsets[i + 1]]
+                kept = row_cells >= 0
+                row = QRow(row_cells[kept].astype(np.int32), row_values[kept].astype(np.float32))
+                self.rows[key.tobytes()] = row
+                self.nbytes += row.nbytes()
+        self.evict()
 
 
 # 1. Load Environment and Q-table structure
 class Q:
-    def __init__(self, env, timer, strategy='eps-greedy', eps=0.6):
-        self.table_abstraction = {}
+    def __init__(self, env, timer, strategy='eps-greedy', eps=0.6, max_memory_mb=None):
+        self.table = QTable((env.ACTION_SPACE + 1, env.action_space.high[1] + 1, 2), max_memory_mb)
         self.tab = tt.Texttable()
         self.timer = timer
         self.env = env
@@ -48,27 +218,33 @@ class Q:
             old_obs = obs
             if done:
                 old_obs = self.env.reset()
+        logger.info(f'Q-table: {len(self.table)} states, {self.table.nbytes / 1024:.0f} KB, '
+                    f'{self.table.evictions} evictions')
 
     def update_table(self, obs, action=None, value=None):
-        bytes_obs = obs.tobytes()
-        if bytes_obs not in self.table_abstraction.keys():
-            activities = self.env.ACTION_SPACE + 1
-            strings = self.env.action_space.high[1] + 1
-            bool_action = 2
-            self.table_abstraction.update({bytes_obs: np.zeros([activities, strings, bool_action])})
-        elif (action is not None) and (value is not None):
-            self.table_abstraction[bytes_obs][action[0]][action[1]][action[2]] = value
+        if (action is not None) and (value is not None):
+            self.table.set(obs, action, value)
         else:
-            pass
+            self.table.row(obs, create=True)
 
     def ret_q_value(self, obs, action):
-        return self.table_abstraction[obs.tobytes()][action[0]][action[1]][action[2]]
+        return self.table.get(obs, action)
 
     def ret_argmax_q_value(self, obs):
-        return np.array(list(np.unravel_index(np.argmax(self.table_abstraction[obs.tobytes()], axis=None),
-                                              self.table_abstraction[obs.tobytes()].shape)))
+        return self.table.argmax(obs)
 
     def ret_max_q_value(self, obs):
-        position = np.array(list(np.unravel_index(np.argmax(self.table_abstraction[obs.tobytes()], axis=None),
-                                                  self.table_abstraction[obs.tobytes()].shape)))
-        return self.ret_q_value(obs, position)
+        return self.table.max(obs)
+
+    def save(self, policy_dir, app_name):
+        self.table.save(f'{policy_dir}{os.sep}{app_name}.npz')
+
+    def load(self, policy_dir, app_name):
+        """
+        :return: (bool) whether a saved table was found
+        """
+        path = f'{policy_dir}{os.sep}{app_name}.npz'
+        if not os.path.isfile(path):
+            return False
+        self.table.load(path)
+        return True
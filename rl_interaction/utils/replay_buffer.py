@@ -0,0 +1,86 @@
+import numpy as np
+from stable_baselines3.common.buffers import BaseBuffer, ReplayBuffer
+from stable_baselines3.common.type_aliases import ReplayBufferSamples
+
+
+class PackedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer of SAC and DDPG storing the binary part of the observations one bit per entry with numpy.packbits.
+    The observations of RLApplicationEnv are one-hot vectors followed by the time feature of TimeFeatureWrapper:
+    the leading entries are packed (any non-zero value is stored as 1), the trailing `extra_features` entries are
+    kept as float32. Batches are unpacked back to float32 observations when sampled.
+    :param buffer_size: (int) max number of transitions
+    :param observation_space: (gym.spaces.Box) observation space of the wrapped environment
+    :param action_space: (gym.spaces.Box)
+    :param device: (torch.device or str)
+    :param n_envs: (int) number of parallel environments
+    :param optimize_memory_usage: (bool) ignored, next observations are packed as well
+    :param handle_timeout_termination: (bool) treat time limit terminations as infinite horizon
+    :param extra_features: (int) trailing entries of the observation that are not binary
+    """
+    def __init__(self, buffer_size, observation_space, action_space, device='cpu', n_envs=1,
+                 optimize_memory_usage=False, handle_timeout_termination=True, extra_features=1):
+        # ReplayBuffer.__init__ would allocate the float32 observations this buffer replaces
+        BaseBuffer.__init__(self, buffer_size, observation_space, action_space, device, n_envs=n_envs)
+        self.buffer_size = max(buffer_size // n_envs, 1)
+        self.optimize_memory_usage = False
+        self.obs_dim = int(np.prod(self.obs_shape))
+        self.binary_dim = self.obs_dim - extra_features
+        packed_dim = (self.binary_dim + 7) // 8
+        self.packed_observations = np.zeros((self.buffer_size, self.n_envs, packed_dim), dtype=np.uint8)
+        self.packed_next_observations = np.zeros((self.buffer_size, self.n_envs, packed_dim), dtype=np.uint8)
+        self.extra_observations = np.zeros((self.buffer_size, self.n_envs, extra_features), dtype=np.float32)
+        self.extra_next_observations = np.zeros((self.buffer_size, self.n_envs, extra_features), dtype=np.float32)
+        self.actions = np.zeros((self.buffer_size, self.n_envs, self.action_dim), dtype=action_space.dtype)
+        self.rewards = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.dones = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+        self.handle_timeout_termination = handle_timeout_termination
+        self.timeouts = np.zeros((self.buffer_size, self.n_envs), dtype=np.float32)
+
+    def bytes_per_transition(self):
+        arrays = [self.packed_observations, self.packed_next_observations, self.extra_observations,
+                  self.extra_next_observations, self.actions, self.rewards, self.dones, self.timeouts]
+        return sum(array.nbytes for array in arrays) / (self.buffer_size * self.n_envs)
+
+    def pack(self, obs):
+        obs = np.asarray(obs, dtype=np.float32).reshape(self.n_envs, self.obs_dim)
+        return np.packbits(obs[:, :self.binary_dim] != 0, axis=-1), obs[:, self.binary_dim:]
+
+    def unpack(self, packed, extra):
+        """
+        :param packed: (numpy.ndarray) packed binary entries, any leading shape
+        :param extra: (numpy.ndarray) matching float32 entries
+        :return: (numpy.ndarray) float32 observations
+        """
+        obs = np.empty(packed.shape[:-1] + (self.obs_dim,), dtype=np.float32)
+        obs[..., :self.binary_dim] = np.unpackbits(packed, axis=-1, count=self.binary_dim)
+        obs[..., self.binary_dim:] = extra
+        return obs
+
+    def add(self, obs, next_obs, action, reward, done, infos):
+        self.packed_observations[self.pos], self.extra_observations[self.pos] = self.pack(obs)
+        self.packed_next_observations[self.pos], self.extra_next_observations[self.pos] = self.pack(next_obs)
+        self.actions[self.pos] = np.array(action).reshape(self.n_envs, self.action_dim)
+        self.rewards[self.pos] = np.array(reward).reshape(self.n_envs)
+        self.dones[self.pos] = np.array(done).reshape(self.n_envs)
+        if self.handle_timeout_termination:
+            self.timeouts[self.pos] = np.array([info.get('TimeLimit.truncated', False) for info in infos])
+        self.pos += 1
+        if self.pos == self.buffer_size:
+            self.full = True
+            self.pos = 0
+
+    def _get_samples(self, batch_inds, env=None):
+        env_indices = np.random.randint(0, high=self.n_envs, size=(len(batch_inds),))
+        obs = self.unpack(self.packed_observations[batch_inds, env_indices],
+                          self.extra_observations[batch_inds, env_indices])
+        next_obs = self.unpack(self.packed_next_observations[batch_inds, env_indices],
+                               self.extra_next_observations[batch_inds, env_indices])
+        data = (
+            self._normalize_obs(obs, env),
+            self.actions[batch_inds, env_indices, :],
+            self._normalize_obs(next_obs, env),
+            (self.dones[batch_inds, env_indices] * (1 - self.timeouts[batch_inds, env_indices])).reshape(-1, 1),
+            self._normalize_reward(self.rewards[batch_inds, env_indices].reshape(-1, 1), env),
+        )
+        return ReplayBufferSamples(*tuple(map(self.to_torch, data)))
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from loguru import logger
+
+Unit = namedtuple('Unit', ['app', 'cycle'])
+
+
+class CampaignJournal:
+    """
+    Append-only JSON lines record of the units of a campaign: every start, success, failure and abandon is written
+    as soon as it happens, so that an interrupted campaign can be resumed.
+    :param path: (str) journal file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        :return: (tuple) units done, units abandoned, number of failed attempts per unit
+        """
+        done, abandoned, failures = set(), set(), {}
+        if not os.path.isfile(self.path):
+            return done, abandoned, failures
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a campaign killed while writing
+                    continue
+                unit = Unit(entry['app'], entry['cycle'])
+                if entry['event'] == 'done':
+                    done.add(unit)
+                elif entry['event'] == 'failed':
+                    failures[unit] = failures.get(unit, 0) + 1
+                elif entry['event'] == 'abandoned':
+                    abandoned.add(unit)
+        return done, abandoned, failures
+
+    def write(self, event, unit, device, **fields):
+        entry = dict(event=event, app=unit.app, cycle=unit.cycle, device=device, time=time.time(), **fields)
+        with self.lock, open(self.path, 'a') as file:
+            file.write(json.dumps(entry) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+
+class CampaignScheduler:
+    """
+    Shared queue of (app, cycle) units pulled by one worker thread per device as soon as it is free. A failed unit
+    goes back to the queue and is preferably picked by a device it has not failed on, until its retry budget is
+    spent; a device failing several units in a row is retired.
+    :param units: (list) Unit to run, in order of preference
+    :param devices: (list) device names
+    :param run_unit: (callable) run_unit(device, unit) -> True on success
+    :param journal: (CampaignJournal) record of the campaign, units already done in it are skipped
+    :param max_retries: (int) attempts of a unit after its first failure
+    :param max_device_failures: (int) consecutive failures after which a device stops pulling units
+    :param ordered_cycles: (bool) a cycle of an app only starts once its previous cycle is over, e.g. when policies
+        are reloaded from one cycle to the next
+    """
+    def __init__(self, units, devices, run_unit, journal, max_retries=2, max_device_failures=3,
+                 ordered_cycles=False):
+        self.devices = list(devices)
+        self.run_unit = run_unit
+        self.journal = journal
+        self.max_retries = max_retries
+        self.max_device_failures = max_device_failures
+        self.ordered_cycles = ordered_cycles
+        self.done, self.abandoned, self.failures = journal.load()
+        self.pending = [unit for unit in units if unit not in self.done and unit not in self.abandoned]
+        skipped = len(units) - len(self.pending)
+        if skipped:
+            logger.info(f'resuming campaign: {skipped} of {len(units)} units already over')
+        self.running = {}
+        self.failed_on = {}
+        self.active_devices = set(self.devices)
+        self.condition = threading.Condition()
+
+    def ready(self, unit):
+        if not self.ordered_cycles or unit.cycle == 0:
+            return True
+        previous = Unit(unit.app, unit.cycle - 1)
+        return previous not in self.running.values() and previous not in self.pending
+
+    def next_unit(self, device):
+        """
+        Blocks until a unit can run on the device.
+        :return: (Unit) None once there is nothing left for the device
+        """
+        with self.condition:
+            while True:
+                if device not in self.active_devices:
+                    return None
+                candidates = [unit for unit in self.pending if self.ready(unit)]
+                for unit in candidates:
+                    # a failed unit goes to another device if one is still able to take it
+                    failed_on = self.failed_on.get(unit, set())
+                    if device not in failed_on or not self.active_devices - failed_on:
+                        self.pending.remove(unit)
+                        self.running[device] = unit
+                        return unit
+                if not self.pending and not self.running:
+                    return None
+                # a running unit may fail and come back, or release the next cycle of its app
+                self.condition.wait()
+
+    def complete(self, device, unit, success, seconds):
+        with self.condition:
+            del self.running[device]
+            if success:
+                self.done.add(unit)
+                self.journal.write('done', unit, device, seconds=round(seconds, 3))
+            else:
+                self.failures[unit] = self.failures.get(unit, 0) + 1
+                self.failed_on.setdefault(unit, set()).add(device)
+                self.journal.write('failed', unit, device, seconds=round(seconds, 3))
+                if self.failures[unit] > self.max_retries:
+                    self.abandoned.add(unit)
+                    self.journal.write('abandoned', unit, device)
+                    logger.error(f'{unit.app} cycle {unit.cycle} abandoned after {self.failures[unit]} failures')
+                else:
+                    self.pending.insert(0, unit)
+            self.condition.notify_all()
+
+    def retire(self, device):
+        with self.condition:
+            self.active_devices.discard(device)
+            logger.error(f'{device} retired after {self.max_device_failures} consecutive failures')
+            if not self.active_devices:
+                for unit in self.pending:
+                    self.abandoned.add(unit)
+                    self.journal.write('abandoned', unit, device)
+                self.pending.clear()
+            self.condition.notify_all()
+
+    def worker(self, device):
+        consecutive_failures = 0
+        while True:
+            unit = self.next_unit(device)
+            if unit is None:
+                return
+            logger.info(f'{device} is running {unit.app} cycle {unit.cycle}')
+            self.journal.write('started', unit, device)
+            start = time.perf_counter()
+            try:
+                success = bool(self.run_unit(device, unit))
+            except Exception as e:
+                logger.error(f'{device} failed on {unit.app} cycle {unit.cycle}: {e}')
+                success = False
+            self.complete(device, unit, success, time.perf_counter() - start)
+            consecutive_failures = 0 if success else consecutive_failures + 1
+            if consecutive_failures >= self.max_device_failures:
+                self.retire(device)
+                return
+
+    def run(self):
+        """
+        :return: (tuple) units done, units abandoned
+        """
+        threads = [threading.Thread(name=f'campaign-{device}', target=self.worker, args=(device,))
+                   for device in self.devices]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.done, self.abandoned
@@ -0,0 +1,84 @@
+import re
+from collections import OrderedDict
+from hashlib import md5
+
+# enabled and checked flip without the screen changing, they are left out of the hash
+VOLATILE_ATTRIBUTES = re.compile(rb'\s(?:enabled|checked)="(?:true|false)"')
+
+
+def canonical_hash(page):
+    """
+    Hash of a page source without its volatile attributes, computed in a single pass: the text between two
+    volatile attributes is fed to the hash as it is found, no normalized copy of the page is built.
+    :param page: (str) page source
+    :return: (str) hex digest
+    """
+    data = page.encode()
+    view = memoryview(data)
+    digest = md5()
+    start = 0
+    for match in VOLATILE_ATTRIBUTES.finditer(data):
+        digest.update(view[start:match.start()])
+        start = match.end()
+    digest.update(view[start:])
+    return digest.hexdigest()
+
+
+class ScreenState:
+    """
+    Everything derived from the page source of a screen that does not depend on the device.
+    :param activity: (str) activity the screen belongs to
+    :param widgets: (list) widget dictionaries, as returned by extract_widgets
+    :param indices: (numpy.ndarray) positions set to 1 in the observation
+    :param action_space: (int) upper bound of the widget action
+    """
+    __slots__ = ('activity', 'widgets', 'indices', 'action_space')
+
+    def __init__(self, activity, widgets, indices, action_space):
+        self.activity = activity
+        self.widgets = widgets
+        self.indices = indices
+        self.action_space = action_space
+
+    def views(self):
+        # WebElements go stale, every visit starts without them
+        return {i: dict(widget, view=None) for i, widget in enumerate(self.widgets)}
+
+
+class ScreenCache:
+    """
+    LRU cache of parsed screens, keyed by activity and canonical hash of the page source.
+    :param capacity: (int) number of screens kept, 0 disables the cache
+    """
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.screens = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        screen = self.screens.get(key)
+        if screen is None:
+            self.misses += 1
+            return None
+        self.screens.move_to_end(key)
+        self.hits += 1
+        return screen
+
+    def put(self, key, screen):
+        if self.capacity <= 0:
+            return
+        self.screens[key] = screen
+        self.screens.move_to_end(key)
+        if len(self.screens) > self.capacity:
+            self.screens.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.screens)
@@ -0,0 +1,52 @@
+import json
+
+WIDGET_FIELDS = ['identifier', 'class_name', 'clickable', 'scrollable', 'long-clickable', 'bounds']
+
+
+class SessionRecorder:
+    """
+    Appends what RLApplicationEnv sees to a JSON lines file, so that SimulatedApplicationEnv can replay the UI graph
+    offline. Records are dictionaries with a `type`:
+        session: spaces and action layout of the environment, written once
+        state: activity and widgets of a screen, written the first time the screen hash is seen
+        reset: screen reached after a reset
+        transition: screen, action, resulting screen and activity, reward and bug flag of a step
+    :param path: (str) file the records are appended to
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a')
+        self.known_states = set()
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+
+    def record_session(self, **session):
+        self.write(dict(type='session', **session))
+        self.file.flush()
+
+    def record_state(self, state, activity, widgets):
+        if state not in self.known_states:
+            self.known_states.add(state)
+            self.write({'type': 'state', 'state': state, 'activity': activity,
+                        'widgets': [{field: widget[field] for field in WIDGET_FIELDS} for widget in widgets]})
+
+    def record_reset(self, state):
+        self.write({'type': 'reset', 'state': state})
+        self.file.flush()
+
+    def record_transition(self, state, action, next_state, activity, reward, terminal, bug, outside):
+        self.write({'type': 'transition', 'state': state, 'action': action, 'next_state': next_state,
+                    'activity': activity, 'reward': reward, 'terminal': terminal, 'bug': bug, 'outside': outside})
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_session(path):
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
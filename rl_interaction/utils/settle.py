@@ -0,0 +1,79 @@
+import time
+from collections import deque
+
+import numpy as np
+
+SETTLE_STRATEGIES = ['fixed', 'adaptive']
+
+
+class AdaptiveSettle:
+    """
+    Waits for the UI to settle after an action by polling the page source until two consecutive snapshots match,
+    with a growing interval between polls. The wait stops at a deadline learned from the settle times observed so
+    far on the app, so that screens that never stop changing (clocks, animations) cost a bounded time.
+    :param min_wait: (float) seconds always waited before the first poll
+    :param poll_interval: (float) seconds between the first two polls
+    :param backoff: (float) growth factor of the poll interval
+    :param max_interval: (float) upper bound of the poll interval
+    :param deadline: (float) initial deadline in seconds
+    :param min_deadline: (float) lower bound of the learned deadline
+    :param max_deadline: (float) upper bound of the learned deadline
+    :param margin: (float) learned deadline = margin * p95 of the observed settle times
+    :param history: (int) number of settle times the deadline is learned from
+    """
+    def __init__(self, min_wait=0.02, poll_interval=0.03, backoff=1.5, max_interval=0.2, deadline=1.0,
+                 min_deadline=0.2, max_deadline=3.0, margin=2.0, history=100):
+        self.min_wait = min_wait
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.deadline = deadline
+        self.min_deadline = min_deadline
+        self.max_deadline = max_deadline
+        self.margin = margin
+        self.settle_times = deque(maxlen=history)
+        self.timeouts = 0
+        self.polls = 0
+
+    def wait(self, probe, key=None):
+        """
+        :param probe: (callable) returns the current snapshot of the screen, e.g. the page source
+        :param key: (callable) what two snapshots are compared on, e.g. a hash without the volatile attributes, the
+        snapshot itself when None
+        :return: (tuple) last snapshot, seconds waited, True if the UI settled before the deadline
+        """
+        key = key or (lambda snapshot: snapshot)
+        start = time.perf_counter()
+        time.sleep(self.min_wait)
+        previous = probe()
+        previous_key = key(previous)
+        self.polls += 1
+        interval = self.poll_interval
+        settled = False
+        while True:
+            remaining = self.deadline - (time.perf_counter() - start)
+            if remaining <= 0:
+                break
+            time.sleep(min(interval, remaining))
+            snapshot = probe()
+            snapshot_key = key(snapshot)
+            self.polls += 1
+            previous = snapshot
+            if snapshot_key == previous_key:
+                settled = True
+                break
+            previous_key = snapshot_key
+            interval = min(interval * self.backoff, self.max_interval)
+        elapsed = time.perf_counter() - start
+        self.observe(elapsed, settled)
+        return previous, elapsed, settled
+
+    def observe(self, elapsed, settled):
+        if not settled:
+            # a screen that never settles says nothing about how long the app takes to respond
+            self.timeouts += 1
+            return
+        self.settle_times.append(elapsed)
+        if len(self.settle_times) >= 10:
+            learned = self.margin * float(np.percentile(self.settle_times, 95))
+            self.deadline = min(max(learned, self.min_deadline), self.max_deadline)
@@ -2,8 +2,37 @@ import os
 import shutil
 import subprocess
 import time
+import urllib.request
 
 from appium.webdriver.appium_service import AppiumService
+from loguru import logger
+
+from utils.adb import AdbClient
+
+# Appium 1.x serves the status under its default base path, Appium 2.x at the root
+APPIUM_STATUS_PATHS = ['/wd/hub/status', '/status']
+
+
+def wait_for(probe, timeout, description, interval=0.25, backoff=2.0, max_interval=5.0):
+    """
+    Polls a readiness probe with exponential backoff until it succeeds.
+    :param probe: (callable) returns True once the condition holds
+    :param timeout: (float) seconds before giving up
+    :param description: (str) what is waited for, used in the error message
+    :param interval: (float) seconds between the first two probes
+    :param backoff: (float) growth factor of the interval
+    :param max_interval: (float) upper bound of the interval
+    :return: (float) seconds waited
+    """
+    start = time.perf_counter()
+    while True:
+        if probe():
+            return time.perf_counter() - start
+        remaining = timeout - (time.perf_counter() - start)
+        if remaining <= 0:
+            raise TimeoutError(f'{description} not ready after {timeout:.0f} s')
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
 
 
 class Utils:
@@ -59,68 +88,128 @@ class Utils:
 
 class AppiumLauncher:
 
-    def __init__(self, port: int):
+    def __init__(self, port: int, timeout: float = 60.0):
         self.port: int = port
+        self.timeout: float = timeout
         self.appium_service: AppiumService = AppiumService()
         self.adb_path: str = Utils.get_adb_executable_path()
+        # seconds taken by every restart
+        self.recoveries: list = []
         self.start_appium()
 
+    def is_ready(self) -> bool:
+        for path in APPIUM_STATUS_PATHS:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{self.port}{path}', timeout=2) as response:
+                    if response.status == 200:
+                        return True
+            except OSError:
+                pass
+        return False
+
     def terminate(self):
         self.appium_service.stop()
-        time.sleep(4.0)
+        try:
+            wait_for(lambda: not self.is_ready(), self.timeout, f'Appium shutdown on port {self.port}')
+        except TimeoutError as e:
+            logger.warning(e)
 
     def start_appium(self):
-        self.appium_service.start(args=["-p", str(self.port)])
-        os.system(f"{self.adb_path} start-server")
-        time.sleep(4.0)
+        subprocess.run([self.adb_path, 'start-server'])
+        # the readiness is probed below, the service does not wait on its own
+        self.appium_service.start(args=["-p", str(self.port)], timeout_ms=0)
+        elapsed = wait_for(self.is_ready, self.timeout, f'Appium on port {self.port}')
+        logger.info(f'Appium ready on port {self.port} in {elapsed:.1f} s')
 
     def restart_appium(self):
+        start = time.perf_counter()
         self.terminate()
         self.start_appium()
+        self.recoveries.append(time.perf_counter() - start)
+        logger.info(f'Appium restarted in {self.recoveries[-1]:.1f} s')
 
 
 class EmulatorLauncher:
 
-    def __init__(self, emu, device_name, android_port, speedup=False):
+    def __init__(self, emu, device_name, android_port, speedup=False, boot_timeout=300.0, reuse=False):
         self.device_name: str = '@' + device_name.replace(' ', '_')
         self.emu: str = emu
         self.android_port: int = android_port
+        self.serial: str = f'emulator-{android_port}'
         self.speedup: bool = speedup
+        self.boot_timeout: float = boot_timeout
+        # an emulator already booted on the port is used as it is instead of being started again
+        self.reuse: bool = reuse
         self.adb_path: str = Utils.get_adb_executable_path()
         self.emulator_path: str = Utils.get_emulator_executable_path()
+        self.adb = AdbClient(self.serial, timeout=10.0)
+        self.process = None
+        # seconds taken by every restart
+        self.recoveries: list = []
         self.start_emulator()
 
+    def shell(self, command) -> str:
+        try:
+            return self.adb.shell(command).output.strip()
+        except Exception:
+            # the device is not there yet
+            return ''
+
+    def is_booted(self) -> bool:
+        # the package manager answers a little after boot_completed, installs fail before that
+        return self.shell('getprop sys.boot_completed') == '1' and self.shell('pm path android').startswith('package:')
+
+    def is_running(self) -> bool:
+        if self.process is not None:
+            return self.process.poll() is None
+        devices = subprocess.run([self.adb_path, 'devices'], stdout=subprocess.PIPE).stdout.decode(errors='replace')
+        return any(line.split('\t')[0] == self.serial for line in devices.splitlines())
+
     def terminate(self):
-        os.system(f'{self.adb_path} -s emulator-{self.android_port} emu kill')
-        time.sleep(5.0)
+        os.system(f'{self.adb_path} -s {self.serial} emu kill')
+        try:
+            wait_for(lambda: not self.is_running(), 30.0, f'{self.serial} shutdown')
+        except TimeoutError as e:
+            logger.warning(e)
+            if self.process is not None:
+                self.process.kill()
+        self.process = None
 
     def start_emulator(self):
+        if self.reuse and self.is_booted():
+            logger.info(f'{self.serial} already booted, reusing it')
+            return
         if self.emu == 'normal':
             if self.speedup:
-                subprocess.Popen([self.emulator_path, self.device_name,
-                                  '-port', str(self.android_port)])
-                time.sleep(40)
+                self.process = subprocess.Popen([self.emulator_path, self.device_name,
+                                                 '-port', str(self.android_port)])
             else:
-                subprocess.Popen([self.emulator_path, self.device_name,
-                                  '-port', str(self.android_port),
-                                  '-no-snapshot', '-no-boot-anim', '-wipe-data'])
-                time.sleep(50.0)
+                self.process = subprocess.Popen([self.emulator_path, self.device_name,
+                                                 '-port', str(self.android_port),
+                                                 '-no-snapshot', '-no-boot-anim', '-wipe-data'])
         else:
             # Headless emulator.
-            subprocess.Popen([self.emulator_path, self.device_name,
-                              '-port', str(self.android_port), '-no-window',
-                              '-no-snapshot', '-no-audio', '-no-boot-anim', '-wipe-data'])
-            time.sleep(50.0)
-
-        os.system(f'{self.adb_path} -s emulator-{self.android_port} shell settings put global window_animation_scale 0')
-        os.system(
-            f'{self.adb_path} -s emulator-{self.android_port} shell settings put global transition_animation_scale 0')
-        os.system(
-            f'{self.adb_path} -s emulator-{self.android_port} shell settings put global animator_duration_scale 0')
+            self.process = subprocess.Popen([self.emulator_path, self.device_name,
+                                             '-port', str(self.android_port), '-no-window',
+                                             '-no-snapshot', '-no-audio', '-no-boot-anim', '-wipe-data'])
+        elapsed = wait_for(self.is_booted, self.boot_timeout, f'{self.serial} boot', interval=1.0)
+        logger.info(f'{self.serial} booted in {elapsed:.1f} s')
+
+        for result in self.adb.shell_batch(['settings put global window_animation_scale 0',
+                                            'settings put global transition_animation_scale 0',
+                                            'settings put global animator_duration_scale 0']):
+            if result.exit_code != 0:
+                logger.warning(f'`{result.command}` failed on {self.serial}: {result.output.strip()}')
 
     def restart_emulator(self):
+        start = time.perf_counter()
         self.terminate()
+        # a restart always boots a new emulator
+        reuse, self.reuse = self.reuse, False
         self.start_emulator()
+        self.reuse = reuse
+        self.recoveries.append(time.perf_counter() - start)
+        logger.info(f'{self.serial} restarted in {self.recoveries[-1]:.1f} s')
 
 
 class Timer:
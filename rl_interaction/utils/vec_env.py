@@ -0,0 +1,122 @@
+import os
+from collections import namedtuple
+
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecEnv
+
+from utils.wrapper import TimeFeatureWrapper
+
+DeviceSpec = namedtuple('DeviceSpec', ['udid', 'appium_port', 'android_port', 'device_name'])
+
+
+def parse_device_specs(devices):
+    """
+    :param devices: (str) space separated list of `udid,appium_port,android_port,device_name` entries
+    :return: (list) DeviceSpec
+    """
+    specs = []
+    for entry in devices.split():
+        udid, appium_port, android_port, device_name = entry.split(',')
+        specs.append(DeviceSpec(udid, int(appium_port), android_port, device_name.replace('_', ' ')))
+    return specs
+
+
+def is_vec_env(env):
+    return isinstance(env, VecEnv)
+
+
+def get_action_space_size(env):
+    # ACTION_SPACE of the RLApplicationEnv behind a TimeFeatureWrapper or behind every worker of a VecEnv
+    if is_vec_env(env):
+        return env.get_attr('ACTION_SPACE', indices=0)[0]
+    return env.env.ACTION_SPACE
+
+
+class DeviceEnv(TimeFeatureWrapper):
+    """
+    Environment of one device inside a vectorized env: it owns the Appium server and the emulator of its device.
+    """
+    def __init__(self, env, appium, emulator):
+        super(DeviceEnv, self).__init__(env)
+        self.appium = appium
+        self.emulator = emulator
+
+    def step(self, action):
+        obs, reward, done, info = super(DeviceEnv, self).step(action)
+        # RLApplicationEnv returns arrays, vectorized envs stack scalars
+        return obs, float(reward[0]), bool(done), info
+
+    def close(self):
+        self.env.close()
+        if self.emulator is not None:
+            self.emulator.terminate()
+        self.appium.terminate()
+
+
+class DeviceEnvFactory:
+    """
+    Picklable constructor run inside the worker process of one device.
+    :param spec: (DeviceSpec) device to drive
+    :param env_kwargs: (dict) RLApplicationEnv arguments shared by every device
+    :param real_device: (bool) if False an emulator is started for the device
+    :param emu: (str) emulator mode, normal or headless
+    """
+    def __init__(self, spec, env_kwargs, real_device=False, emu='normal'):
+        self.spec = spec
+        self.env_kwargs = env_kwargs
+        self.real_device = real_device
+        self.emu = emu
+
+    def __call__(self):
+        # Imported in the worker, every device has its own Appium session and bug handler
+        from RL_application_env import RLApplicationEnv
+        from utils.utils import AppiumLauncher, EmulatorLauncher
+        appium = AppiumLauncher(self.spec.appium_port)
+        if self.real_device:
+            emulator = None
+        else:
+            emulator = EmulatorLauncher(self.emu, self.spec.device_name, self.spec.android_port)
+        env_kwargs = dict(self.env_kwargs)
+        # the workers discover the widgets in their own order, a widget must have the same slot on every device
+        env_kwargs['stable_widget_slots'] = True
+        # Each device writes its own logs (and EMMA/JaCoCo coverage files)
+        env_kwargs['log_dir'] = os.path.join(env_kwargs['log_dir'], self.spec.udid)
+        os.makedirs(env_kwargs['log_dir'], exist_ok=True)
+        if isinstance(env_kwargs.get('coverage_dir'), str) and env_kwargs['coverage_dir']:
+            env_kwargs['coverage_dir'] = os.path.join(env_kwargs['coverage_dir'], self.spec.udid)
+            os.makedirs(env_kwargs['coverage_dir'], exist_ok=True)
+        env = RLApplicationEnv(udid=self.spec.udid, device_name=self.spec.device_name,
+                               appium_port=self.spec.appium_port, appium=appium, emulator=emulator, **env_kwargs)
+        return DeviceEnv(env, appium, emulator)
+
+
+# bookkeeping of RLApplicationEnv, filled in place in the process of the env
+BOOKKEEPING = ['widget_list', 'coverage_dict', 'bug_set', 'visited_activities', 'clicked_buttons', 'number_bugs']
+
+
+def merge_device_bookkeeping(vec_env, widget_list, coverage_dict, bug_set, visited_activities, clicked_buttons,
+                             number_bugs):
+    """
+    The workers fill copies of the lists and dictionaries of the parent, they are merged back into them: widgets and
+    bugs are united, an attribute of an activity is covered if it is on any device, the per episode statistics of
+    every device are appended.
+    """
+    for values in zip(*[vec_env.get_attr(name) for name in BOOKKEEPING]):
+        worker = dict(zip(BOOKKEEPING, values))
+        known = set(widget_list)
+        widget_list.extend(identifier for identifier in worker['widget_list'] if identifier not in known)
+        for activity, attributes in worker['coverage_dict'].items():
+            merged = coverage_dict.setdefault(activity, {})
+            for attribute, covered in attributes.items():
+                merged[attribute] = merged.get(attribute, False) or covered
+        bug_set.update(worker['bug_set'])
+        visited_activities.extend(worker['visited_activities'])
+        clicked_buttons.extend(worker['clicked_buttons'])
+        number_bugs.extend(worker['number_bugs'])
+
+
+def make_device_vec_env(specs, env_kwargs, real_device=False, emu='normal', start_method=None):
+    """
+    One worker process per device, steps are dispatched to every device concurrently.
+    """
+    return SubprocVecEnv([DeviceEnvFactory(spec, env_kwargs, real_device, emu) for spec in specs],
+                         start_method=start_method)
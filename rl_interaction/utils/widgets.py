@@ -0,0 +1,71 @@
+import re
+
+BOUNDS_PATTERN = re.compile(r'\d+')
+TEXT_VIEW_CLASS = 'android.widget.TextView'
+IDENTIFIER_ATTRIBUTES = ['resource-id', 'content-desc']
+# XPath steps are only built for plain tag names, other widgets are resolved through their bounds
+XPATH_STEP_PATTERN = re.compile(r'^[A-Za-z_][\w.\-]*$')
+
+
+def parse_bounds(bounds):
+    return [int(i) for i in BOUNDS_PATTERN.findall(bounds or '')]
+
+
+def is_actionable(element):
+    return (element.get('clickable') == 'true') or (element.get('scrollable') == 'true') or \
+           (element.get('long-clickable') == 'true')
+
+
+def build_identifier(element, current_activity):
+    """
+    Same identifier that was previously computed through Appium: resource-id, then content-desc, otherwise
+    activity, class and the text of the first TextView child (or of the element itself).
+    :param element: (xml.etree.ElementTree.Element) node of the page source
+    :param current_activity: (str) activity the screen belongs to
+    :return: (str)
+    """
+    for attr in IDENTIFIER_ATTRIBUTES:
+        # UiAutomator2 reports empty attributes as null, the page source as empty strings
+        attribute = element.get(attr)
+        if attribute:
+            return attribute
+    text = None
+    for sub_node in element.iter(TEXT_VIEW_CLASS):
+        if sub_node is not element:
+            text = sub_node.get('text', '')
+            break
+    if text is None:
+        text = element.get('text', '')
+    return f"{current_activity}.{element.get('class', element.tag)}.{text}"
+
+
+def extract_widgets(tree, current_activity):
+    """
+    Builds the widget model of a screen from a single page_source snapshot, without any call to the device.
+    Each widget keeps the XPath and the bounds needed to resolve its WebElement later on.
+    :param tree: (xml.etree.ElementTree.Element) root of the parsed page source
+    :param current_activity: (str) activity the screen belongs to
+    :return: (list) widget dictionaries in document order
+    """
+    widgets = []
+    stack = [(tree, f'/{tree.tag}' if XPATH_STEP_PATTERN.match(tree.tag) else None)]
+    while stack:
+        node, xpath = stack.pop()
+        children = []
+        positions = {}
+        for child in node:
+            positions[child.tag] = positions.get(child.tag, 0) + 1
+            if xpath is not None and XPATH_STEP_PATTERN.match(child.tag):
+                children.append((child, f'{xpath}/{child.tag}[{positions[child.tag]}]'))
+            else:
+                children.append((child, None))
+        # Reversed so that widgets are popped in document order
+        stack.extend(reversed(children))
+        if node is not tree and is_actionable(node):
+            widgets.append({'view': None, 'identifier': build_identifier(node, current_activity),
+                            'class_name': node.tag, 'clickable': node.get('clickable', 'false'),
+                            'scrollable': node.get('scrollable', 'false'),
+                            'long-clickable': node.get('long-clickable', 'false'),
+                            'bounds': parse_bounds(node.get('bounds')), 'bounds_string': node.get('bounds', ''),
+                            'xpath': xpath})
+    return widgets
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules inside rl_interaction import each other as top-level packages (e.g. `from utils.utils import ...`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir, "rl_interaction"))
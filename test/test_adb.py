@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from rl_interaction.benchmarks import fake_adb
+from rl_interaction.benchmarks.fake_adb import FakeAdbServer
+from rl_interaction.utils.adb import AdbClient, AdbError
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setenv(fake_adb.STATE_VARIABLE, str(tmp_path))
+    (tmp_path / "pid").write_text("4242")
+    (tmp_path / "logcat.txt").write_text("1.0 4242 4242 I InstruAPK: ;;1;;A.java\n")
+    fake = FakeAdbServer().start()
+    monkeypatch.setenv("ANDROID_ADB_SERVER_PORT", str(fake.port))
+    monkeypatch.delenv("ADB_SERVER_SOCKET", raising=False)
+    yield fake
+    fake.stop()
+
+
+def scripted_server(monkeypatch, answer):
+    """
+    adb server answering every connection with `answer(sock)`
+    """
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            with sock:
+                sock.recv(1024)
+                answer(sock)
+
+    threading.Thread(target=serve, daemon=True).start()
+    monkeypatch.setenv("ANDROID_ADB_SERVER_PORT", str(listener.getsockname()[1]))
+    monkeypatch.delenv("ADB_SERVER_SOCKET", raising=False)
+    return listener
+
+
+class TestAdbClient(object):
+    def test_shell_exit_codes(self, server):
+        client = AdbClient("emulator-5554")
+        assert client.shell("pidof -s com.example") == ("pidof -s com.example", "4242\n", 0)
+        os.remove(os.path.join(os.environ[fake_adb.STATE_VARIABLE], "pid"))
+        assert client.shell("pidof -s com.example").exit_code == 1
+
+    def test_batch_is_one_round_trip(self, server):
+        client = AdbClient("emulator-5554")
+        results = client.shell_batch(["getprop sys.boot_completed", "logcat -d", "logcat -c", "logcat -d"])
+        assert [result.exit_code for result in results] == [0, 0, 0, 0]
+        assert results[0].output == "1\n"
+        assert "InstruAPK" in results[1].output
+        assert results[3].output == ""
+        assert server.requests["shell:"] == 1
+
+    def test_pull(self, server, tmp_path):
+        remote = tmp_path / "files" / "sdcard" / "coverage.ec"
+        remote.parent.mkdir(parents=True)
+        remote.write_bytes(b"\x00coverage" * 10000)
+        client = AdbClient("emulator-5554")
+        client.pull("/sdcard/coverage.ec", str(tmp_path / "local.ec"))
+        assert (tmp_path / "local.ec").read_bytes() == remote.read_bytes()
+        with pytest.raises(AdbError):
+            client.pull("/sdcard/missing.ec", str(tmp_path / "missing.ec"))
+
+    def test_transport_errors_do_not_raise_from_check_shell(self, monkeypatch):
+        message = b"device 'emulator-5554' not found"
+        listener = scripted_server(monkeypatch, lambda sock: sock.sendall(b"FAIL" + b"%04x" % len(message) + message))
+        client = AdbClient("emulator-5554")
+        with pytest.raises(AdbError):
+            client.shell("am broadcast -a intent.END_COVERAGE")
+        assert client.check_shell("am broadcast -a intent.END_COVERAGE") == \
+            ("am broadcast -a intent.END_COVERAGE", "", None)
+        listener.close()
+
+    def test_timeout_covers_the_whole_command(self, monkeypatch):
+        def trickle(sock):
+            sock.sendall(b"OKAYOKAY")
+            try:
+                # every byte comes before the per recv timeout, the command must still stop at its deadline
+                for _ in range(100):
+                    sock.sendall(b".")
+                    time.sleep(0.1)
+            except OSError:
+                pass
+
+        listener = scripted_server(monkeypatch, trickle)
+        client = AdbClient("emulator-5554")
+        start = time.monotonic()
+        assert client.check_shell("logcat", timeout=0.5).exit_code is None
+        assert time.monotonic() - start < 2
+        listener.close()
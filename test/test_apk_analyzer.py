@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from rl_interaction.utils import apk_analyzer
+
+APK = os.path.join(os.path.dirname(__file__), "test_resources", "InsecureBankv2.apk")
+
+
+class TestApkAnalyzer(object):
+    def test_cache_matches_androguard(self, tmp_path):
+        expected_template = {}
+        expected = apk_analyzer.analyze(APK, expected_template)
+        cache_dir = str(tmp_path / "cache")
+        for _ in range(2):
+            template = {}
+            assert apk_analyzer.analyze(APK, template, cache_dir=cache_dir) == expected
+            assert template == expected_template
+        assert os.listdir(cache_dir) == [f"{apk_analyzer.sha256(APK)}.json"]
+
+    def test_cache_hit_does_not_import_androguard(self, tmp_path):
+        cache_dir = str(tmp_path / "cache")
+        apk_analyzer.cached_manifest(APK, cache_dir)
+        script = ("import sys; from utils import apk_analyzer; "
+                  f"apk_analyzer.analyze({APK!r}, {{}}, cache_dir={cache_dir!r}); "
+                  "assert 'androguard' not in sys.modules")
+        subprocess.check_call([sys.executable, "-c", script],
+                              cwd=os.path.join(os.path.dirname(__file__), os.path.pardir, "rl_interaction"))
+
+    def test_stale_cache_is_ignored(self, tmp_path):
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        (cache_dir / f"{apk_analyzer.sha256(APK)}.json").write_text(json.dumps({"version": 0}))
+        manifest = apk_analyzer.cached_manifest(APK, str(cache_dir))
+        assert manifest["package"] == "com.android.insecurebankv2"
+
+    def test_preanalyze_folder(self, tmp_path):
+        apps = []
+        for name in ("a.apk", "b.apk"):
+            shutil.copy(APK, tmp_path / name)
+            apps.append(str(tmp_path / name))
+        (tmp_path / "broken.apk").write_bytes(b"not a zip")
+        manifests = apk_analyzer.preanalyze(apps + [str(tmp_path / "broken.apk")], str(tmp_path / "cache"),
+                                            processes=2)
+        assert sorted(manifests) == apps
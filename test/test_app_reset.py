@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+
+from rl_interaction.utils.app_reset import requested_permissions
+
+DUMPSYS = """Packages:
+  Package [org.example]:
+    requested permissions:
+      android.permission.INTERNET
+      android.permission.ACCESS_FINE_LOCATION: restricted=true
+    install permissions:
+      android.permission.INTERNET: granted=true
+    User 0: ceDataInode=1234 installed=true
+      runtime permissions:
+        android.permission.ACCESS_FINE_LOCATION: granted=true
+"""
+
+
+class TestAppReset(object):
+    def test_requested_permissions(self):
+        assert requested_permissions(DUMPSYS) == ["android.permission.INTERNET",
+                                                  "android.permission.ACCESS_FINE_LOCATION"]
+
+    def test_no_requested_permissions(self):
+        assert requested_permissions("Packages:\n  Package [org.example]:\n    User 0: installed=true\n") == []
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import threading
+
+import gym
+import pytest
+from stable_baselines3.sac.policies import MlpPolicy
+
+from rl_interaction.simulated_application_env import SimulatedApplicationEnv
+from rl_interaction.utils import TimerCallback as timer_callback
+from rl_interaction.utils.async_learner import AsyncSAC
+from rl_interaction.utils.session_recorder import SessionRecorder
+
+MAIN = "a.Main"
+SETTINGS = "a.Settings"
+
+
+def widget(identifier):
+    return {"identifier": identifier, "class_name": "android.widget.Button", "clickable": "true",
+            "scrollable": "false", "long-clickable": "false", "bounds": [0, 0, 10, 10]}
+
+
+class ScalarReward(gym.Wrapper):
+    """
+    Rewards as floats: the environments return a 1-element array, which newer numpy releases refuse to store in the
+    reward buffer of a VecEnv.
+    """
+    def step(self, action):
+        observation, reward, done, info = self.env.step(action)
+        return observation, float(reward[0]), bool(done), info
+
+    def reset(self, **kwargs):
+        return self.env.reset()
+
+
+class StepTimer(object):
+    """
+    Expires after a number of environment steps of a model instead of minutes.
+    """
+    def __init__(self, model, steps):
+        self.model = model
+        self.steps = steps
+
+    def timer_expired(self):
+        return self.model.num_timesteps >= self.steps
+
+
+@pytest.fixture
+def env(tmp_path):
+    path = tmp_path / "session.jsonl"
+    recorder = SessionRecorder(str(path))
+    recorder.record_session(package="a", activities=[MAIN, SETTINGS], observation_space=20, action_space=30,
+                            shift=0, intent_action=-1, intents=0, strings=5, max_episode_len=10)
+    recorder.record_state("main", MAIN, [widget("settings"), widget("stay")])
+    recorder.record_reset("main")
+    recorder.record_state("settings", SETTINGS, [widget("back"), widget("help")])
+    recorder.record_transition("main", [0, 0, 0], "settings", SETTINGS, 1000.0, False, False, False)
+    recorder.record_transition("settings", [0, 0, 0], "main", MAIN, 0.0, False, False, False)
+    recorder.close()
+    return ScalarReward(SimulatedApplicationEnv([str(path)], seed=0))
+
+
+def make_model(env, **kwargs):
+    return AsyncSAC(MlpPolicy, env, learning_starts=20, batch_size=16, buffer_size=1000, train_freq=1, **kwargs)
+
+
+class TestAsyncLearner(object):
+    def test_max_update_ratio(self, env):
+        model = make_model(env, max_update_ratio=0.5)
+        model.learn(total_timesteps=200)
+        assert model.num_timesteps == 200
+        # the learner checks the ratio before every update
+        assert 0 < model.gradient_updates <= 0.5 * model.num_timesteps + 1
+
+    def test_learn_ends_when_the_timer_expires(self, env, monkeypatch):
+        model = make_model(env)
+        monkeypatch.setattr(timer_callback, "Timer", lambda timer: StepTimer(model, 60))
+        model.learn(total_timesteps=10000, callback=timer_callback.TimerCallback(timer=1, app=env.env))
+        assert model.num_timesteps == 60
+        assert model._learner_thread is None
+        assert not any(thread.name == "async-learner" for thread in threading.enumerate())
+        # the saved policy and the acting one are the same after learn
+        state, acting = model.policy.state_dict(), model.acting_policy.state_dict()
+        assert all((state[name] == acting[name]).all() for name in state)
+
+    def test_snapshot_is_swapped_in_whole(self, env):
+        model = make_model(env)
+        model.refresh_snapshot()
+        acting, spare = model.acting_policy, model._spare_policy
+        loaded = []
+        original = spare.load_state_dict
+        # the weights are only written to the copy the actor does not use
+        spare.load_state_dict = lambda state: loaded.append(model.acting_policy is not spare) or original(state)
+        model.refresh_snapshot()
+        assert loaded == [True]
+        assert model.acting_policy is spare and model._spare_policy is acting
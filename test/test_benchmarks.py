@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+
+from rl_interaction.benchmarks import fake_adb
+from rl_interaction.benchmarks.fake_appium import FakeAppiumServer, FakeDevice
+from rl_interaction.benchmarks.synthetic_app import SyntheticApp
+from rl_interaction.utils.widgets import extract_widgets
+
+
+class TestBenchmarkHarness(object):
+    def test_synthetic_page_source(self):
+        app = SyntheticApp(activities=3, widgets=5, seed=1)
+        widgets = extract_widgets(ET.fromstring(app.page_source(0)), app.activities[0])
+        assert len(widgets) == 5
+        assert widgets[0]["identifier"] == f"{app.package}:id/widget_0_0"
+        # widgets without resource-id fall back to the text of their label
+        assert widgets[3]["identifier"].endswith(".Item 3")
+
+    def test_fake_server_resolves_xpath(self, tmp_path):
+        app = SyntheticApp(activities=2, widgets=4, link_rate=1.0, crash_rate=0.0, seed=2)
+        device = FakeDevice(app, str(tmp_path))
+        server = FakeAppiumServer(device, port=0)
+        widget = extract_widgets(ET.fromstring(device.page_source()), app.activities[0])[1]
+        status, element = server.execute("POST", "/wd/hub/session/abc/element",
+                                          {"using": "xpath", "value": widget["xpath"]})
+        assert status == 200
+        element_id = list(element.values())[0]
+        server.execute("POST", f"/wd/hub/session/abc/element/{element_id}/click", {})
+        assert device.activity == app.screens[0][1].target
+        assert server.commands["POST /session/element/:id/click"] == 1
+
+    def test_fake_adb_logcat(self, tmp_path):
+        app = SyntheticApp(activities=1, widgets=2, crash_rate=0.0)
+        device = FakeDevice(app, str(tmp_path))
+        device.use_widget(app.screens[0][0])
+        env = dict(os.environ, **fake_adb.install(str(tmp_path / "sdk"), str(tmp_path)))
+        adb = str(tmp_path / "sdk" / "platform-tools" / "adb")
+        pid = subprocess.check_output([adb, "-s", "emulator-5554", "shell", "pidof", "-s", app.package], env=env)
+        assert pid.decode().strip() == str(device.pid)
+        lines = subprocess.check_output([adb, "logcat", "-d", f"--pid={device.pid}", "-e", "InstruAPK"],
+                                        env=env).decode().splitlines()
+        assert len(lines) == len(app.screens[0][0].methods)
+        subprocess.check_call([adb, "logcat", "-c"], env=env)
+        assert subprocess.check_output([adb, "logcat", "-d"], env=env) == b""
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import random
+
+from rl_interaction.benchmarks.fake_adb import binary_entry, binary_line
+from rl_interaction.us_logs.binaryLogcat import BinaryLogDecoder, BinaryLogReader
+from rl_interaction.us_logs.logReader import LogReader
+
+LINES = ["1651079062.000 1000 1000 I ActivityManager: Start proc 4242:org.sudowars/u0a100 for activity "
+         "org.sudowars.MainMenu",
+         "1651079062.458 4242 4242 I InstruAPK: ;;2;;MainMenu$1;;onClick;;(Landroid/view/View;);;1651079062458",
+         "1651079062.459 1500 1500 I chatty: uid=10042 expire 3 lines",
+         "1651079062.460 4242 4243 D OpenGLRenderer: frame drawn",
+         "1651079062.461 4242 4242 E AndroidRuntime: FATAL EXCEPTION: main",
+         "1651079062.461 4242 4242 E AndroidRuntime: Process: org.sudowars, PID: 4242",
+         "1651079062.461 4242 4242 E AndroidRuntime: java.lang.IllegalStateException: boom",
+         "1651079062.461 4242 4242 E AndroidRuntime: at org.sudowars.MainMenu.onClick(MainMenu.java:42)",
+         "1651079062.462 4242 4242 I ActivityManager: done",
+         "1651079062.463 4242 4242 I InstruAPK: ;;3;;MainMenu$1;;onClick;;(Landroid/view/View;);;1651079062463"]
+DATA = b"".join(binary_line(line) for line in LINES)
+
+
+def read(data, chunkSize):
+    reader = BinaryLogReader("org.sudowars")
+    lines, methods, faults = [], [], []
+    for i in range(0, len(data), chunkSize):
+        newLines, instrumentationLines, newFaults = reader.parseLines(data[i:i + chunkSize])
+        lines += newLines
+        methods += [newLines[index - newLines[0].index].methodIndex for index in instrumentationLines]
+        faults += newFaults
+    return lines, methods, faults
+
+
+class TestBinaryLogcat(object):
+    def test_records_split_across_chunks(self):
+        decoder = BinaryLogDecoder()
+        records = [decoder.feed(DATA[i:i + 7]) for i in range(0, len(DATA), 7)]
+        assert sum(len(chunk) for chunk in records) == len(LINES)
+        assert decoder.pending == b""
+
+    def test_fields_are_decoded_lazily(self):
+        records = BinaryLogDecoder().feed(DATA)
+        assert records.tag(1) == "InstruAPK"
+        assert isinstance(records.message(1), memoryview)
+        assert records.text(3) == "frame drawn"
+        assert records.priorityLetter(4) == "E"
+        assert records.pid.tolist()[:3] == [1000, 4242, 1500]
+        positions, methods = records.instrumentationMethods()
+        assert positions.tolist() == [1, 9] and methods == ["2", "3"]
+
+    def test_same_lines_as_the_text_reader(self):
+        appLines = [line for line in LINES if line.split()[1] == "4242"]
+        textLines, textInstrumentation, textFaults = LogReader("org.sudowars").parseLines(appLines)
+        for chunkSize in (len(DATA), 64, 5):
+            lines, methods, faults = read(DATA, chunkSize)
+            assert [line.message for line in lines] == [line.message for line in textLines]
+            assert [line.pid for line in lines] == [line.pid for line in textLines]
+            assert methods == ["2", "3"]
+            assert [str(fault) for fault in faults] == [str(fault) for fault in textFaults]
+
+    def test_pid_followed_without_start_proc(self):
+        # the Start proc line was cleared from the buffer before it was read
+        data = b"".join(binary_entry(4300, 4300, 1651079063.0, "I", "InstruAPK", f";;{method};;MainMenu$1;;onClick;;1")
+                        for method in ("4", "5"))
+        lines, methods, _ = read(DATA + data, len(DATA) + len(data))
+        assert methods == ["2", "3", "4", "5"]
+        assert lines[-1].pid == "4300"
+
+    def test_stream_split_at_arbitrary_offsets(self):
+        rng = random.Random(0)
+        data = DATA * 50
+        expected = BinaryLogDecoder().feed(data)
+        for _ in range(20):
+            cuts = sorted(rng.sample(range(1, len(data)), 30))
+            decoder, pids, texts = BinaryLogDecoder(), [], []
+            for start, end in zip([0] + cuts, cuts + [len(data)]):
+                records = decoder.feed(data[start:end])
+                pids += records.pid.tolist()
+                texts += [records.text(i) for i in range(len(records))]
+            assert pids == expected.pid.tolist() and decoder.pending == b"" and decoder.skippedBytes == 0
+            assert texts == [expected.text(i) for i in range(len(expected))]
+
+    def test_decoder_resynchronizes_after_a_gap(self):
+        # bytes lost in the middle of a record, the next records are found again
+        data = DATA * 20
+        decoder = BinaryLogDecoder()
+        records = decoder.feed(data[:1000]), decoder.feed(data[1100:])
+        assert decoder.skippedBytes > 0 and len(decoder.pending) == 0
+        tail = records[1]
+        assert [tail.text(i) for i in range(len(tail) - len(LINES), len(tail))] == \
+            [line.split(": ", 1)[1] for line in LINES]
+        # garbage headers and an empty payload are skipped as well
+        garbage = b"\x00\x00\x1c\x00" + b"\xff" * 40 + binary_entry(1, 1, 1.0, "I", "tag", "")[:28]
+        records = BinaryLogDecoder().feed(garbage + DATA)
+        assert len(records) == len(LINES) and records.tag(0) == "ActivityManager"
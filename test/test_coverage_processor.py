@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import os
+
+import pytest
+
+import numpy as np
+
+from rl_interaction.us_coverage.coverage_processor import CoverageProcessor
+from rl_interaction.us_coverage.method_index import MethodIndex
+
+
+@pytest.fixture(scope="session")
+def method_locations_path():
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir, "rl_interaction",
+                        "org.sudowars-locations.json")
+
+
+@pytest.fixture()
+def coverage_processor(monkeypatch, method_locations_path, tmp_path):
+    monkeypatch.setattr(CoverageProcessor, "clear_logcat", lambda self: None)
+    return CoverageProcessor("emulator-5554", "org.sudowars", method_locations_path, method_index_cache=tmp_path)
+
+
+def instruapk_line(method):
+    return f"1651079062.458 4242 4242 I InstruAPK: ;;{method};;MainMenu$1;;onClick;;(Landroid/view/View;);;1651079062458\n"
+
+
+class TestCoverageProcessor(object):
+    def test_methods_are_indexed(self, coverage_processor):
+        instrumented = coverage_processor.get_number_of_methods_instrumented()
+        assert instrumented == len(coverage_processor.method_ids) > 0
+        assert coverage_processor.get_number_methods_uncalled() == instrumented
+        assert coverage_processor.get_coverage_percentage() == 0
+
+    def test_process_line(self, coverage_processor):
+        coverage_processor.process_line(instruapk_line("2"))
+        coverage_processor.process_line(instruapk_line("2"))
+        coverage_processor.process_line(instruapk_line("3"))
+        called = coverage_processor.get_methods_id_called()
+        assert set(called) == {"2", "3"}
+        assert called["2"] == {"count": 2, "filename": "MainMenu$1", "package": "Controller"}
+        assert "2" not in coverage_processor.get_methods_id_uncalled()
+        assert coverage_processor.get_package_coverage()["Controller"] > 0
+
+    def test_reset_keeps_cumulative_coverage(self, coverage_processor):
+        coverage_processor.process_line(instruapk_line("2"))
+        coverage_processor.reset()
+        assert coverage_processor.get_number_methods_called() == 0
+        assert coverage_processor.get_number_cumulative_methods_called() == 1
+        coverage_processor.clear_cumulative_methods()
+        assert coverage_processor.get_cumulative_coverage() == 0
+
+
+class TestMethodIndex(object):
+    def test_index_is_cached(self, method_locations_path, tmp_path):
+        parsed = MethodIndex.load(method_locations_path, "org.sudowars", tmp_path)
+        cached = MethodIndex.load(method_locations_path, "org.sudowars", tmp_path)
+        assert isinstance(cached.filename_ids, np.memmap)
+        assert list(cached.method_ids) == list(parsed.method_ids)
+        assert list(cached.packages[cached.package_ids]) == list(parsed.packages[parsed.package_ids])
+
+    def test_cache_is_keyed_by_package(self, method_locations_path, tmp_path):
+        assert MethodIndex.cache_path(method_locations_path, "org.sudowars", tmp_path) != \
+               MethodIndex.cache_path(method_locations_path, "org.other", tmp_path)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+from rl_interaction.us_logs.faultIndex import FaultIndex, FaultReport, faultHeader, faultSignature, normalizeLine
+from rl_interaction.us_logs.logReader import Fault, LogLine, LogReader
+
+
+def crash(pid, line, widget, address="0x7f3a21c0"):
+    return [f"1651079062.458 {pid} {pid} E AndroidRuntime: FATAL EXCEPTION: main",
+            f"1651079062.458 {pid} {pid} E AndroidRuntime: Process: org.sudowars, PID: {pid}",
+            f"1651079062.458 {pid} {pid} E AndroidRuntime: java.lang.IllegalStateException: widget {widget} at "
+            f"{address} failed",
+            f"1651079062.458 {pid} {pid} E AndroidRuntime: at org.sudowars.MainMenu$1.onClick(MainMenu.java:{line})",
+            f"1651079062.458 {pid} {pid} E AndroidRuntime: at android.view.View.performClick(View.java:7448)"]
+
+
+def fault(lines):
+    return Fault([LogLine(line, index) for index, line in enumerate(lines)])
+
+
+def report(fault):
+    messages = [line.message for line in [fault.header] + fault.lines]
+    return FaultReport(fault.signature, faultHeader(messages), str(fault))
+
+
+class TestFaultSignature(object):
+    def test_normalization(self):
+        assert normalizeLine("04-27 17:04:22.461  4242  4242 E AndroidRuntime: Process: org.sudowars, PID: 4242") \
+            == "Process: org.sudowars, PID: #"
+        assert normalizeLine("E AndroidRuntime: \tat org.sudowars.MainMenu$1.onClick(MainMenu.java:42)") \
+            == "at org.sudowars.MainMenu$1.onClick(MainMenu.java)"
+        assert normalizeLine("java.lang.NullPointerException: view@1a2b3c4d at 0xdeadbeef") \
+            == "java.lang.NullPointerException: view@# at 0x#"
+
+    def test_same_crash_same_signature(self):
+        first, second = fault(crash(4242, 42, 3)), fault(crash(5151, 57, 12, address="0x1f00"))
+        assert first.signature == second.signature
+        assert first == second and len({first, second}) == 1
+        other = crash(4242, 42, 3)
+        other[2] = other[2].replace("IllegalStateException", "NullPointerException")
+        assert fault(other) != first
+        # the raw dump of the bug handler of the environment gives the same signature for the same crash
+        dump = "".join(line[line.find("E AndroidRuntime:"):] + "\n" for line in crash(4242, 42, 3))
+        assert faultSignature(dump.splitlines()) == faultSignature(crash(6000, 88, 1))
+
+    def test_frames_beyond_the_limit_are_ignored(self):
+        deep = crash(4242, 42, 3) + [f"1651079062.458 4242 4242 E AndroidRuntime: at a.B.c{i}(B.java:1)"
+                                     for i in range(20)]
+        deeper = deep + ["1651079062.458 4242 4242 E AndroidRuntime: at a.B.d(B.java:1)"]
+        assert faultSignature(deep) == faultSignature(deeper)
+
+    def test_back_to_back_crashes_are_distinct_faults(self):
+        # no other line of the app between the crashes, the InstruAPK line of the restarted app ends the last one
+        instruapk = "1651079063.000 5151 5151 I InstruAPK: ;;2;;MainMenu$1;;onClick;;(Landroid/view/View;);;1"
+        lines, _, faults = LogReader("org.sudowars").parseLines(crash(4242, 42, 3) + crash(4242, 42, 3) + [instruapk])
+        assert len(faults) == 2 and faults[0] == faults[1]
+        assert [len(fault.lines) for fault in faults] == [4, 4]
+
+
+class TestFaultIndex(object):
+    def test_hits_shared_across_runs_and_devices(self, tmp_path):
+        path = str(tmp_path / "faults.sqlite")
+        first = fault(crash(4242, 42, 3))
+        device1, device2 = FaultIndex(path), FaultIndex(path)
+        assert device1.record(report(first), "org.sudowars", "emulator-5554", "logs/app/SAC/0") == 1
+        again = fault(crash(5151, 43, 4))
+        assert device2.record(report(again), "org.sudowars", "emulator-5556") == 2
+        other = fault(crash(4242, 42, 3)[:3])
+        device2.record(report(other), "org.sudowars")
+        device1.close()
+        device2.close()
+        # next campaign
+        index = FaultIndex(path)
+        row = index.get(first.signature)
+        assert row["hits"] == 2 and row["firstDevice"] == "emulator-5554" and row["firstRun"] == "logs/app/SAC/0"
+        assert row["firstSeen"] <= row["lastSeen"]
+        assert row["header"] == "java.lang.IllegalStateException: widget 3 at 0x7f3a21c0 failed"
+        assert [fault["signature"] for fault in index.faults("org.sudowars")] == [first.signature, other.signature]
+        assert len(index) == 2 and index.get("unknown") is None
+        index.close()
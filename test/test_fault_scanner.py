@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from rl_interaction.benchmarks.fake_adb import binary_line
+from rl_interaction.us_logs.binaryLogcat import BinaryLogReader
+from rl_interaction.us_logs.faultScanner import FATAL, NATIVE, START, FaultScanner, headerKeyword
+from rl_interaction.us_logs.logReader import FaultType, LogReader
+
+JAVA_CRASH = ["1651079062.461 4242 4242 E AndroidRuntime: FATAL EXCEPTION: main",
+              "1651079062.461 4242 4242 E AndroidRuntime: Process: org.sudowars, PID: 4242",
+              "1651079062.461 4242 4242 E AndroidRuntime: java.lang.IllegalStateException: boom",
+              "1651079062.461 4242 4242 E AndroidRuntime: at org.sudowars.MainMenu.onClick(MainMenu.java:42)",
+              "1651079062.461 4242 4242 E AndroidRuntime: Caused by: java.lang.NullPointerException"]
+NATIVE_CRASH = ["1651079063.000 4242 4242 F libc: Fatal signal 11 (SIGSEGV), code 1 (SEGV_MAPERR), fault addr 0x0 "
+                "in tid 4242 (main), pid 4242 (org.sudowars)",
+                "1651079063.001 4242 4242 F DEBUG: *** *** *** *** *** *** *** *** *** *** *** *** *** *** ***",
+                "1651079063.001 4242 4242 F DEBUG: backtrace:",
+                "1651079063.001 4242 4242 F DEBUG:       #00 pc 000000000004c2b8  /system/lib64/libc.so"]
+PLAIN = "1651079063.100 4242 4242 I ActivityManager: done"
+INSTRUAPK = "1651079063.200 4242 4242 I InstruAPK: ;;3;;ErrorDialog;;onClick;;(Landroid/view/View;);;1651079063200"
+
+
+class TestFaultScanner(object):
+    def test_keywords_flag_their_lines(self):
+        text = "a line\nFATAL EXCEPTION: main\nan Error and an Exception\nFatal signal 6\nlast"
+        starts = np.array([0, 7, 29, 55, 70])
+        flags = FaultScanner.mark(text, starts, FaultScanner("org.sudowars").textKeywords).tolist()
+        assert flags == [0, FATAL | START, START, FATAL | NATIVE, 0]
+
+    def test_java_and_native_blocks(self):
+        lines, instrumentationLines, faults = LogReader("org.sudowars").parseLines(
+            JAVA_CRASH + NATIVE_CRASH + [PLAIN, INSTRUAPK])
+        assert [fault.type for fault in faults] == [FaultType.FATAL_EXCEPTION, FaultType.NATIVE_CRASH]
+        assert [len(fault.lines) for fault in faults] == [4, 3]
+        # the class name of an InstruAPK line is no fault
+        assert instrumentationLines == [len(lines) - 1]
+
+    def test_header_without_colon(self):
+        assert headerKeyword("Tagless error line") is None and headerKeyword("MyTag:") is None
+        assert headerKeyword("AndroidRuntime: FATAL EXCEPTION: main") == "FATAL EXCEPTION"
+        lines, _, faults = LogReader("org.sudowars").parseLines(["1651079062.000 4242 4242 E Tagless", PLAIN])
+        assert len(faults) == 1 and faults[0].header.message == "Tagless"
+
+    def test_fault_cut_between_chunks(self):
+        reader = LogReader("org.sudowars")
+        faults = []
+        for chunk in ([PLAIN] + JAVA_CRASH[:2], JAVA_CRASH[2:], NATIVE_CRASH[:2], NATIVE_CRASH[2:] + [PLAIN]):
+            faults += reader.parseLines(chunk)[2]
+        assert [len(fault.lines) for fault in faults] == [4, 3]
+        assert not reader.faultScanner.reading and reader.pendingFaultLines == []
+
+    def test_binary_records_give_the_same_faults(self):
+        lines = ["1651079062.000 1000 1000 I ActivityManager: Start proc 4242:org.sudowars/u0a100 for activity "
+                 "org.sudowars.MainMenu"] + JAVA_CRASH + NATIVE_CRASH + [PLAIN, INSTRUAPK]
+        _, _, expected = LogReader("org.sudowars").parseLines(lines)
+        _, _, faults = BinaryLogReader("org.sudowars").parseLines(b"".join(binary_line(line) for line in lines))
+        assert [fault.signature for fault in faults] == [fault.signature for fault in expected]
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import sys
+
+from rl_interaction.benchmarks.fake_adb import binary_line
+from rl_interaction.us_coverage.coverage_processor import CoverageProcessor
+from rl_interaction.us_logs.binaryLogcat import BinaryLogDecoder, BinaryLogLine, BinaryLogReader
+from rl_interaction.us_logs.logIngestion import CoverageAccumulator, FaultContext, FaultDetector, LogBatch, \
+    LogIngestionService, RawArchive
+from rl_interaction.us_logs import logReader
+from rl_interaction.us_logs.logReader import LogReader
+
+METHOD_LOCATIONS = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir, "rl_interaction",
+                                "org.sudowars-locations.json")
+CRASH = ["1651079062.458 4242 4242 E AndroidRuntime: FATAL EXCEPTION: main",
+         "1651079062.458 4242 4242 E AndroidRuntime: Process: org.sudowars, PID: 4242",
+         "1651079062.458 4242 4242 E AndroidRuntime: java.lang.IllegalStateException: boom",
+         "1651079062.458 4242 4242 E AndroidRuntime: at org.sudowars.MainMenu.onClick(MainMenu.java:42)",
+         "1651079062.459 4242 4242 I ActivityManager: done"]
+
+
+def instruapk_line(method):
+    return f"1651079062.458 4242 4242 I InstruAPK: ;;{method};;MainMenu$1;;onClick;;(Landroid/view/View;);;1651079062458"
+
+
+class ScriptedReader(LogReader):
+    """
+    LogReader whose reads return scripted batches of lines instead of running logcat.
+    """
+    def __init__(self, batches):
+        super().__init__("org.sudowars", "emulator-5554")
+        self.batches = list(batches)
+
+    def getLogLines(self):
+        return self.batches.pop(0) if self.batches else []
+
+
+class DumpReader(LogReader):
+    """
+    LogReader dumping a text file instead of the device buffer, `logcat -c` empties the file.
+    """
+    def __init__(self, path):
+        super().__init__("org.sudowars", "emulator-5554")
+        self.path = path
+
+    def getLogLines(self):
+        return self.runReadCommand([sys.executable, "-c", f"print(open({str(self.path)!r}).read(), end='')"])
+
+
+class TestLogIngestion(object):
+    def make_service(self, batches, tmp_path, monkeypatch):
+        monkeypatch.setattr(CoverageProcessor, "clear_logcat", lambda self: None)
+        processor = CoverageProcessor("emulator-5554", "org.sudowars", METHOD_LOCATIONS, method_index_cache=tmp_path)
+        bugs = queue.Queue()
+        consumers = [FaultDetector(bugs), CoverageAccumulator(processor), RawArchive(str(tmp_path / "logcat.txt"))]
+        return LogIngestionService(ScriptedReader(batches), consumers), bugs, processor
+
+    def test_lines_are_read_once_and_fanned_out(self, tmp_path, monkeypatch):
+        batches = [[instruapk_line("2"), instruapk_line("3")], CRASH + [instruapk_line("2")]]
+        service, bugs, processor = self.make_service(batches, tmp_path, monkeypatch)
+        for consumer in service.consumers:
+            consumer.start()
+        assert service.sync()
+        assert service.sync()
+        detector, accumulator, archive = service.consumers
+        service.stop()
+        assert processor.get_methods_id_called()["2"]["count"] == 2
+        assert processor.get_number_methods_called() == 2
+        faults = detector.getNewFaults()
+        assert len(faults) == 1
+        assert "FATAL EXCEPTION" in bugs.get_nowait().text
+        assert detector.getNewFaults() == []
+        with open(archive.path) as file:
+            assert len(file.read().splitlines()) == service.readLines == len(batches[0]) + len(batches[1])
+        for consumer in service.consumers:
+            stats = consumer.stats()
+            assert stats["lag"] == 0 and stats["records"] == service.readLines
+
+    def test_background_reading(self, tmp_path, monkeypatch):
+        service, bugs, processor = self.make_service([[instruapk_line("5")]], tmp_path, monkeypatch)
+        service.interval = 0.01
+        service.start()
+        try:
+            assert service.consumers[1].waitIdle(5)
+            assert service.sync()
+        finally:
+            service.stop()
+        assert processor.get_number_methods_called() == 1
+
+    def test_fault_context(self, tmp_path):
+        before = [instruapk_line(str(i)) for i in range(5)]
+        context = FaultContext(str(tmp_path / "faults"), capacity=100, contextLines=3)
+        service = LogIngestionService(ScriptedReader([before, CRASH, CRASH]), [context])
+        context.start()
+        for _ in range(3):
+            service.poll()
+        assert service.sync()
+        context.stop()
+        files = list((tmp_path / "faults").iterdir())
+        # the same crash is written once, with the lines logged before it
+        assert len(files) == 1 and files[0].name == f"{context.written.pop()}.log"
+        assert files[0].read_text().splitlines() == before[-3:] + CRASH[:4]
+
+    def test_binary_records(self, tmp_path):
+        reader = BinaryLogReader("org.sudowars")
+        reader.trackedPids = {4242}
+        other = "1651079062.458 1000 1000 I system: other process"
+        lines = [instruapk_line(str(i)) for i in range(5)] + [other] + CRASH
+        logLines, instrumentationLines, faults = reader.parseLines(b"".join(binary_line(line) for line in lines))
+        raws = [line.rawLine for line in logLines]
+        archive = RawArchive(str(tmp_path / "logcat.bin"), binary=True)
+        context = FaultContext(str(tmp_path / "faults"), capacity=100, contextLines=3)
+        for consumer in (archive, context):
+            consumer.consume(LogBatch(logLines, [logLines[i] for i in instrumentationLines], faults))
+        archive.close()
+        # the records of the app are archived as read, without the one of the other process
+        records = BinaryLogDecoder().feed((tmp_path / "logcat.bin").read_bytes())
+        assert [BinaryLogLine(records, i, i).rawLine for i in range(len(records))] == raws
+        files = list((tmp_path / "faults").iterdir())
+        assert len(files) == 1 and files[0].read_text().splitlines() == raws[2:9]
+
+    def test_clear_resets_the_dump_position(self, tmp_path, monkeypatch):
+        path = tmp_path / "buffer.txt"
+        monkeypatch.setattr(logReader, "adb_client", lambda device: type("Device", (), {
+            "check_shell": staticmethod(lambda command: path.write_text(""))}))
+        path.write_text("".join(line + "\n" for line in [instruapk_line(str(i)) for i in range(10)]))
+        archive = RawArchive(str(tmp_path / "logcat.txt"))
+        service = LogIngestionService(DumpReader(path), [archive])
+        archive.start()
+        service.clearLog()
+        assert service.poll() == 0
+        # the new buffer grows past the position of the old one, multi-byte characters included
+        after = [instruapk_line(f"{i}\u00e9\u00e9") for i in range(20)]
+        path.write_text("".join(line + "\n" for line in after))
+        assert service.sync()
+        archive.stop()
+        assert (tmp_path / "logcat.txt").read_text().splitlines()[10:] == after
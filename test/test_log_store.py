@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from rl_interaction.benchmarks.fake_adb import binary_line
+from rl_interaction.us_logs.binaryLogcat import BinaryLogLine, BinaryLogReader
+from rl_interaction.us_logs.logReader import InstrumentationLine, LogLine, LogReader
+from rl_interaction.us_logs.logStore import LogSegment, LogStore
+
+CRASH = ["1651079062.458 4242 4242 E AndroidRuntime: FATAL EXCEPTION: main",
+         "1651079062.458 4242 4242 E AndroidRuntime: Process: org.sudowars, PID: 4242",
+         "1651079062.458 4242 4242 E AndroidRuntime: at org.sudowars.MainMenu.onClick(MainMenu.java:42)",
+         "1651079062.459 4242 4242 I ActivityManager: done"]
+
+
+def instruapk_line(method):
+    return f"1651079062.458 4242 4242 I InstruAPK: ;;{method};;MainMenu$1;;onClick;;(Landroid/view/View;);;1651079062458"
+
+
+def plain_line(i):
+    return f"1651079062.{i % 1000:03d} 4242 4243 D OpenGLRenderer: frame {i}  "
+
+
+class ScriptedReader(LogReader):
+    def __init__(self, batches, maxStoredLines=100000):
+        super().__init__("org.sudowars", "emulator-5554", maxStoredLines=maxStoredLines)
+        self.batches = list(batches)
+
+    def getLogLines(self):
+        return self.batches.pop(0) if self.batches else []
+
+
+class TestLogStore(object):
+    def test_lines_are_rebuilt_from_the_columns(self):
+        lines = [plain_line(1), instruapk_line("7")] + CRASH
+        reader = ScriptedReader([lines])
+        reader.readLog()
+        stored = list(reader.rawLines)
+        assert [line.rawLine for line in stored] == lines
+        assert [line.index for line in stored] == list(range(len(lines)))
+        assert isinstance(stored[1], InstrumentationLine) and stored[1].methodIndex == "7"
+        assert stored[0].message == LogLine(lines[0], 0).message
+        assert reader.instrumentationLines == [1]
+        stats = reader.getMemoryUsage()
+        assert (stats["instrumentationLines"], stats["faultLines"], stats["otherLines"]) == (1, 3, 2)
+        assert stats["bytes"] > 0
+
+    def test_clear_keeps_the_coverage_lines(self):
+        reader = ScriptedReader([[instruapk_line("1"), plain_line(1)] + CRASH, [instruapk_line("2"), plain_line(2)]])
+        reader.readLog()
+        assert [line.methodIndex for line in reader.getNewInstrumentationLines()] == ["1"]
+        reader.clearLog(clearPhoneLogcat=False)
+        assert [line.methodIndex for line in reader.rawLines] == ["1"]
+        reader.readLog()
+        assert [line.methodIndex for line in reader.getNewInstrumentationLines()] == ["2"]
+        assert [line.methodIndex for line in reader.getInstrumentationLines()] == ["1", "2"]
+        reader.clearLog(clearPhoneLogcat=False, clearInstrumentation=True)
+        assert len(reader.rawLines) == 0 and reader.getNewInstrumentationLines() == []
+        # the indices go on after a clear
+        reader.batches.append([instruapk_line("3")])
+        reader.readLog()
+        assert [line.index for line in reader.getNewInstrumentationLines()] == [len(CRASH) + 4]
+
+    def test_ring_buffer_of_the_other_lines(self):
+        store = LogStore(LogLine, InstrumentationLine, capacity=10, blockSize=4)
+        logLines = [LogLine(plain_line(i), i) for i in range(50)]
+        store.extend(logLines, [], [])
+        assert 10 <= len(store.others) < 14
+        assert [line.index for line in store] == list(range(50 - len(store.others), 50))
+        assert store.stats()["droppedLines"] == 50 - len(store.others)
+        assert list(store.others.column("pid")) == [4242] * len(store.others)
+
+    def test_message_offsets(self):
+        lines = [plain_line(1), "1651079062.458  4242 4242  W Sudowars:  d\u00e9j\u00e0 vu", "1651079062.458 4242"]
+        segment = LogSegment(LogLine)
+        segment.extend([LogLine(line, i) for i, line in enumerate(lines)])
+        block = segment.blocks[0]
+        assert [block.rawLine(i) for i in range(len(lines))] == lines
+        assert [block.message(i) for i in range(len(lines))] == ["OpenGLRenderer: frame 1  ",
+                                                                 "Sudowars:  d\u00e9j\u00e0 vu", ""]
+        assert list(segment.column("tid")) == [4243, 4242, -1]
+        assert list(segment.column("time"))[:2] == [1651079062.001, 1651079062.458]
+        assert bytes(segment.column("tag")) == b"DWu"
+
+    def test_records_are_stored_without_decoding(self, monkeypatch):
+        lines = [plain_line(i) for i in range(5)] + CRASH + [instruapk_line("7"), plain_line(9)]
+        reader = BinaryLogReader("org.sudowars")
+        reader.trackedPids = {4242}
+        logLines = reader.parseLines(b"".join(binary_line(line) for line in lines))[0]
+        expected = [line.rawLine for line in logLines]
+        monkeypatch.setattr(BinaryLogLine, "message", property(lambda self: pytest.fail("message decoded")))
+        segment = LogSegment(LogLine, capacity=8, blockSize=4)
+        segment.extend([LogLine(lines[0], -1)] + logLines)
+        assert [line.rawLine for line in segment] == expected[-len(segment):]
+        assert list(segment.rawLines(8, 9)) == expected[8:10]
+        assert segment.blocks[-1].message(len(segment.blocks[-1]) - 1) == "OpenGLRenderer: frame 9  "
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import sys
+import textwrap
+
+from rl_interaction.us_logs.logReader import LogReader
+from rl_interaction.us_logs.logcatStream import LogcatStream
+
+# prints the lines of a file and exits, from the timestamp given with -T as logcat does
+FAKE_LOGCAT = textwrap.dedent("""
+    import sys
+    since = float(sys.argv[sys.argv.index("-T") + 1]) if "-T" in sys.argv else None
+    for line in open(sys.argv[1]).read().splitlines():
+        if since is None or float(line.split()[0]) >= since:
+            print(line, flush=True)
+""")
+
+
+def app_line(timestamp, message, pid=4242):
+    return f"{timestamp:.3f} {pid} {pid} I Sudowars: {message}"
+
+
+def fake_logcat(tmp_path, lines):
+    script, log = tmp_path / "logcat.py", tmp_path / "logcat.txt"
+    script.write_text(FAKE_LOGCAT)
+    log.write_text("\n".join(lines) + "\n")
+    return [sys.executable, str(script), str(log)]
+
+
+def read_all(stream):
+    stream.start()
+    stream.reader.join(10)
+    return stream.readLines()
+
+
+class TestLogcatStream(object):
+    def test_follows_the_app_process(self, tmp_path):
+        lines = [app_line(1.0, "before the app"),
+                 "1.100 1000 1000 I ActivityManager: Start proc 4242:org.sudowars/u0a100 for activity",
+                 app_line(1.2, "started"), app_line(1.3, "system", pid=1000),
+                 "1.400 4343 4343 I InstruAPK: ;;3;;MainMenu;;onClick;;(Landroid/view/View;);;1400",
+                 app_line(1.5, "crash of the dead process")]
+        stream = LogcatStream(fake_logcat(tmp_path, lines), "org.sudowars")
+        assert read_all(stream) == [lines[2], lines[4], lines[5]]
+        assert stream.currentPid == 4343 and stream.trackedPids == {"4242", "4343"}
+
+    def test_drops_the_oldest_lines(self, tmp_path):
+        lines = [app_line(1.0 + i / 10, f"line {i}") for i in range(10)]
+        stream = LogcatStream(fake_logcat(tmp_path, lines), "org.sudowars", 4242, maxQueuedLines=3)
+        assert read_all(stream) == lines[-3:]
+        assert stream.droppedLines == 7
+
+    def test_restart_resumes_after_the_last_line(self, tmp_path, monkeypatch):
+        # two lines share the last timestamp, `-T` gives them again
+        lines = [app_line(1.0, "first"), app_line(2.0, "second"), app_line(2.0, "third")]
+        command = fake_logcat(tmp_path, lines)
+        reader = LogReader("org.sudowars", streaming=True, streamingTimeout=0.5)
+        monkeypatch.setattr(reader, "logcatCommand", lambda: list(command))
+        monkeypatch.setattr(reader, "getPIDApk", lambda packageName: 4242)
+        read = reader.getStreamedLogLines()
+        reader.stream.process.wait(10)
+        read += reader.getStreamedLogLines()
+        assert read == lines
+        assert reader.stream.command[-2:] == ["-T", "2.000"]
+        # the stream exits again, the new lines come once
+        (tmp_path / "logcat.txt").write_text("\n".join(lines + [app_line(2.0, "fourth"), app_line(3.0, "fifth")]))
+        reader.stream.process.wait(10)
+        read = []
+        for _ in range(3):
+            read += reader.getStreamedLogLines()
+            reader.stream.process.wait(10)
+        reader.closeStream()
+        assert read == [app_line(2.0, "fourth"), app_line(3.0, "fifth")]
+        assert reader.droppedLines == 0 and reader.streamTimestamp == 3.0
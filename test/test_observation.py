@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from rl_interaction.utils.observation import ObservationEncoder
+
+
+class TestObservationEncoder(object):
+    def test_one_hot_encoding(self):
+        widget_list = []
+        encoder = ObservationEncoder(["a.Main", "a.Settings"], widget_list, observation_space=10)
+        encoder.add_widget("ok")
+        encoder.add_widget("cancel")
+        observation = encoder.encode("a.Settings", ["cancel", "unknown"])
+        assert widget_list == ["ok", "cancel"]
+        assert observation.dtype == np.int32
+        assert list(np.flatnonzero(observation)) == [1, 3]
+        assert list(encoder.active) == [1, 3]
+
+    def test_buffer_is_reused(self):
+        encoder = ObservationEncoder(["a.Main"], [], observation_space=5)
+        encoder.add_widget("ok")
+        first = encoder.encode("a.Main", ["ok"])
+        second = encoder.encode("other", [])
+        assert first is second
+        assert not second.any()
+
+    def test_hash_overflow(self):
+        encoder = ObservationEncoder(["a.Main"], [], observation_space=3)
+        for identifier in ["w0", "w1", "w2", "w3"]:
+            encoder.add_widget(identifier)
+        assert encoder.overflowed_widgets == 2
+        observation = encoder.encode("a.Main", ["w2", "w3"])
+        assert observation[0] == 1
+        assert 1 <= observation.sum() <= 3
+        assert len(observation) == 3
+
+    def test_drop_overflow(self):
+        encoder = ObservationEncoder([], [], observation_space=1, overflow="drop")
+        encoder.add_widget("w0")
+        encoder.add_widget("w1")
+        assert list(encoder.indices(None, ["w0", "w1"])) == [0]
+
+    def test_invalid_overflow_policy(self):
+        with pytest.raises(ValueError):
+            ObservationEncoder([], [], overflow="wrap")
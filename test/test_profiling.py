@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import json
+import time
+
+from rl_interaction.utils.profiling import StepProfiler, trace_commands
+
+
+class Executor(object):
+    def execute(self, command, params):
+        return {"value": command}
+
+
+class Driver(object):
+    def __init__(self):
+        self.command_executor = Executor()
+
+
+class TestStepProfiler(object):
+    def test_episode_summary(self, tmp_path):
+        path = tmp_path / "step_profile.jsonl"
+        profiler = StepProfiler(str(path))
+        driver = trace_commands(Driver(), profiler)
+        for _ in range(3):
+            profiler.start_step()
+            with profiler.phase("sleep"):
+                time.sleep(0.001)
+            driver.command_executor.execute("getPageSource", {})
+            driver.command_executor.execute("clickElement", {})
+            profiler.end_step()
+        summary = profiler.end_episode(0)
+        assert summary["steps"] == 3
+        assert summary["commands_per_step"] == 2
+        assert summary["phases"]["sleep"]["count"] == 3
+        assert summary["phases"]["sleep"]["p50"] >= 1.0
+        assert summary["commands"]["getPageSource"]["count"] == 3
+        assert json.loads(path.read_text()) == summary
+        # timings are cleared between episodes
+        assert profiler.end_episode(1) is None
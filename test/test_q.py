@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from rl_interaction.utils.q import QTable
+
+
+class TestQTable(object):
+    shape = (6, 4, 2)
+
+    def test_matches_dense_table(self):
+        rng = np.random.default_rng(0)
+        table = QTable(self.shape)
+        dense = {}
+        states = [np.eye(20, dtype=np.int64)[i] + np.eye(20, dtype=np.int64)[(i + 3) % 20] for i in range(5)]
+        for _ in range(300):
+            state = rng.integers(len(states))
+            action = tuple(int(rng.integers(size)) for size in self.shape)
+            value = float(rng.choice([-1.0, 0.0, 0.5, rng.normal()]))
+            table.set(states[state], action, value)
+            dense.setdefault(state, np.zeros(self.shape, dtype=np.float32))[action] = value
+            reference = dense[state]
+            assert table.max(states[state]) == reference.max()
+            expected = np.unravel_index(np.argmax(reference), self.shape)
+            assert tuple(table.argmax(states[state])) == tuple(expected)
+            assert table.get(states[state], action) == np.float32(value)
+        assert len(table) == len(states)
+        # every cell visited, all negative: no unvisited 0 is left
+        small = QTable((1, 1, 2))
+        small.set(states[0], (0, 0, 0), -1.0)
+        small.set(states[0], (0, 0, 1), -1.0)
+        assert small.max(states[0]) == -1.0
+        assert tuple(small.argmax(states[0])) == (0, 0, 0)
+        small.set(states[0], (0, 0, 0), -2.0)
+        assert tuple(small.argmax(states[0])) == (0, 0, 1)
+
+    def test_unknown_state(self):
+        table = QTable(self.shape)
+        obs = np.zeros(20)
+        assert table.max(obs) == 0.0
+        assert tuple(table.argmax(obs)) == (0, 0, 0)
+        assert obs not in table
+
+    def test_memory_cap_evicts_least_recent(self):
+        table = QTable(self.shape, max_memory_mb=0.001)
+        states = [np.eye(50, dtype=np.int64)[i] for i in range(10)]
+        for state in states:
+            table.set(state, (1, 1, 1), 1.0)
+            # the first state stays the most recent one
+            table.get(states[0], (1, 1, 1))
+        assert table.evictions > 0
+        assert table.nbytes <= 1024 * 1024 * 0.001
+        assert states[0] in table
+        assert states[-1] in table
+        assert states[1] not in table
+
+    def test_save_and_reload(self, tmp_path):
+        table = QTable(self.shape)
+        obs = np.eye(20, dtype=np.int64)[2]
+        table.set(obs, (5, 3, 1), 2.5)
+        table.set(obs, (1, 0, 0), 1.5)
+        table.save(str(tmp_path / "app.npz"))
+        reloaded = QTable(self.shape)
+        reloaded.load(str(tmp_path / "app.npz"))
+        assert reloaded.get(obs, (5, 3, 1)) == 2.5
+        assert tuple(reloaded.argmax(obs)) == (5, 3, 1)
+        # the action space shrank: cells out of it are dropped, the others keep their value
+        smaller = QTable((4, 4, 2))
+        smaller.load(str(tmp_path / "app.npz"))
+        assert smaller.get(obs, (1, 0, 0)) == 1.5
+        assert smaller.max(obs) == 1.5
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import pytest
+
+from rl_interaction.utils.utils import wait_for
+
+
+class TestReadiness(object):
+    def test_wait_for_returns_once_ready(self):
+        answers = iter([False, False, True])
+        elapsed = wait_for(lambda: next(answers), timeout=5, description="probe", interval=0.001)
+        assert elapsed < 1
+
+    def test_wait_for_times_out(self):
+        with pytest.raises(TimeoutError):
+            wait_for(lambda: False, timeout=0.05, description="probe", interval=0.01)
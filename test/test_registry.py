@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from rl_interaction.algorithms.registry import algorithm_names, get_algorithm_class, preload_modules
+
+RL_INTERACTION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rl_interaction")
+
+
+class TestAlgorithmRegistry(object):
+    def test_unknown_algorithm(self):
+        assert algorithm_names() == ["random", "Q", "SAC", "DDPG"]
+        with pytest.raises(ValueError):
+            get_algorithm_class("PPO")
+
+    def test_random_does_not_import_torch(self):
+        code = "import sys; from algorithms.registry import get_algorithm_class; " \
+               "print(get_algorithm_class('random').__name__, 'torch' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], cwd=RL_INTERACTION, stdout=subprocess.PIPE,
+                                check=True).stdout.decode().split()
+        assert output == ["RandomAlgorithm", "False"]
+
+    def test_preload_modules(self):
+        modules = preload_modules(["SAC"])
+        assert modules[-1] == "algorithms.SACExploration"
+        assert "test_application" in modules
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from gym import spaces
+
+from rl_interaction.utils.replay_buffer import PackedReplayBuffer
+
+
+class TestPackedReplayBuffer(object):
+    def make_buffer(self, size, obs_dim, n_envs=1):
+        observation_space = spaces.Box(low=0, high=1, shape=(obs_dim + 1,), dtype=np.float32)
+        action_space = spaces.Box(low=0, high=1, shape=(3,), dtype=np.float32)
+        return PackedReplayBuffer(size * n_envs, observation_space, action_space, n_envs=n_envs)
+
+    def test_samples_match_added_transitions(self):
+        rng = np.random.default_rng(0)
+        # not a multiple of 8, the padding bits must not leak into the observation
+        buffer = self.make_buffer(10, 37, n_envs=2)
+        obs = (rng.random((11, 2, 38)) < 0.2).astype(np.float32)
+        obs[:, :, -1] = rng.random((11, 2))
+        for i in range(10):
+            buffer.add(obs[i], obs[i + 1], np.full((2, 3), i, dtype=np.float32), np.array([i, 100 + i]),
+                       np.zeros(2), [{}, {}])
+        assert buffer.full
+        samples = buffer.sample(64)
+        steps = samples.actions[:, 0].numpy().astype(int)
+        observations = samples.observations.numpy()
+        next_observations = samples.next_observations.numpy()
+        rewards = samples.rewards.numpy()[:, 0]
+        for j, step in enumerate(steps):
+            env = 0 if rewards[j] == step else 1
+            np.testing.assert_array_equal(observations[j], obs[step, env])
+            np.testing.assert_array_equal(next_observations[j], obs[step + 1, env])
+
+    def test_memory_per_transition(self):
+        buffer = self.make_buffer(100, 2000)
+        # 2 x 250 packed bytes, 2 time features, 3 actions, reward, done, timeout
+        assert buffer.bytes_per_transition() == 2 * 250 + 2 * 4 + 3 * 4 + 3 * 4
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import threading
+
+from rl_interaction.utils.scheduler import CampaignJournal, CampaignScheduler, Unit
+
+
+class TestCampaignScheduler(object):
+    def test_failed_units_move_to_another_device(self, tmp_path):
+        runs = []
+        lock = threading.Lock()
+
+        def run_unit(device, unit):
+            with lock:
+                runs.append((device, unit))
+            # the broken device fails everything
+            return device != "broken"
+
+        units = [Unit(f"app{i}.apk", 0) for i in range(6)]
+        scheduler = CampaignScheduler(units, ["broken", "healthy"], run_unit,
+                                      CampaignJournal(str(tmp_path / "journal.jsonl")), max_retries=2,
+                                      max_device_failures=2)
+        done, abandoned = scheduler.run()
+        assert done == set(units)
+        assert not abandoned
+        assert len([run for run in runs if run[0] == "broken"]) <= 2
+
+    def test_resume_skips_done_units(self, tmp_path):
+        journal = CampaignJournal(str(tmp_path / "journal.jsonl"))
+        units = [Unit("a.apk", 0), Unit("a.apk", 1), Unit("b.apk", 0)]
+        journal.write("done", units[0], "emulator")
+        journal.write("started", units[1], "emulator")
+        ran = []
+        scheduler = CampaignScheduler(units, ["emulator"], lambda device, unit: ran.append(unit) or True, journal)
+        scheduler.run()
+        assert ran == units[1:]
+        assert CampaignJournal(journal.path).load()[0] == set(units)
+
+    def test_abandon_after_retry_budget(self, tmp_path):
+        attempts = []
+        scheduler = CampaignScheduler([Unit("a.apk", 0)], ["d1", "d2"],
+                                      lambda device, unit: attempts.append(device) and False,
+                                      CampaignJournal(str(tmp_path / "journal.jsonl")), max_retries=2)
+        done, abandoned = scheduler.run()
+        assert abandoned == {Unit("a.apk", 0)}
+        assert len(attempts) == 3
+        # the retry went to the device that had not failed yet
+        assert attempts[0] != attempts[1]
+
+    def test_ordered_cycles(self, tmp_path):
+        order = []
+        units = [Unit("a.apk", 0), Unit("a.apk", 1), Unit("a.apk", 2)]
+        scheduler = CampaignScheduler(units, ["d1", "d2", "d3"], lambda device, unit: order.append(unit) or True,
+                                      CampaignJournal(str(tmp_path / "journal.jsonl")), ordered_cycles=True)
+        scheduler.run()
+        assert order == units
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+from rl_interaction.utils.screen_cache import ScreenCache, ScreenState, canonical_hash
+
+PAGE = '<hierarchy><node class="a" checked="false" enabled="true" text="x"/><node enabled="false"/></hierarchy>'
+
+
+class TestScreenCache(object):
+    def test_hash_ignores_volatile_attributes(self):
+        toggled = PAGE.replace('checked="false"', 'checked="true"').replace('enabled="false"', 'enabled="true"')
+        assert canonical_hash(PAGE) == canonical_hash(toggled)
+        assert canonical_hash(PAGE) != canonical_hash(PAGE.replace('text="x"', 'text="y"'))
+
+    def test_lru_eviction(self):
+        cache = ScreenCache(capacity=2)
+        for key in ("a", "b"):
+            cache.put(key, ScreenState("act", [], np.empty(0, dtype=np.int64), 30))
+        assert cache.get("a") is not None
+        cache.put("c", ScreenState("act", [], np.empty(0, dtype=np.int64), 30))
+        # b was the least recently used
+        assert cache.get("b") is None
+        assert cache.evictions == 1
+        assert cache.hits == 1 and cache.misses == 1
+
+    def test_views_do_not_share_web_elements(self):
+        screen = ScreenState("act", [{"identifier": "id", "view": object()}], np.array([0]), 1)
+        views = screen.views()
+        assert views[0]["view"] is None
+        assert views[0]["identifier"] == "id"
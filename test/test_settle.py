@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+from rl_interaction.utils.screen_cache import canonical_hash
+from rl_interaction.utils.settle import AdaptiveSettle
+
+
+class TestAdaptiveSettle(object):
+    def test_waits_until_snapshots_match(self):
+        snapshots = iter(["a", "b", "c", "c", "c"])
+        settle = AdaptiveSettle(min_wait=0.0, poll_interval=0.001)
+        snapshot, elapsed, settled = settle.wait(lambda: next(snapshots))
+        assert settled
+        assert snapshot == "c"
+        assert settle.polls == 4
+
+    def test_volatile_attributes_do_not_hold_the_wait(self):
+        # only the state of the checkbox changes, the screen cache sees one screen
+        pages = iter([f'<hierarchy><node checked="{state}" /><node text="Next" /></hierarchy>'
+                      for state in ["true", "false"] * 5])
+        settle = AdaptiveSettle(min_wait=0.0, poll_interval=0.001)
+        page, _, settled = settle.wait(lambda: next(pages), key=canonical_hash)
+        assert settled and settle.polls == 2
+        assert page == '<hierarchy><node checked="false" /><node text="Next" /></hierarchy>'
+
+    def test_deadline_bounds_changing_screens(self):
+        counter = iter(range(10 ** 6))
+        settle = AdaptiveSettle(min_wait=0.0, poll_interval=0.001, max_interval=0.005, deadline=0.05)
+        _, elapsed, settled = settle.wait(lambda: next(counter))
+        assert not settled
+        assert elapsed < 0.5
+        assert settle.timeouts == 1
+
+    def test_deadline_is_learned(self):
+        settle = AdaptiveSettle(deadline=1.0, min_deadline=0.2, margin=2.0)
+        for _ in range(10):
+            settle.observe(0.05, True)
+        assert settle.deadline == 0.2
+        for _ in range(10):
+            settle.observe(0.5, True)
+        assert abs(settle.deadline - 1.0) < 1e-9
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pytest
+
+from rl_interaction.simulated_application_env import SimulatedApplicationEnv, action_key
+from rl_interaction.utils.session_recorder import SessionRecorder
+
+MAIN = "a.Main"
+SETTINGS = "a.Settings"
+
+
+def widget(identifier, class_name="android.widget.Button", long_clickable="false"):
+    return {"identifier": identifier, "class_name": class_name, "clickable": "true", "scrollable": "false",
+            "long-clickable": long_clickable, "bounds": [0, 0, 10, 10]}
+
+
+@pytest.fixture
+def session_path(tmp_path):
+    path = tmp_path / "session.jsonl"
+    recorder = SessionRecorder(str(path))
+    recorder.record_session(package="a", activities=[MAIN, SETTINGS], observation_space=20, action_space=30,
+                            shift=0, intent_action=-1, intents=0, strings=5, max_episode_len=4)
+    recorder.record_state("main", MAIN, [widget("settings"), widget("name", "android.widget.EditText")])
+    recorder.record_reset("main")
+    recorder.record_state("settings", SETTINGS, [widget("back"), widget("help")])
+    recorder.record_transition("main", [0, 3, 1], "settings", SETTINGS, 1000.0, False, False, False)
+    recorder.record_transition("settings", [0, 0, 0], "main", MAIN, 0.0, False, False, False)
+    recorder.record_transition("main", [1, 2, 0], "main", MAIN, 1000.0, False, True, False)
+    recorder.close()
+    return str(path)
+
+
+class TestSimulatedApplicationEnv(object):
+    def test_action_key_ignores_unused_components(self):
+        session = {"shift": 0, "intent_action": -1, "intents": 0}
+        widgets = [widget("ok"), widget("name", "android.widget.EditText"), widget("list", long_clickable="true")]
+        assert action_key(widgets, session, [0, 4, 1]) == (0, 0, 0)
+        assert action_key(widgets, session, [1, 4, 1]) == (1, 4, 0)
+        assert action_key(widgets, session, [2, 4, 1]) == (2, 0, 1)
+        assert action_key([], session, [7, 4, 1]) == (7, 4, 0)
+
+    def test_replays_recorded_transitions(self, session_path):
+        env = SimulatedApplicationEnv([session_path], seed=0)
+        observation = env.reset()
+        assert list(np.flatnonzero(observation)) == [0, 2, 3]
+        assert env.get_action_space()[0] == 2
+
+        observation, reward, done, _ = env.step(np.array([0.4, 1.0, 0.0]))
+        assert env.current_activity == SETTINGS
+        assert list(np.flatnonzero(observation)) == [1, 4, 5]
+        assert reward[0] == 1000.0 and not done
+
+        # out of the action space of the screen
+        _, reward, done, _ = env.step(np.array([2, 0, 0]))
+        assert reward[0] == -50.0 and env.timesteps == 1
+
+        _, reward, _, _ = env.step(np.array([0, 0, 0]))
+        assert env.current_activity == MAIN
+        assert reward[0] == 0.0
+
+        _, reward, _, _ = env.step(np.array([1, 2, 0]))
+        assert reward[0] == 1000.0
+
+        # episode length of the recording
+        _, _, done, _ = env.step(np.array([1, 0, 0]))
+        assert done
+
+    def test_fallback_policies(self, session_path):
+        env = SimulatedApplicationEnv([session_path], fallback="back")
+        env.reset()
+        env.step(np.array([0, 0, 0]))
+        env.step(np.array([1, 0, 0]))
+        assert env.state == "main"
+        assert env.unseen_transitions == 1
+
+        env = SimulatedApplicationEnv([session_path], fallback="reset")
+        env.reset()
+        _, reward, done, _ = env.step(np.array([1, 4, 0]))
+        assert done and reward[0] == -1.0
+
+        with pytest.raises(ValueError):
+            SimulatedApplicationEnv([session_path], fallback="teleport")
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+
+from rl_interaction.utils.observation import ObservationEncoder
+from rl_interaction.utils.vec_env import DeviceSpec, merge_device_bookkeeping, parse_device_specs
+
+WIDGETS = [f"org.sudowars:id/button{i}" for i in range(40)]
+
+
+def worker_slots(order):
+    # a device worker discovering the widgets in its own order
+    encoder = ObservationEncoder(["a.Main", "a.Settings"], [], observation_space=64, stable_slots=True)
+    for identifier in order:
+        encoder.add_widget(identifier)
+    return {identifier: encoder.widget_slot(identifier) for identifier in WIDGETS}
+
+
+class FakeVecEnv(object):
+    def __init__(self, workers):
+        self.workers = workers
+
+    def get_attr(self, name):
+        return [worker[name] for worker in self.workers]
+
+
+class TestVecEnv(object):
+    def test_parse_device_specs(self):
+        specs = parse_device_specs("emulator-5554,4723,5554,Pixel_4 emulator-5556,4725,5556,Nexus_5X")
+        assert specs == [DeviceSpec("emulator-5554", 4723, "5554", "Pixel 4"),
+                         DeviceSpec("emulator-5556", 4725, "5556", "Nexus 5X")]
+        assert parse_device_specs("") == []
+
+    def test_workers_share_the_widget_slots(self):
+        with multiprocessing.get_context("spawn").Pool(2) as pool:
+            first, second = pool.map(worker_slots, [WIDGETS, WIDGETS[::-1]])
+        assert first == second
+        assert all(2 <= slot < 64 for slot in first.values())
+
+    def test_bookkeeping_merged_into_the_parent(self):
+        widget_list, coverage_dict, bug_set = ["ok"], {"a.Main": {"visited": True, "ok": False}}, {"sig1"}
+        visited_activities, clicked_buttons, number_bugs = [], [], []
+        workers = [dict(widget_list=["ok", "cancel"], coverage_dict={"a.Main": {"visited": True, "ok": True}},
+                        bug_set={"sig1", "sig2"}, visited_activities=[1], clicked_buttons=[2], number_bugs=[2]),
+                   dict(widget_list=["menu"], coverage_dict={"a.Settings": {"visited": True}}, bug_set=set(),
+                        visited_activities=[2], clicked_buttons=[1], number_bugs=[0])]
+        merge_device_bookkeeping(FakeVecEnv(workers), widget_list, coverage_dict, bug_set, visited_activities,
+                                 clicked_buttons, number_bugs)
+        assert widget_list == ["ok", "cancel", "menu"]
+        assert coverage_dict == {"a.Main": {"visited": True, "ok": True}, "a.Settings": {"visited": True}}
+        assert bug_set == {"sig1", "sig2"}
+        assert (visited_activities, clicked_buttons, number_bugs) == ([1, 2], [2, 1], [2, 0])